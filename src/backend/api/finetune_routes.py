@@ -1,20 +1,49 @@
 import json
-import time
+import os
 import uuid
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from schemas.models import (
     AdaptFineTuningRequest,
+    EvaluationRequest,
+    ExportRequest,
     FineTuningRequest,
     GGUFSaveRequest,
     GoalTrainingRequest,
+    HyperparameterSearchRequest,
     SaveModelRequest,
 )
-from services.save import save_gguf_model, save_model
+from services.checkpointing import (
+    RESUMABLE_STATUSES,
+    latest_checkpoint,
+    list_checkpoints,
+    load_task_spec,
+    persist_task_status,
+    recover_interrupted_tasks,
+)
+from services.distributed_training import (
+    distributed_spec_path,
+    run_distributed,
+    torchrun_command,
+)
+from services.hparam_search import (
+    SEARCH_SPACE,
+    run_hyperparameter_search,
+    trial_step_budget,
+)
+from services.model_pool import base_model_pool
+from services.multi_lora import adapter_base_model
+from services.offline_evaluation import (
+    OUTPUT_FORMATS,
+    load_evaluation_spec,
+    load_results,
+    run_offline_evaluation,
+    save_evaluation_spec,
+)
+from services.save import run_export, validate_quant_methods
 from services.training import (
     AVAILABLE_MODELS,
-    get_tensorboard_logs,
     retreive_captioned_dataset,
     task_status,
     train_adapt_model,
@@ -22,91 +51,271 @@ from services.training import (
     train_model_with_goal,
     trained_models,
 )
+from services.status_hub import status_hub
+from services.tensorboard_reader import get_tensorboard_logs
+from services.training_metrics import get_step_telemetry
+from services.training_scheduler import training_scheduler
+from services.training_workers import training_worker_pool
+from utils import config_loader
+from utils.downsampling import DEFAULT_POINTS, downsample_log_history
+from utils.memory_estimates import (
+    estimate_export_memory_gb,
+    estimate_inference_memory_gb,
+)
+from utils.run_registry import compare_runs, export_legacy_log, list_runs
 
 router = APIRouter()
 
-adaptive_configs = {
-    "unsloth/Llama-3.2-11B-Vision-bnb-4bit": {
-        "batch_size": 4,
-        "learning_rate": 2e-5,
-        "epochs": 10,
-    },
-    "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit": {
-        "batch_size": 8,
-        "learning_rate": 3e-4,
-        "epochs": 8,
-    },
-    "unsloth/Pixtral-12B-2409": {
-        "batch_size": 4,
-        "learning_rate": 2e-5,
-        "epochs": 10,
-    },
+# Prompt, image tokens and answer of one evaluation row, for memory admission.
+EVALUATION_SEQUENCE_LENGTH = 2048
+FINISHED_STATUSES = ("COMPLETED", "FAILED", "CANCELLED")
+
+RESUMABLE_JOBS = {
+    job.__name__: job
+    for job in (train_model, train_adapt_model, train_model_with_goal, run_distributed)
 }
 
 
+@router.on_event("startup")
+def recover_tasks():
+    task_status.add_listener(persist_task_status)
+    recover_interrupted_tasks()
+
+
+@router.on_event("startup")
+def migrate_configs():
+    config_loader.migrate_model_configs()
+
+
 @router.get("/models")
 def get_models():
     return {"models": AVAILABLE_MODELS}
 
 
+def _submit_training(task_id, fn, kwargs, num_processes=1, **scheduling):
+    if num_processes > 1:
+        fn, kwargs = run_distributed, {
+            "task_id": task_id,
+            "target": fn.__name__,
+            "kwargs": kwargs,
+            "nproc_per_node": num_processes,
+        }
+    return training_scheduler.submit(
+        task_id, fn, kwargs, exclusive=num_processes > 1, **scheduling
+    )
+
+
 @router.get("/datasets")
 def get_captioned_datasets():
     return retreive_captioned_dataset()
 
 
 @router.post("/start-finetuning")
-async def start_finetuning(
-    request: FineTuningRequest, background_tasks: BackgroundTasks
-):
+async def start_finetuning(request: FineTuningRequest):
     task_id = str(uuid.uuid4())
-    background_tasks.add_task(
+    position = _submit_training(
+        task_id,
         train_model,
+        {
+            "model_name": request.model_name,
+            "task_id": task_id,
+            "dataset_path": request.dataset_path,
+            "app_name": request.app_name,
+        },
         model_name=request.model_name,
-        task_id=task_id,
-        dataset_path=request.dataset_path,
-        app_name=request.app_name,
+        batch_size=2,
+        sequence_length=2048,
+        priority=request.priority,
+        num_processes=request.num_processes,
     )
-    return {"task_id": task_id, "status": "STARTED"}
+    return {"task_id": task_id, "status": "STARTED", "queue_position": position}
 
 
 @router.post("/start-adapt-finetune")
-async def start_adapt_finetuning(
-    request: AdaptFineTuningRequest, background_tasks: BackgroundTasks
-):
+async def start_adapt_finetuning(request: AdaptFineTuningRequest):
     task_id = str(uuid.uuid4())
-    background_tasks.add_task(
+    config = config_loader.get_adaptive_config(request.model_name)
+    position = _submit_training(
+        task_id,
         train_adapt_model,
+        {
+            "model_name": request.model_name,
+            "task_id": task_id,
+            "dataset_path": request.dataset_path,
+            "app_name": request.app_name,
+            "batch_size": request.batch_size,
+            "learning_rate": request.learning_rate,
+            "epochs": request.epochs,
+        },
         model_name=request.model_name,
-        task_id=task_id,
-        dataset_path=request.dataset_path,
-        app_name=request.app_name,
-        batch_size=request.batch_size,
-        learning_rate=request.learning_rate,
-        epochs=request.epochs,
+        batch_size=request.batch_size or config.get("batch_size", 4),
+        sequence_length=2048,
+        priority=request.priority,
+        num_processes=request.num_processes,
     )
-    return {"task_id": task_id, "status": "STARTED"}
+    return {"task_id": task_id, "status": "STARTED", "queue_position": position}
 
 
 @router.post("/finetune-with-goal")
-async def finetune_with_goal(
-    request: GoalTrainingRequest, background_tasks: BackgroundTasks
-):
+async def finetune_with_goal(request: GoalTrainingRequest):
     task_id = str(uuid.uuid4())
     try:
-        background_tasks.add_task(
+        config = config_loader.load_model_config(
+            request.model_name, request.goal_type, request.target
+        )
+        position = _submit_training(
+            task_id,
             train_model_with_goal,
+            {
+                "task_id": task_id,
+                "model_name": request.model_name,
+                "dataset_path": request.dataset_path,
+                "goal_type": request.goal_type,
+                "target": request.target,
+                "app_name": request.app_name,
+            },
+            model_name=request.model_name,
+            batch_size=config["batch_size"],
+            sequence_length=config["sequence_length"],
+            priority=request.priority,
+            num_processes=request.num_processes,
+        )
+        return {"task_id": task_id, "status": "STARTED", "queue_position": position}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/finetune-with-search")
+async def finetune_with_search(request: HyperparameterSearchRequest):
+    task_id = str(uuid.uuid4())
+    try:
+        max_trial_steps = trial_step_budget(
+            request.min_steps, request.eta, request.max_trial_steps
+        )
+        config = config_loader.load_model_config(
+            request.model_name, request.goal_type, request.target
+        )
+        position = training_scheduler.submit(
             task_id,
-            request.model_name,
-            request.dataset_path,
-            request.goal_type,
-            request.target,
-            request.app_name,
+            run_hyperparameter_search,
+            {
+                "task_id": task_id,
+                "model_name": request.model_name,
+                "dataset_path": request.dataset_path,
+                "goal_type": request.goal_type,
+                "target": request.target,
+                "app_name": request.app_name,
+                "num_trials": request.num_trials,
+                "eta": request.eta,
+                "min_steps": request.min_steps,
+                "max_trial_steps": max_trial_steps,
+                "subset_size": request.subset_size,
+            },
+            model_name=request.model_name,
+            batch_size=max(SEARCH_SPACE["batch_size"]),
+            sequence_length=config["sequence_length"],
+            priority=request.priority,
         )
-        return {"task_id": task_id, "status": "STARTED"}
+        return {"task_id": task_id, "status": "STARTED", "queue_position": position}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/resume/{task_id}")
+def resume_task(task_id: str):
+    spec = load_task_spec(task_id)
+    if spec is None or spec["job"] not in RESUMABLE_JOBS:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    status = task_status.get(task_id, {}).get("status", spec.get("status"))
+    if status not in RESUMABLE_STATUSES:
+        raise HTTPException(
+            status_code=409, detail=f"Cannot resume a task that is {status}"
+        )
+
+    checkpoint = latest_checkpoint(task_id)
+    kwargs = dict(spec["kwargs"], resume_from_checkpoint=checkpoint)
+    position = training_scheduler.submit(
+        task_id,
+        RESUMABLE_JOBS[spec["job"]],
+        kwargs,
+        model_name=spec["model_name"],
+        batch_size=spec["batch_size"],
+        sequence_length=spec["sequence_length"],
+        priority=spec["priority"],
+        exclusive=spec.get("exclusive", False),
+    )
+    return {
+        "task_id": task_id,
+        "status": "RESUMED",
+        "resumed_from": checkpoint,
+        "queue_position": position,
+    }
+
+
+@router.post("/distributed/smoke-test")
+def start_distributed_smoke_test(nproc_per_node: int = 2, max_steps: int = 20):
+    task_id = str(uuid.uuid4())
+    position = training_scheduler.submit(
+        task_id,
+        run_distributed,
+        {
+            "task_id": task_id,
+            "target": "smoke_test",
+            "kwargs": {"task_id": task_id, "max_steps": max_steps},
+            "nproc_per_node": nproc_per_node,
+            "backend": "gloo",
+        },
+        model_name="ddp_smoke_test",
+        exclusive=True,
+        # A tiny CPU model; it only needs the box to itself.
+        estimated_memory_gb=0,
+        resumable=False,
+    )
+    return {"task_id": task_id, "status": "QUEUED", "queue_position": position}
+
+
+@router.get("/distributed/command/{task_id}")
+def get_distributed_command(task_id: str, node_rank: int = 1):
+    """torchrun command to join a multi-node task from another node."""
+    spec = load_task_spec(task_id)
+    spec_path = distributed_spec_path(task_id)
+    if spec is None or spec["job"] != run_distributed.__name__:
+        raise HTTPException(status_code=404, detail="No distributed task found")
+    return {
+        "command": torchrun_command(
+            spec_path, spec["kwargs"]["nproc_per_node"], node_rank
+        ),
+    }
+
+
+@router.get("/checkpoints/{task_id}")
+def get_task_checkpoints(task_id: str):
+    return {"task_id": task_id, "checkpoints": list_checkpoints(task_id)}
+
+
+@router.get("/queue")
+def get_training_queue():
+    return training_scheduler.describe()
+
+
+@router.get("/workers")
+def get_training_workers():
+    return training_worker_pool.describe()
+
+
+@router.delete("/queue/{task_id}")
+def cancel_queued_task(task_id: str):
+    if not training_scheduler.cancel(task_id):
+        raise HTTPException(status_code=404, detail="Task is not queued")
+    return {"task_id": task_id, "status": "CANCELLED"}
+
+
+@router.get("/model-pool")
+def get_model_pool():
+    return base_model_pool.describe()
+
+
 @router.get("/status/{task_id}")
 def check_status(task_id: str):
     status = task_status.get(task_id)
@@ -118,106 +327,299 @@ def check_status(task_id: str):
         "epoch_metrics": status.get("epoch_metrics"),
         "current_epoch": status.get("current_epoch", 0),
         "metrics": status.get("metrics", {}),
+        "queue_position": status.get("queue_position", 0),
+        "estimated_memory_gb": status.get("estimated_memory_gb"),
+        "search": status.get("search"),
+        "step_telemetry": status.get("step_telemetry"),
+        "telemetry_summary": get_step_telemetry(task_id, last=20)["summary"],
     }
 
 
 @router.get("/stream-status/{task_id}")
-def stream_status(task_id: str):
-    def event_generator():
-        last_epoch = -1
-        while True:
-            status = task_status.get(task_id)
-            if not status:
-                yield f"data: {json.dumps({'error': 'Task not found'})}\n\n"
-                break
-
-            # Send epoch updates
-            if (
-                "epoch_metrics" in status
-                and status["epoch_metrics"]["epoch"] > last_epoch
-            ):
-                last_epoch = status["epoch_metrics"]["epoch"]
-                epoch_data = json.dumps(
-                    {"type": "epoch_update", "data": status["epoch_metrics"]}
-                )
-                yield f"data: {epoch_data}\n\n"
-
-            # Send regular status updates
-            sanitized_status = {k: v for k, v in status.items() if k != "model"}
-            status_data = json.dumps(
-                {"type": "status_update", "data": sanitized_status}
-            )
-            yield f"data: {status_data}\n\n"
-
-            if status["status"] in ["COMPLETED", "FAILED"]:
-                break
-            time.sleep(1)
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+async def stream_status(task_id: str, request: Request):
+    if task_id not in task_status:
 
+        async def not_found():
+            yield f"data: {json.dumps({'error': 'Task not found'})}\n\n"
 
-@router.post("/save-model")
-def save_model_req(request: SaveModelRequest):
-    try:
-        return save_model(
-            request.task_id, request.app_name, request.hf_username, request.hf_token
+        return StreamingResponse(not_found(), media_type="text/event-stream")
+
+    last_event_id = request.headers.get("last-event-id")
+    return StreamingResponse(
+        status_hub.stream(
+            task_id,
+            int(last_event_id) if last_event_id and last_event_id.isdigit() else None,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stream-subscribers")
+def get_stream_subscribers():
+    return status_hub.describe()
+
+
+def _submit_export(
+    task_id, app_name, quant_methods, output_dir=None, repo_id=None, hf_token=None
+):
+    adapter_path = trained_models.get(task_id)
+    if adapter_path is None:
+        raise HTTPException(
+            status_code=404, detail="Model not found or training not completed"
         )
-    except:
+    try:
+        quant_methods = validate_quant_methods(quant_methods)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with open(os.path.join(adapter_path, "adapter_config.json"), "r") as f:
+        model_name = json.load(f)["base_model_name_or_path"]
+
+    export_id = str(uuid.uuid4())
+    # Exports load a model too, so they go through the scheduler's memory
+    # admission and run in the training workers rather than in the request.
+    position = training_scheduler.submit(
+        export_id,
+        run_export,
+        {
+            "export_id": export_id,
+            "adapter_path": adapter_path,
+            "app_name": app_name,
+            "quant_methods": quant_methods,
+            "output_dir": output_dir,
+            "repo_id": repo_id,
+            "hf_token": hf_token,
+        },
+        model_name=model_name,
+        estimated_memory_gb=estimate_export_memory_gb(model_name),
+        resumable=False,
+        status_fields={"stage": "queued", "source_task_id": task_id},
+    )
+    return {"export_id": export_id, "status": "QUEUED", "queue_position": position}
+
+
+@router.post("/export")
+def export_model(request: ExportRequest):
+    if request.push_to_hub and not request.hf_username:
+        raise HTTPException(status_code=400, detail="hf_username is required")
+    repo_id = (
+        f"{request.hf_username}/{request.app_name}_finetuned"
+        if request.push_to_hub
+        else None
+    )
+    return _submit_export(
+        request.task_id,
+        request.app_name,
+        request.quant_methods,
+        repo_id=repo_id,
+        hf_token=request.hf_token,
+    )
+
+
+# /save-model and /save-gguf predate /export and answer once the export is
+# done, as they always have; wait=false returns the queued export instead.
+@router.post("/save-model")
+def save_model_req(request: SaveModelRequest, wait: bool = True):
+    export = _submit_export(
+        request.task_id,
+        request.app_name,
+        [],
+        repo_id=f"{request.hf_username}/{request.app_name}_finetuned",
+        hf_token=request.hf_token,
+    )
+    if not wait:
+        return export
+    status = task_status.wait_for(export["export_id"], FINISHED_STATUSES)
+    if status["status"] != "COMPLETED":
         raise HTTPException(
             status_code=404, detail="Model not found or training not completed"
         )
+    return {
+        "message": "Model saved to Hugging Face",
+        "model_path": status["export_path"],
+        "export_id": export["export_id"],
+        "hub_url": status["hub_url"],
+    }
 
 
 @router.post("/save-gguf")
-def save_gguf_endpoint(request: GGUFSaveRequest):
+def save_gguf_endpoint(request: GGUFSaveRequest, wait: bool = True):
+    export = _submit_export(
+        request.task_id,
+        request.app_name,
+        request.quant_methods or [request.quant_method],
+        output_dir=request.output_dir,
+    )
+    if not wait:
+        return export
+    status = task_status.wait_for(export["export_id"], FINISHED_STATUSES)
+    if status["status"] != "COMPLETED":
+        return {
+            "message": "Model not saved locally in GGUF format",
+            "error": status.get("error"),
+            "export_id": export["export_id"],
+        }
+    return {
+        "message": "Model saved locally in GGUF format",
+        "output_path": status["export_path"],
+        "quantization": request.quant_methods or request.quant_method,
+        "export_id": export["export_id"],
+        "gguf_files": status["gguf_files"],
+    }
+
+
+@router.get("/export-status/{export_id}")
+def get_export_status(export_id: str):
+    status = task_status.get(export_id)
+    if not status or "stage" not in status:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return status
+
+
+def _submit_evaluation(eval_id, spec):
+    # Evaluations load the app like inference does, so they share the GPU
+    # budget with training; resuming goes through /evaluate/{eval_id}/resume.
     try:
-        return save_gguf_model(
-            task_id=request.task_id,
-            output_dir=request.output_dir,
-            quant_method=request.quant_method,
+        model_name = adapter_base_model(spec["app_name"])
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return training_scheduler.submit(
+        eval_id,
+        run_offline_evaluation,
+        dict(spec, eval_id=eval_id),
+        model_name=model_name,
+        estimated_memory_gb=estimate_inference_memory_gb(
+            model_name, spec["batch_size"], EVALUATION_SEQUENCE_LENGTH
+        ),
+        resumable=False,
+    )
+
+
+@router.post("/evaluate")
+def start_evaluation(request: EvaluationRequest):
+    if not os.path.isdir(os.path.join("outputs", request.app_name)):
+        raise HTTPException(status_code=404, detail="Model not found")
+    if not os.path.exists(os.path.join("jsons", f"{request.dataset_path}.json")):
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if request.output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"output_format must be one of {OUTPUT_FORMATS}"
         )
-    except:
+
+    eval_id = str(uuid.uuid4())
+    spec = request.model_dump()
+    save_evaluation_spec(eval_id, spec)
+    position = _submit_evaluation(eval_id, spec)
+    return {"eval_id": eval_id, "status": "QUEUED", "queue_position": position}
+
+
+@router.post("/evaluate/{eval_id}/resume")
+def resume_evaluation(eval_id: str):
+    spec = load_evaluation_spec(eval_id)
+    if spec is None:
+        raise HTTPException(status_code=404, detail="Evaluation not found")
+    status = task_status.get(eval_id, {}).get("status")
+    if status in ("QUEUED", "STARTING", "EVALUATING"):
         raise HTTPException(
-            status_code=404, detail="Model not found or training not completed"
+            status_code=409, detail=f"Cannot resume an evaluation that is {status}"
         )
+    spec.pop("status", None)
+    position = _submit_evaluation(eval_id, spec)
+    return {"eval_id": eval_id, "status": "QUEUED", "queue_position": position}
+
+
+@router.get("/evaluation-status/{eval_id}")
+def get_evaluation_status(eval_id: str):
+    status = task_status.get(eval_id)
+    if status:
+        return status
+    spec = load_evaluation_spec(eval_id)
+    if spec is None:
+        raise HTTPException(status_code=404, detail="Evaluation not found")
+    # Not run since the server started: report what the checkpoint holds.
+    return {
+        "status": spec.get("status", "INTERRUPTED"),
+        "processed": len(load_results(eval_id)),
+        "error": None,
+    }
+
+
+@router.get("/evaluation-results/{eval_id}")
+def get_evaluation_results(eval_id: str, offset: int = 0, limit: int = 100):
+    if load_evaluation_spec(eval_id) is None:
+        raise HTTPException(status_code=404, detail="Evaluation not found")
+    rows = load_results(eval_id)
+    return {"total": len(rows), "rows": rows[offset : offset + limit]}
 
 
 @router.get("/get-metrics/{task_id}")
-def get_training_metrics(task_id: str):
+def get_training_metrics(task_id: str, points: int = DEFAULT_POINTS):
     if task_id not in task_status:
         return {"error": "Invalid task ID"}
 
     status = task_status[task_id]
+    log_history = status.get("log_history", [])
     return {
         "status": status.get("status"),
         "metrics": status.get("metrics", {}),
-        "log_history": status.get("log_history", []),
+        "log_history": downsample_log_history(log_history, points),
+        "log_history_length": len(log_history),
+        "telemetry": get_step_telemetry(task_id),
     }
 
 
 @router.get("/adaptive-config/{model_name}")
-async def get_adaptive_config(model_name: str):
+async def get_adaptive_config(
+    model_name: str, dataset_size: int = None, sequence_length: int = 2048
+):
 
     decoded_model_name = model_name.replace("%2F", "/")  # Decode URL-encoded slashes
     print(f"Fetching adaptive config for model: {decoded_model_name}")
-    if decoded_model_name not in adaptive_configs:
+    config = config_loader.get_adaptive_config(
+        decoded_model_name, dataset_size=dataset_size, sequence_length=sequence_length
+    )
+    if not config:
         raise HTTPException(
             status_code=404, detail="Model not found in adaptive configurations"
         )
 
-    config = adaptive_configs.get(decoded_model_name)
-
     return {
         "model": decoded_model_name,
         "batch_size": config["batch_size"],
         "learning_rate": config["learning_rate"],
         "epochs": config["epochs"],
+        "predicted_peak_memory_gb": config.get("predicted_peak_memory_gb"),
+        "predicted_runtime_minutes": config.get("predicted_runtime_minutes"),
+        "fitted_on_runs": config.get("fitted_on_runs", 0),
     }
 
 
 @router.get("/tensorboard-logs/{app_name}")
-async def get_tensorboard_metrics(app_name: str):
+def get_tensorboard_metrics(app_name: str, points: int = DEFAULT_POINTS):
     try:
-        return get_tensorboard_logs(app_name)
+        return get_tensorboard_logs(app_name, points)
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/runs")
+def get_training_runs(model: str = None, limit: int = 50, offset: int = 0):
+    return list_runs(model=model, limit=limit, offset=offset)
+
+
+@router.get("/runs/compare")
+def compare_training_runs(run_ids: str):
+    try:
+        ids = [int(run_id) for run_id in run_ids.split(",") if run_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="run_ids must be integers")
+    if not ids:
+        raise HTTPException(status_code=400, detail="No run ids given")
+    return compare_runs(ids)
+
+
+@router.get("/runs/export")
+def export_training_runs():
+    path = export_legacy_log(os.path.join("configs", "training_runs_export.xlsx"))
+    return FileResponse(path, filename="adapt_training_logs.xlsx")
@@ -1,15 +1,29 @@
+import asyncio
+import json
 from io import BytesIO
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
 from fastapi.responses import StreamingResponse
 from PIL import Image
+from services.gguf_inference import gguf_backend
+from services.inference_batching import INFERENCE_BATCHING
+from services.inference_device import describe as describe_device
+from services.inference_executor import inference_executor
 from services.inference_service import (
     compare_responses,
+    inference_batcher,
     list_models,
     load_model,
+    loaded_models,
     process_unfinetuned_vqa,
     process_vqa,
+    response_cache,
+    stream_unfinetuned_vqa,
+    stream_vqa,
 )
+from services.multi_lora import KNOWN_BASE_MODELS, adapter_version, multi_lora_server
+from services.prefix_cache import prefix_cache
+from services.vision_cache import vision_cache
 
 router = APIRouter()
 
@@ -25,12 +39,72 @@ async def get_finetuned_models():
 @router.post("/load-model")
 async def load_finetuned_model(app_name: str = Form(...)):
     try:
-        load_model(app_name)
+        await inference_executor.run(app_name, load_model, app_name)
         return {"message": f"Model {app_name} loaded successfully"}
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
+@router.get("/resident-models")
+def get_resident_models():
+    return loaded_models.describe()
+
+
+@router.get("/batching")
+def get_batching_stats():
+    return inference_batcher.describe()
+
+
+@router.get("/device")
+def get_inference_device():
+    return dict(describe_device(), gguf_models=gguf_backend.describe())
+
+
+@router.get("/executor")
+def get_executor_stats():
+    return inference_executor.describe()
+
+
+@router.get("/response-cache")
+def get_response_cache_stats():
+    return response_cache.describe()
+
+
+@router.delete("/response-cache")
+def clear_response_cache(model: str = None):
+    return {"cleared": response_cache.clear(model)}
+
+
+@router.get("/vision-cache")
+def get_vision_cache_stats():
+    return vision_cache.describe()
+
+
+@router.get("/prefix-cache")
+def get_prefix_cache_stats():
+    return prefix_cache.describe()
+
+
+@router.get("/adapters")
+def get_served_adapters():
+    return multi_lora_server.describe()
+
+
+@router.post("/pin-model")
+def pin_model(app_name: str = Form(...), pinned: bool = Form(True)):
+    loaded_models.pin(app_name, pinned)
+    return {"app_name": app_name, "pinned": pinned}
+
+
+@router.delete("/resident-models/{app_name}")
+def evict_model(app_name: str):
+    if app_name not in loaded_models:
+        raise HTTPException(status_code=404, detail="Model not loaded")
+    if not loaded_models.evict(app_name):
+        raise HTTPException(status_code=409, detail="Model is in use")
+    return {"message": f"Model {app_name} evicted"}
+
+
 @router.post("/process")
 async def process_inference(
     image: UploadFile = File(None),
@@ -43,12 +117,77 @@ async def process_inference(
             Image.open(BytesIO(image_content)).convert("RGB") if image_content else None
         )
 
-        result = process_vqa(app_name, image_obj, question)
+        cache_key = response_cache.key(
+            app_name, adapter_version(app_name), image_obj, question
+        )
+        result = response_cache.get(cache_key)
+        if result is not None:
+            return {"answer": result, "cached": True}
+
+        if INFERENCE_BATCHING:
+            result = await inference_batcher.submit(app_name, image_obj, question)
+        else:
+            result = await inference_executor.run(
+                app_name, process_vqa, app_name, image_obj, question
+            )
+        response_cache.put(cache_key, result)
         return {"answer": result}
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
+def _token_events(request, stream):
+    async def events():
+        tokens = iter(stream)
+        try:
+            while not await request.is_disconnected():
+                token = await asyncio.to_thread(next, tokens, None)
+                if token is None:
+                    yield f"data: {json.dumps({'done': True})}\n\n"
+                    return
+                yield f"data: {json.dumps({'token': token})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            # Also runs when the client disconnects mid-stream.
+            stream.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _read_image(image):
+    image_content = await image.read() if image else None
+    return Image.open(BytesIO(image_content)).convert("RGB") if image_content else None
+
+
+@router.post("/process/stream")
+async def stream_inference(
+    request: Request,
+    image: UploadFile = File(None),
+    question: str = Form(...),
+    app_name: str = Form(...),
+):
+    image_obj = await _read_image(image)
+    return _token_events(request, stream_vqa(app_name, image_obj, question))
+
+
+@router.post("/process_vqa/unfinetuned/stream")
+async def stream_unfinetuned_inference(
+    request: Request,
+    model: str = Form(...),
+    image: UploadFile = File(None),
+    question: str = Form(...),
+):
+    if model not in KNOWN_BASE_MODELS:
+        raise HTTPException(status_code=400, detail="Invalid model name")
+    image_obj = await _read_image(image)
+    return _token_events(request, stream_unfinetuned_vqa(image_obj, question, model))
+
+
 @router.post("/process_vqa/unfinetuned")
 async def process_unfinetuned_vqa_endpoint(
     model: str = Form(...),
@@ -57,11 +196,7 @@ async def process_unfinetuned_vqa_endpoint(
 ):
     if not question:
         raise HTTPException(status_code=400, detail="Missing question")
-    if model not in [
-        "unsloth/Llama-3.2-11B-Vision-bnb-4bit",
-        "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit",
-        "unsloth/Pixtral-12B-2409",
-    ]:
+    if model not in KNOWN_BASE_MODELS:
         raise HTTPException(status_code=400, detail="Invalid model name")
 
     image_content = await image.read() if image else None
@@ -72,12 +207,20 @@ async def process_unfinetuned_vqa_endpoint(
     print(f"Processing image: {image_obj}")
     print(f"Processing image size: {image_obj.size if image_obj else 'No image'}")
 
+    cache_key = response_cache.key(model, None, image_obj, question)
+    result = response_cache.get(cache_key)
+    if result is not None:
+        return {"answer": result, "cached": True}
+
     try:
-        result = process_unfinetuned_vqa(
+        result = await inference_executor.run(
+            model,
+            process_unfinetuned_vqa,
             image=image_obj,
             question=question,
             model_name=model,
         )
+        response_cache.put(cache_key, result)
         return {"answer": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -90,8 +233,12 @@ async def compare_responses_endpoint(
     unfinetuned_response: str = Form(...),
 ):
     try:
-        comparison = compare_responses(
-            question, finetuned_response, unfinetuned_response
+        comparison = await inference_executor.run(
+            "compare_responses",
+            compare_responses,
+            question,
+            finetuned_response,
+            unfinetuned_response,
         )
         return comparison
     except Exception as e:
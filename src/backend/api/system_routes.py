@@ -6,8 +6,9 @@ from fastapi import APIRouter, HTTPException, logger
 router = APIRouter()
 
 
+# Plain def: cpu_percent samples for a second and must not block the event loop.
 @router.get("/system-info")
-async def get_system_info():
+def get_system_info():
     try:
         cpu_usage = psutil.cpu_percent(interval=1)
         memory = psutil.virtual_memory()
@@ -1,9 +1,15 @@
+from services.inference_device import INFERENCE_DEVICE
+
 from api.dataset_routes import router as dataset_router
-from api.finetune_routes import router as finetune_router
+
+if INFERENCE_DEVICE == "cuda":
+    # Training, export and the VQA tools run on unsloth, which needs a GPU;
+    # CPU-only hosts serve inference alone.
+    from api.finetune_routes import router as finetune_router
+    from api.vqa_routes import router as vqa_router
 from api.inference_routes import router as inference_router
 from api.model_routes import router as model_router
 from api.system_routes import router as system_router
-from api.vqa_routes import router as vqa_router
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -17,8 +23,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(finetune_router, prefix="/api/finetune")
-app.include_router(vqa_router, prefix="/api/vqa")
+if INFERENCE_DEVICE == "cuda":
+    app.include_router(finetune_router, prefix="/api/finetune")
+    app.include_router(vqa_router, prefix="/api/vqa")
+else:
+    print("[INFERENCE] No GPU found: serving inference routes only, on the CPU")
 app.include_router(model_router, prefix="/api/models")
 app.include_router(dataset_router, prefix="/api/datasets")
 app.include_router(system_router, prefix="/api/system")
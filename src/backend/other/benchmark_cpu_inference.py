@@ -0,0 +1,106 @@
+import os
+import statistics
+import sys
+import time
+
+import psutil
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import inference_device  # noqa: E402
+
+# --- CONFIGURABLES ---
+model_name = "HuggingFaceTB/SmolVLM-256M-Instruct"  # Tiny VLM that fits any box
+image_path = None  # None uses a synthetic 384x384 image
+question = "Describe the damage to this vehicle."
+backends = ["fp32", "int8"]
+thread_counts = None  # None sweeps 1, 2, 4, ... up to the physical cores
+requests_per_setting = 5
+max_new_tokens = 32
+gguf_path = None  # Optional: a GGUF file to time through llama-cpp-python
+# ----------------------
+
+physical_cores = psutil.cpu_count(logical=False) or os.cpu_count()
+if thread_counts is None:
+    thread_counts = sorted(
+        {2**i for i in range(physical_cores.bit_length()) if 2**i <= physical_cores}
+        | {physical_cores}
+    )
+
+image = (
+    Image.open(image_path).convert("RGB")
+    if image_path
+    else Image.new("RGB", (384, 384), color=(128, 64, 32))
+)
+messages = [
+    {
+        "role": "user",
+        "content": [{"type": "image"}, {"type": "text", "text": question}],
+    }
+]
+
+results = []
+for backend in backends:
+    model, processor = inference_device.load_cpu_model(model_name, backend=backend)
+    prompt = processor.apply_chat_template(messages, add_generation_prompt=True)
+    inputs = processor(image, prompt, add_special_tokens=False, return_tensors="pt")
+    prompt_tokens = inputs["input_ids"].shape[1]
+
+    for threads in thread_counts:
+        inference_device.configure_cpu_threads(threads)
+        with torch.inference_mode():
+            model.generate(**inputs, max_new_tokens=2, do_sample=False)  # Warm-up
+            latencies, generated = [], 0
+            for _ in range(requests_per_setting):
+                start = time.perf_counter()
+                output = model.generate(
+                    **inputs, max_new_tokens=max_new_tokens, do_sample=False
+                )
+                latencies.append(time.perf_counter() - start)
+                generated += output.shape[1] - prompt_tokens
+
+        result = {
+            "backend": backend,
+            "threads": threads,
+            "median_latency_s": round(statistics.median(latencies), 3),
+            "max_latency_s": round(max(latencies), 3),
+            "tokens_per_s": round(generated / sum(latencies), 2),
+            "requests_per_min": round(60 * len(latencies) / sum(latencies), 2),
+        }
+        results.append(result)
+        print(result)
+    del model
+
+if gguf_path:
+    from llama_cpp import Llama
+
+    for threads in thread_counts:
+        llm = Llama(model_path=gguf_path, n_threads=threads, verbose=False)
+        latencies, generated = [], 0
+        for _ in range(requests_per_setting):
+            start = time.perf_counter()
+            completion = llm.create_chat_completion(
+                messages=[{"role": "user", "content": question}],
+                max_tokens=max_new_tokens,
+                temperature=0.0,
+            )
+            latencies.append(time.perf_counter() - start)
+            generated += completion["usage"]["completion_tokens"]
+        result = {
+            "backend": "gguf (text only)",
+            "threads": threads,
+            "median_latency_s": round(statistics.median(latencies), 3),
+            "max_latency_s": round(max(latencies), 3),
+            "tokens_per_s": round(generated / sum(latencies), 2),
+            "requests_per_min": round(60 * len(latencies) / sum(latencies), 2),
+        }
+        results.append(result)
+        print(result)
+
+best = max(results, key=lambda r: r["tokens_per_s"])
+print(
+    f"Fastest: {best['backend']} with {best['threads']} threads "
+    f"({best['tokens_per_s']} tokens/s) on {physical_cores} physical cores; "
+    f"set INFERENCE_CPU_BACKEND and INFERENCE_CPU_THREADS accordingly"
+)
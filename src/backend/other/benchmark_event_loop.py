@@ -0,0 +1,84 @@
+import statistics
+import threading
+import time
+
+import requests
+
+# --- CONFIGURABLES ---
+base_url = "http://localhost:8000"
+light_endpoint = "/api/inference/executor"  # Cheap route that touches no model
+app_name = "my_app"  # Fine-tuned app used for the heavy requests
+image_path = "inference_images/sample.jpg"
+question = "Describe this image."
+heavy_concurrency = 4
+phase_seconds = 20
+light_interval = 0.05
+# ----------------------
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def measure_light(stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        requests.get(base_url + light_endpoint, timeout=120)
+        latencies.append((time.perf_counter() - start) * 1000)
+        time.sleep(light_interval)
+
+
+def run_heavy(stop, completed):
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    while not stop.is_set():
+        response = requests.post(
+            base_url + "/api/inference/process",
+            data={"question": question, "app_name": app_name},
+            files={"image": ("image.jpg", image_bytes, "image/jpeg")},
+            timeout=600,
+        )
+        if response.ok:
+            completed.append(time.perf_counter())
+
+
+def run_phase(name, heavy):
+    stop = threading.Event()
+    latencies, completed = [], []
+    threads = [threading.Thread(target=measure_light, args=(stop, latencies))]
+    if heavy:
+        threads += [
+            threading.Thread(target=run_heavy, args=(stop, completed))
+            for _ in range(heavy_concurrency)
+        ]
+    for thread in threads:
+        thread.start()
+    time.sleep(phase_seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    summary = {
+        "requests": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies), 1),
+        "heavy_completed": len(completed),
+    }
+    print(f"{name}: {summary}")
+    return summary
+
+
+# Warm the model so the loaded phase measures generation, not the first load.
+requests.post(
+    base_url + "/api/inference/load-model", data={"app_name": app_name}, timeout=600
+)
+
+idle = run_phase("idle", heavy=False)
+loaded = run_phase(f"{heavy_concurrency} concurrent generations", heavy=True)
+print(
+    f"Light endpoint p95 under load is {round(loaded['p95_ms'] / idle['p95_ms'], 2)}x "
+    f"idle ({idle['p95_ms']} ms -> {loaded['p95_ms']} ms)"
+)
@@ -0,0 +1,104 @@
+from unsloth import FastVisionModel
+import os
+import statistics
+import sys
+import time
+
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.prefix_cache import PrefixKVCache  # noqa: E402
+
+# --- CONFIGURABLES ---
+model_name = "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit"
+image_folder = "inference_images"  # Folder with images to ask about
+questions = [
+    "Which parts of the vehicle are damaged?",
+    "How severe is the damage?",
+    "Is the vehicle drivable?",
+    "Estimate the repair cost category.",
+    "Are any lights or windows broken?",
+]
+max_images = 5
+max_new_tokens = 64
+# ----------------------
+
+model, tokenizer = FastVisionModel.from_pretrained(model_name, load_in_4bit=True)
+FastVisionModel.for_inference(model)
+
+cache = PrefixKVCache(enabled=True)
+generation_kwargs = {"use_cache": True, "do_sample": False}
+
+
+def timed(fn):
+    torch.cuda.synchronize()
+    start = time.perf_counter()
+    output = fn()
+    torch.cuda.synchronize()
+    return output, (time.perf_counter() - start) * 1000
+
+
+images = [
+    Image.open(os.path.join(image_folder, name)).convert("RGB")
+    for name in sorted(os.listdir(image_folder))
+    if name.lower().endswith((".jpg", ".png", ".jpeg"))
+][:max_images]
+
+timings = {"baseline": [], "cached": [], "baseline_ttft": [], "cached_ttft": []}
+mismatches = 0
+
+with cache.scope(model_name):
+    for image in images:
+        for question in questions:
+            prompt = tokenizer.apply_chat_template(
+                [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "image"},
+                            {"type": "text", "text": question},
+                        ],
+                    }
+                ],
+                add_generation_prompt=True,
+            )
+            inputs = tokenizer(
+                image, prompt, add_special_tokens=False, return_tensors="pt"
+            ).to("cuda")
+
+            # Time to first token isolates the prefill the cache removes.
+            for label, new_tokens in (("_ttft", 1), ("", max_new_tokens)):
+                baseline, baseline_ms = timed(
+                    lambda: model.generate(
+                        **inputs, max_new_tokens=new_tokens, **generation_kwargs
+                    )
+                )
+                cached, cached_ms = timed(
+                    lambda: cache.generate(
+                        model,
+                        tokenizer,
+                        inputs,
+                        image,
+                        prompt,
+                        question,
+                        max_new_tokens=new_tokens,
+                        **generation_kwargs,
+                    )
+                )
+                timings["baseline" + label].append(baseline_ms)
+                timings["cached" + label].append(cached_ms)
+                if label == "" and not torch.equal(baseline, cached):
+                    mismatches += 1
+
+# The first question per image fills the cache, so report medians.
+for label in ("_ttft", ""):
+    baseline_ms = statistics.median(timings["baseline" + label])
+    cached_ms = statistics.median(timings["cached" + label])
+    name = "time to first token" if label else f"{max_new_tokens}-token answer"
+    print(
+        f"{name}: {round(baseline_ms, 1)} ms -> {round(cached_ms, 1)} ms "
+        f"({round(100 * (1 - cached_ms / baseline_ms), 1)}% faster)"
+    )
+print(f"Greedy outputs differing from baseline: {mismatches}")
+print(cache.describe())
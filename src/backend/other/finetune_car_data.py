@@ -141,6 +141,8 @@ def perform_inference(image_path):
     return tokenizer.batch_decode(output, skip_special_tokens=True)[0].strip()
 
 
+# Quick check on a handful of images. Whole captioned datasets are evaluated
+# in batches, with resumable JSONL/Parquet output, by POST /api/finetune/evaluate.
 for index, row in df.iterrows():
     image_path = os.path.join(image_folder, row["Image"])
     fine_tuned_response = perform_inference(image_path)
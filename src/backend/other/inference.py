@@ -1,11 +1,16 @@
-from unsloth import FastVisionModel
+import torch
+
+if torch.cuda.is_available():
+    from unsloth import FastVisionModel
 import os
+import sys
 
 import pandas as pd
 from PIL import Image
 from transformers import TextStreamer
 
 # --- CONFIGURABLES ---
+model_name = "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit"
 image_folder = "inference_images"  # Folder with images to process
 output_excel = "base_model_outputs.xlsx"
 instruction = (
@@ -14,13 +19,19 @@ instruction = (
 max_tokens = 300
 # ----------------------
 
-model, tokenizer = FastVisionModel.from_pretrained(
-    "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit",
-    load_in_4bit=True,
-    use_gradient_checkpointing="unsloth",
-)
+if torch.cuda.is_available():
+    model, tokenizer = FastVisionModel.from_pretrained(
+        model_name,
+        load_in_4bit=True,
+        use_gradient_checkpointing="unsloth",
+    )
+    FastVisionModel.for_inference(model)
+else:
+    # Same CPU runtime the inference service falls back to (int8 by default).
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from services.inference_device import load_cpu_model
 
-FastVisionModel.for_inference(model)
+    model, tokenizer = load_cpu_model(model_name)
 
 text_streamer = TextStreamer(tokenizer, skip_prompt=True)
 
@@ -49,7 +60,7 @@ for filename in sorted(os.listdir(image_folder)):
                 input_text,
                 add_special_tokens=False,
                 return_tensors="pt",
-            ).to("cuda")
+            ).to(model.device)
 
             output = model.generate(
                 **inputs,
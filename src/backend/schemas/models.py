@@ -8,6 +8,8 @@ class FineTuningRequest(BaseModel):
     model_name: str
     dataset_path: str
     app_name: str
+    priority: int = 0
+    num_processes: int = 1
 
 
 class InferenceRequest(BaseModel):
@@ -25,7 +27,28 @@ class GGUFSaveRequest(BaseModel):
     task_id: str
     app_name: str
     quant_method: str = "q4_k_m"
-    output_dir: str = "gguf_models"
+    quant_methods: Optional[List[str]] = None
+    # Defaults to the export directory GGUF serving reads from.
+    output_dir: Optional[str] = None
+
+
+class ExportRequest(BaseModel):
+    task_id: str
+    app_name: str
+    quant_methods: List[str] = ["q4_k_m"]
+    push_to_hub: bool = False
+    hf_username: Optional[str] = None
+    hf_token: Optional[str] = None
+
+
+class EvaluationRequest(BaseModel):
+    app_name: str
+    dataset_path: str
+    question: Optional[str] = None
+    batch_size: int = 8
+    num_workers: int = 4
+    output_format: str = "jsonl"  # "jsonl" or "parquet"
+    limit: Optional[int] = None
 
 
 class GoalTrainingRequest(BaseModel):
@@ -34,6 +57,23 @@ class GoalTrainingRequest(BaseModel):
     target: str  # e.g., '85%' or '24GB'
     dataset_path: str
     app_name: str
+    priority: int = 0
+    num_processes: int = 1
+
+
+class HyperparameterSearchRequest(BaseModel):
+    model_name: str
+    goal_type: str
+    target: str
+    dataset_path: str
+    app_name: str
+    num_trials: int = 9
+    eta: int = 3
+    min_steps: int = 5
+    # Defaults to min_steps * eta**2, i.e. three rungs.
+    max_trial_steps: Optional[int] = None
+    subset_size: int = 64
+    priority: int = 0
 
 
 class VQARequest(BaseModel):
@@ -108,3 +148,5 @@ class AdaptFineTuningRequest(BaseModel):
     batch_size: Optional[int] = None
     learning_rate: Optional[float] = None
     epochs: Optional[int] = None
+    priority: int = 0
+    num_processes: int = 1
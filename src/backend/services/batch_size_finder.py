@@ -0,0 +1,226 @@
+import gc
+import json
+import os
+import threading
+
+import torch
+from services.distributed_training import broadcast_from_main, is_main_process
+
+BATCH_SIZE_CACHE_FILE = os.path.join("configs", "batch_size_cache.json")
+AUTO_BATCH_SIZE = os.environ.get("AUTO_BATCH_SIZE", "1") == "1"
+MAX_PROBE_BATCH_SIZE = int(os.environ.get("MAX_PROBE_BATCH_SIZE", "64"))
+# Probing runs under a reduced memory fraction so the optimizer state and
+# allocator fragmentation of the real run still have room.
+PROBE_MEMORY_FRACTION = float(os.environ.get("PROBE_MEMORY_FRACTION", "0.9"))
+
+_cache_lock = threading.Lock()
+
+
+def hardware_key():
+    if not torch.cuda.is_available():
+        return "cpu"
+    props = torch.cuda.get_device_properties(0)
+    return f"{props.name}-{round(props.total_memory / 1024**3)}GB"
+
+
+def _cache_key(model_name, max_seq_length):
+    return f"{model_name}|{hardware_key()}|{max_seq_length}"
+
+
+def _load_cache():
+    if not os.path.exists(BATCH_SIZE_CACHE_FILE):
+        return {}
+    try:
+        with open(BATCH_SIZE_CACHE_FILE, "r") as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+
+def _store_cache(key, micro_batch_size):
+    with _cache_lock:
+        cache = _load_cache()
+        cache[key] = micro_batch_size
+        tmp_file = BATCH_SIZE_CACHE_FILE + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(cache, f, indent=4)
+        os.replace(tmp_file, BATCH_SIZE_CACHE_FILE)
+
+
+# Padding of the collator's per-token tensors; any other tensor running along
+# the sequence (e.g. Mllama's cross_attention_mask) repeats its last position.
+_PAD_VALUES = {"attention_mask": 1, "labels": -100}
+# Per-image tensors never run along the sequence, whatever their shape.
+_IMAGE_KEY_PREFIXES = ("pixel", "image", "aspect_ratio")
+
+
+def _pad_to_length(batch, max_seq_length, pad_token_id):
+    # Probe the worst case: every sequence at the requested max length.
+    padded = dict(batch)
+    input_ids = batch.get("input_ids")
+    if input_ids is None or input_ids.shape[1] >= max_seq_length:
+        return padded
+    batch_size, seq_length = input_ids.shape[:2]
+    pad_values = dict(_PAD_VALUES, input_ids=pad_token_id)
+    for key, tensor in batch.items():
+        if (
+            not torch.is_tensor(tensor)
+            or tensor.dim() < 2
+            or tuple(tensor.shape[:2]) != (batch_size, seq_length)
+            or key.startswith(_IMAGE_KEY_PREFIXES)
+        ):
+            continue
+        extra_shape = (batch_size, max_seq_length - seq_length, *tensor.shape[2:])
+        if key in pad_values:
+            extra = tensor.new_full(extra_shape, pad_values[key])
+        else:
+            extra = tensor[:, -1:].expand(extra_shape)
+        padded[key] = torch.cat([tensor, extra], dim=1)
+    return padded
+
+
+def _fits(model, collator, samples, batch_size, max_seq_length, pad_token_id):
+    batch = None
+    outputs = None
+    try:
+        batch = collator([samples[i % len(samples)] for i in range(batch_size)])
+        batch = _pad_to_length(batch, max_seq_length, pad_token_id)
+        batch = {
+            key: value.to(model.device) if torch.is_tensor(value) else value
+            for key, value in batch.items()
+        }
+        outputs = model(**batch)
+        outputs.loss.backward()
+        return True
+    except torch.cuda.OutOfMemoryError:
+        return False
+    except RuntimeError as e:
+        if "out of memory" in str(e).lower():
+            return False
+        raise
+    finally:
+        model.zero_grad(set_to_none=True)
+        del batch, outputs
+        gc.collect()
+        torch.cuda.empty_cache()
+
+
+def search_max_batch_size(fits, limit=MAX_PROBE_BATCH_SIZE):
+    """Largest batch size up to `limit` for which `fits(batch_size)` holds.
+
+    Doubles the batch size until it does not fit, then binary-searches
+    between the last size that fitted and the first that did not.
+    """
+    low, high = 0, None
+    size = 1
+    while size <= limit:
+        if fits(size):
+            low = size
+            size *= 2
+        else:
+            high = size
+            break
+    if high is None:
+        return low
+
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def find_max_batch_size(model, collator, samples, max_seq_length, pad_token_id):
+    """Largest micro-batch whose forward and backward pass fits on the device."""
+    torch.cuda.set_per_process_memory_fraction(PROBE_MEMORY_FRACTION)
+    try:
+        return search_max_batch_size(
+            lambda size: _fits(
+                model, collator, samples, size, max_seq_length, pad_token_id
+            )
+        )
+    finally:
+        torch.cuda.set_per_process_memory_fraction(1.0)
+        torch.cuda.reset_peak_memory_stats()
+
+
+def fit_micro_batch(effective_batch_size, max_micro_batch_size):
+    """Largest micro-batch up to the limit that divides the effective batch."""
+    micro = min(max_micro_batch_size, effective_batch_size)
+    while effective_batch_size % micro:
+        micro -= 1
+    return micro
+
+
+def _max_batch_size(model_name, model, tokenizer, collator, samples, max_seq_length):
+    """(largest micro-batch, source) from the cache or a probe; 0 if unknown."""
+    key = _cache_key(model_name, max_seq_length)
+    max_batch_size = _load_cache().get(key)
+    if max_batch_size is not None:
+        return max_batch_size, "cache"
+
+    pad_token_id = getattr(tokenizer, "pad_token_id", None)
+    if pad_token_id is None:
+        pad_token_id = tokenizer.tokenizer.pad_token_id
+    try:
+        max_batch_size = find_max_batch_size(
+            model, collator, samples, max_seq_length, pad_token_id
+        )
+    except Exception as e:
+        # A probe that breaks for another reason than memory must not
+        # fail the job; the requested config is still valid.
+        print(f"[BATCH PROBE] {key}: probe failed ({e}), keeping the request")
+        return 0, "requested"
+    print(f"[BATCH PROBE] {key}: max micro-batch {max_batch_size}")
+    if max_batch_size > 0:
+        _store_cache(key, max_batch_size)
+    return max_batch_size, "probe"
+
+
+def resolve_batch_config(
+    model_name,
+    model,
+    tokenizer,
+    collator,
+    samples,
+    max_seq_length,
+    micro_batch_size,
+    gradient_accumulation_steps,
+):
+    """Picks the micro-batch size and accumulation steps for a training run.
+
+    Keeps the requested effective batch (micro-batch x accumulation) but
+    replaces the micro-batch with the largest divisor of it that fits at
+    `max_seq_length` on this hardware. Probe results are cached per
+    (model, hardware, sequence length). Under torchrun only rank 0 probes
+    and writes the cache; the other ranks take its result.
+    """
+    effective_batch_size = micro_batch_size * gradient_accumulation_steps
+    requested = {
+        "micro_batch_size": micro_batch_size,
+        "gradient_accumulation_steps": gradient_accumulation_steps,
+        "effective_batch_size": effective_batch_size,
+        "source": "requested",
+    }
+    max_batch_size, source = 0, "requested"
+    if is_main_process() and AUTO_BATCH_SIZE and torch.cuda.is_available() and samples:
+        max_batch_size, source = _max_batch_size(
+            model_name, model, tokenizer, collator, samples, max_seq_length
+        )
+    # Every rank reaches the broadcast before deciding anything, so no rank
+    # can return early while the others wait in the collective.
+    max_batch_size, source = broadcast_from_main((max_batch_size, source))
+    if max_batch_size == 0:
+        return requested
+
+    # A divisor keeps micro-batch x accumulation exactly at the effective
+    # batch the config asked for.
+    micro = fit_micro_batch(effective_batch_size, max_batch_size)
+    return {
+        "micro_batch_size": micro,
+        "gradient_accumulation_steps": effective_batch_size // micro,
+        "effective_batch_size": effective_batch_size,
+        "source": source,
+    }
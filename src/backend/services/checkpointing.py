@@ -0,0 +1,334 @@
+import dataclasses
+import json
+import os
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from peft import get_peft_model_state_dict, set_peft_model_state_dict
+from safetensors.torch import load_file, save_file
+from services.training_metrics import task_status
+from transformers import TrainerCallback
+
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_STEPS = int(os.environ.get("CHECKPOINT_STEPS", "10"))
+CHECKPOINT_TOTAL_LIMIT = int(os.environ.get("CHECKPOINT_TOTAL_LIMIT", "2"))
+EARLY_STOPPING_PATIENCE = int(os.environ.get("EARLY_STOPPING_PATIENCE", "3"))
+
+RESUMABLE_STATUSES = ("FAILED", "INTERRUPTED")
+ACTIVE_STATUSES = ("QUEUED", "STARTING", "RUNNING")
+
+# Last persisted status of every task that has a spec on disk. Tasks missing
+# here (exports, evaluations) have nothing to persist.
+_persisted_statuses = {}
+
+
+def task_checkpoint_dir(task_id):
+    return os.path.join(CHECKPOINT_DIR, task_id)
+
+
+def _to_cpu(obj):
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+
+def _rng_state():
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "cpu": torch.random.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.random.get_rng_state_all()
+    return state
+
+
+class AsyncCheckpointCallback(TrainerCallback):
+    """Checkpoints the LoRA adapter and optimizer state without stalling steps.
+
+    Every `save_steps` steps the adapter weights, optimizer, LR scheduler,
+    trainer state and RNG state are copied to host memory on the training
+    thread, then written by a background thread in the layout
+    `Trainer.train(resume_from_checkpoint=...)` expects. Only the newest
+    `total_limit` checkpoints are kept.
+    """
+
+    def __init__(
+        self,
+        task_id,
+        save_steps=CHECKPOINT_STEPS,
+        total_limit=CHECKPOINT_TOTAL_LIMIT,
+    ):
+        self.task_id = task_id
+        self.save_steps = save_steps
+        self.total_limit = total_limit
+        self.output_dir = task_checkpoint_dir(task_id)
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if state.global_step == 0 or state.global_step % self.save_steps != 0:
+            return
+        # Backpressure: never hold more than one snapshot in host memory.
+        if self._pending is not None:
+            self._pending.result()
+
+        model = kwargs["model"]
+        optimizer = kwargs.get("optimizer")
+        lr_scheduler = kwargs.get("lr_scheduler")
+        snapshot = {
+            "step": state.global_step,
+            "adapter": _to_cpu(get_peft_model_state_dict(model)),
+            "adapter_config": model.peft_config[model.active_adapter],
+            "optimizer": _to_cpu(optimizer.state_dict()) if optimizer else None,
+            "scheduler": lr_scheduler.state_dict() if lr_scheduler else None,
+            "trainer_state": json.dumps(
+                dataclasses.asdict(state), indent=2, sort_keys=True
+            ),
+            "rng_state": _rng_state(),
+        }
+        self._pending = self._writer.submit(self._write, snapshot)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self._writer.shutdown(wait=True)
+
+    def _write(self, snapshot):
+        step = snapshot["step"]
+        final_dir = os.path.join(self.output_dir, f"checkpoint-{step}")
+        tmp_dir = final_dir + ".tmp"
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir, exist_ok=True)
+            save_file(
+                snapshot["adapter"],
+                os.path.join(tmp_dir, "adapter_model.safetensors"),
+                metadata={"format": "pt"},
+            )
+            snapshot["adapter_config"].save_pretrained(tmp_dir)
+            if snapshot["optimizer"] is not None:
+                torch.save(snapshot["optimizer"], os.path.join(tmp_dir, "optimizer.pt"))
+            if snapshot["scheduler"] is not None:
+                torch.save(snapshot["scheduler"], os.path.join(tmp_dir, "scheduler.pt"))
+            torch.save(snapshot["rng_state"], os.path.join(tmp_dir, "rng_state.pth"))
+            with open(os.path.join(tmp_dir, "trainer_state.json"), "w") as f:
+                f.write(snapshot["trainer_state"] + "\n")
+
+            shutil.rmtree(final_dir, ignore_errors=True)
+            os.replace(tmp_dir, final_dir)
+            print(f"[CHECKPOINT] Saved step {step} for task {self.task_id}")
+            self._rotate()
+        except Exception as e:
+            print(f"[CHECKPOINT] Failed to save step {step}: {str(e)}")
+
+    def _rotate(self):
+        checkpoints = list_checkpoints(self.task_id)
+        for stale in checkpoints[: max(len(checkpoints) - self.total_limit, 0)]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+class BestAdapterCallback(TrainerCallback):
+    """Patience-based early stopping on eval loss that keeps the best adapter.
+
+    After every evaluation the adapter weights are copied to host memory if
+    eval loss improved by more than `min_delta`; otherwise the patience
+    counter grows and training stops once it runs out. When training ends
+    the best weights are loaded back so the adapter that gets saved is the
+    best one rather than the last one.
+
+    With a `task_id` the evaluations and the best weights are also written
+    to the task's checkpoint directory (by the rank that `save`s), and
+    `restore(checkpoint)` rebuilds the state a resumed run had reached at
+    that checkpoint.
+    """
+
+    def __init__(
+        self, task_id=None, patience=EARLY_STOPPING_PATIENCE, min_delta=0.0, save=True
+    ):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.output_dir = (
+            os.path.join(task_checkpoint_dir(task_id), "early_stopping")
+            if task_id
+            else None
+        )
+        self.save = save
+        self.evals = []
+        self.best_loss = None
+        self.best_step = None
+        self.best_state = None
+        self.bad_evals = 0
+        self.stopped_at_step = None
+        self.max_steps = None
+
+    def _record(self, step, eval_loss):
+        """Counts one evaluation; True if it is a new best."""
+        self.evals.append([step, eval_loss])
+        if self.best_loss is None or eval_loss < self.best_loss - self.min_delta:
+            self.best_loss = eval_loss
+            self.best_step = step
+            self.bad_evals = 0
+            return True
+        self.bad_evals += 1
+        return False
+
+    def on_evaluate(self, args, state, control, metrics=None, **kwargs):
+        eval_loss = (metrics or {}).get("eval_loss")
+        if eval_loss is None:
+            return
+        if self._record(state.global_step, eval_loss):
+            self.best_state = _to_cpu(get_peft_model_state_dict(kwargs["model"]))
+            self._persist(weights=True)
+            return
+
+        self._persist()
+        if self.bad_evals >= self.patience:
+            print(
+                f"[EARLY STOPPING] No eval_loss improvement for {self.bad_evals} "
+                f"evaluations, stopping at step {state.global_step}"
+            )
+            self.stopped_at_step = state.global_step
+            control.should_training_stop = True
+
+    def _persist(self, weights=False):
+        if self.output_dir is None or not self.save:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        if weights:
+            path = os.path.join(self.output_dir, "adapter_model.safetensors")
+            save_file(self.best_state, path + ".tmp", metadata={"format": "pt"})
+            os.replace(path + ".tmp", path)
+        path = os.path.join(self.output_dir, "state.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"evals": self.evals, "best_step": self.best_step}, f)
+        os.replace(path + ".tmp", path)
+
+    def restore(self, checkpoint):
+        """Replays the evaluations saved up to `checkpoint`'s step."""
+        if self.output_dir is None:
+            return
+        state_path = os.path.join(self.output_dir, "state.json")
+        if not os.path.exists(state_path):
+            return
+        with open(os.path.join(checkpoint, "trainer_state.json"), "r") as f:
+            step = json.load(f)["global_step"]
+        with open(state_path, "r") as f:
+            saved = json.load(f)
+        for eval_step, eval_loss in saved["evals"]:
+            if eval_step <= step:
+                self._record(eval_step, eval_loss)
+        # The saved weights are only the right ones if the best evaluation
+        # happened before the checkpoint; otherwise the rerun finds it again.
+        weights = os.path.join(self.output_dir, "adapter_model.safetensors")
+        if self.best_step == saved["best_step"] and os.path.exists(weights):
+            self.best_state = load_file(weights)
+        print(
+            f"[EARLY STOPPING] Restored {len(self.evals)} evaluations up to step "
+            f"{step} (best step {self.best_step}, {self.bad_evals} without "
+            f"improvement)"
+        )
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self.max_steps = state.max_steps
+        if self.best_state is not None:
+            set_peft_model_state_dict(kwargs["model"], self.best_state)
+            print(
+                f"[EARLY STOPPING] Restored best adapter from step {self.best_step} "
+                f"(eval_loss={self.best_loss})"
+            )
+
+    def summary(self):
+        stopped_at = self.stopped_at_step
+        return {
+            "best_step": self.best_step,
+            "best_eval_loss": self.best_loss,
+            "stopped_early": stopped_at is not None,
+            "stopped_at_step": stopped_at,
+            "steps_saved": (self.max_steps - stopped_at) if stopped_at else 0,
+        }
+
+
+def list_checkpoints(task_id):
+    task_dir = task_checkpoint_dir(task_id)
+    if not os.path.isdir(task_dir):
+        return []
+    steps = []
+    for name in os.listdir(task_dir):
+        if name.startswith("checkpoint-") and not name.endswith(".tmp"):
+            try:
+                steps.append(int(name.split("-", 1)[1]))
+            except ValueError:
+                continue
+    return [os.path.join(task_dir, f"checkpoint-{step}") for step in sorted(steps)]
+
+
+def latest_checkpoint(task_id):
+    checkpoints = list_checkpoints(task_id)
+    return checkpoints[-1] if checkpoints else None
+
+
+def save_task_spec(task_id, spec):
+    os.makedirs(task_checkpoint_dir(task_id), exist_ok=True)
+    with open(os.path.join(task_checkpoint_dir(task_id), "task.json"), "w") as f:
+        json.dump(spec, f, indent=4)
+    _persisted_statuses[task_id] = spec.get("status")
+
+
+def load_task_spec(task_id):
+    path = os.path.join(task_checkpoint_dir(task_id), "task.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def persist_task_status(task_id, status):
+    """task_status listener that records status transitions next to the spec.
+
+    Only tasks whose spec was saved or recovered by this process are tracked,
+    so progress updates of other tasks never touch the disk.
+    """
+    if (
+        not status
+        or task_id not in _persisted_statuses
+        or _persisted_statuses[task_id] == status.get("status")
+    ):
+        return
+    spec = load_task_spec(task_id)
+    if spec is None:
+        del _persisted_statuses[task_id]
+        return
+    spec["status"] = status.get("status")
+    spec["error"] = status.get("error")
+    save_task_spec(task_id, spec)
+
+
+def recover_interrupted_tasks():
+    """Marks tasks that were active when the server last stopped as INTERRUPTED."""
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return []
+    recovered = []
+    for task_id in os.listdir(CHECKPOINT_DIR):
+        spec = load_task_spec(task_id)
+        if spec is None or task_id in task_status:
+            continue
+        status = spec.get("status")
+        _persisted_statuses[task_id] = status
+        if status in ACTIVE_STATUSES:
+            status = "INTERRUPTED"
+            recovered.append(task_id)
+        task_status[task_id] = {
+            "status": status,
+            "progress": 100 if status == "COMPLETED" else 0,
+            "error": spec.get("error"),
+            "latest_checkpoint": latest_checkpoint(task_id),
+        }
+    if recovered:
+        print(f"[CHECKPOINT] Recovered interrupted tasks: {recovered}")
+    return recovered
@@ -0,0 +1,360 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from fastapi import HTTPException
+from services.checkpointing import (
+    CHECKPOINT_STEPS,
+    AsyncCheckpointCallback,
+    BestAdapterCallback,
+    task_checkpoint_dir,
+)
+from services.training_metrics import ProgressCallback, task_status, trained_models
+
+DISTRIBUTED_BACKEND = os.environ.get("DISTRIBUTED_BACKEND", "nccl")
+DISTRIBUTED_NNODES = int(os.environ.get("DISTRIBUTED_NNODES", "1"))
+DISTRIBUTED_NODE_RANK = int(os.environ.get("DISTRIBUTED_NODE_RANK", "0"))
+DISTRIBUTED_MASTER_ADDR = os.environ.get("DISTRIBUTED_MASTER_ADDR", "127.0.0.1")
+DISTRIBUTED_MASTER_PORT = int(os.environ.get("DISTRIBUTED_MASTER_PORT", "29500"))
+STATUS_POLL_SECONDS = 1.0
+
+DISTRIBUTED_TARGETS = (
+    "train_model",
+    "train_model_with_goal",
+    "train_adapt_model",
+    "smoke_test",
+)
+
+
+def is_main_process():
+    return int(os.environ.get("RANK", "0")) == 0
+
+
+def broadcast_from_main(obj):
+    """Returns rank 0's `obj` on every rank (a no-op outside torchrun)."""
+    import torch.distributed as dist
+
+    if not (dist.is_available() and dist.is_initialized()):
+        return obj
+    payload = [obj]
+    dist.broadcast_object_list(payload, src=0)
+    return payload[0]
+
+
+def add_training_callbacks(
+    trainer, task_id, resume_from_checkpoint=None, save_steps=CHECKPOINT_STEPS
+):
+    """Adds the progress, checkpoint and early-stopping callbacks of a run.
+
+    Every rank tracks progress and early stopping, and since eval metrics are
+    gathered across ranks they all stop at the same step; only rank 0 writes
+    checkpoints and the early-stopping state. Returns the BestAdapterCallback.
+    """
+    trainer.add_callback(ProgressCallback(task_id, trainer.args.max_steps))
+    if is_main_process():
+        trainer.add_callback(AsyncCheckpointCallback(task_id, save_steps=save_steps))
+    best_adapter = BestAdapterCallback(task_id, save=is_main_process())
+    if resume_from_checkpoint:
+        best_adapter.restore(resume_from_checkpoint)
+    trainer.add_callback(best_adapter)
+    return best_adapter
+
+
+def save_on_main_process(task_id, app_name, model, tokenizer, status):
+    """Saves a finished train_model* run and marks it COMPLETED with `status`.
+
+    Under torchrun every rank has trained the same weights, so only rank 0
+    saves, reports and registers the model. Returns the saved path there and
+    None on the other ranks.
+    """
+    if not is_main_process():
+        return None
+
+    print("[SAVING MODEL] Saving model and tokenizer.")
+    task_path = f"outputs/{app_name}"
+    model.save_pretrained(
+        task_path,
+        safe_serialization=True,
+        save_adapter=True,  # Critical for PEFT
+    )
+    tokenizer.save_pretrained(task_path)
+
+    task_status[task_id] = {
+        "status": "COMPLETED",
+        "progress": 100,
+        "error": None,
+        **status,
+    }
+    trained_models[task_id] = task_path
+    return task_path
+
+
+def _status_file(task_id):
+    return os.path.join(task_checkpoint_dir(task_id), "distributed_status.jsonl")
+
+
+def distributed_spec_path(task_id):
+    return os.path.join(task_checkpoint_dir(task_id), "distributed_job.json")
+
+
+def torchrun_command(spec_path, nproc_per_node, node_rank=DISTRIBUTED_NODE_RANK):
+    """The torchrun invocation for one node; other nodes run it with their rank."""
+    return [
+        sys.executable,
+        "-m",
+        "torch.distributed.run",
+        f"--nproc_per_node={nproc_per_node}",
+        f"--nnodes={DISTRIBUTED_NNODES}",
+        f"--node_rank={node_rank}",
+        f"--master_addr={DISTRIBUTED_MASTER_ADDR}",
+        f"--master_port={DISTRIBUTED_MASTER_PORT}",
+        "-m",
+        "services.distributed_training",
+        spec_path,
+    ]
+
+
+def _forward_statuses(task_id, offset, distributed_info):
+    """Mirrors rank 0's status lines written since `offset` into task_status."""
+    path = _status_file(task_id)
+    if not os.path.exists(path):
+        return offset
+    with open(path, "r") as f:
+        f.seek(offset)
+        chunk = f.read()
+    # Only consume complete lines; a partial one is picked up next time.
+    complete = chunk[: chunk.rfind("\n") + 1]
+    for line in complete.splitlines():
+        record = json.loads(line)
+        if "trained_model" in record:
+            trained_models[task_id] = record["trained_model"]
+        else:
+            task_status[task_id] = dict(record["status"], distributed=distributed_info)
+    return offset + len(complete)
+
+
+def run_distributed(
+    task_id: str,
+    target: str,
+    kwargs: dict,
+    nproc_per_node: int,
+    backend: str = DISTRIBUTED_BACKEND,
+    resume_from_checkpoint: str = None,
+):
+    """Runs one of the train_model* functions data-parallel under torchrun.
+
+    Each rank runs the target function with the same arguments; the Trainer
+    shards the training set per rank and all-reduces gradients, and only
+    rank 0 saves, checkpoints and reports status. Rank 0's status is passed
+    back through a JSONL file next to the task spec and mirrored into
+    task_status here.
+    """
+    if target not in DISTRIBUTED_TARGETS:
+        raise HTTPException(status_code=400, detail=f"Cannot distribute {target}")
+
+    kwargs = dict(kwargs)
+    if resume_from_checkpoint:
+        kwargs["resume_from_checkpoint"] = resume_from_checkpoint
+
+    os.makedirs(task_checkpoint_dir(task_id), exist_ok=True)
+    spec_path = distributed_spec_path(task_id)
+    with open(spec_path, "w") as f:
+        json.dump(
+            {
+                "task_id": task_id,
+                "target": target,
+                "kwargs": kwargs,
+                "backend": backend,
+            },
+            f,
+            indent=4,
+        )
+    if os.path.exists(_status_file(task_id)):
+        os.remove(_status_file(task_id))
+
+    distributed_info = {
+        "nproc_per_node": nproc_per_node,
+        "nnodes": DISTRIBUTED_NNODES,
+        "world_size": nproc_per_node * DISTRIBUTED_NNODES,
+        "backend": backend,
+    }
+    task_status[task_id] = {
+        "status": "RUNNING",
+        "progress": 0,
+        "error": None,
+        "distributed": distributed_info,
+    }
+
+    command = torchrun_command(spec_path, nproc_per_node)
+    print(f"[DISTRIBUTED] Task {task_id}: {' '.join(command)}")
+    log_path = os.path.join(task_checkpoint_dir(task_id), "torchrun.log")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        offset = 0
+        while True:
+            exited = process.poll() is not None
+            offset = _forward_statuses(task_id, offset, distributed_info)
+            if exited:
+                break
+            time.sleep(STATUS_POLL_SECONDS)
+
+    status = task_status.get(task_id, {})
+    if process.returncode != 0 and status.get("status") != "COMPLETED":
+        with open(log_path, "r") as f:
+            tail = f.read()[-2000:]
+        task_status[task_id] = {
+            "status": "FAILED",
+            "progress": 0,
+            "error": status.get("error")
+            or f"torchrun exited with code {process.returncode}: {tail}",
+            "distributed": distributed_info,
+        }
+
+
+def run_smoke_test(task_id, max_steps=20, num_samples=64, app_name="ddp_smoke_test"):
+    """Trains a LoRA adapter on a tiny randomly initialised GPT-2.
+
+    Goes through the same rank logic as the train_model* functions (batch
+    config broadcast, sharded sampling, gradient all-reduce, gathered
+    evaluation with early stopping, rank-0 checkpointing, saving and status)
+    on CPU with gloo, without GPUs or model downloads.
+    """
+    import torch
+    import torch.distributed as dist
+    from datasets import Dataset
+    from peft import LoraConfig, get_peft_model
+    from services.batch_size_finder import resolve_batch_config
+    from tokenizers import Tokenizer, models
+    from transformers import (
+        GPT2Config,
+        GPT2LMHeadModel,
+        PreTrainedTokenizerFast,
+        Trainer,
+        TrainingArguments,
+    )
+
+    torch.manual_seed(3407)
+    model = GPT2LMHeadModel(
+        GPT2Config(vocab_size=128, n_positions=32, n_embd=32, n_layer=2, n_head=2)
+    )
+    model = get_peft_model(
+        model,
+        LoraConfig(
+            r=4,
+            lora_alpha=4,
+            target_modules=["c_attn"],
+            fan_in_fan_out=True,
+            task_type="CAUSAL_LM",
+        ),
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=Tokenizer(
+            models.WordLevel({str(i): i for i in range(128)}, unk_token="0")
+        )
+    )
+    tokens = torch.randint(
+        0, 128, (num_samples, 16), generator=torch.Generator().manual_seed(0)
+    ).tolist()
+    dataset = Dataset.from_dict({"input_ids": tokens, "labels": tokens})
+    eval_dataset = dataset.select(range(min(8, num_samples)))
+    eval_steps = max(max_steps // 2, 1)
+
+    task_status[task_id] = {"status": "RUNNING", "progress": 0, "error": None}
+    # No CUDA, so every rank gets the requested layout through the broadcast.
+    batch_config = resolve_batch_config(
+        app_name,
+        model,
+        tokenizer,
+        None,
+        dataset,
+        max_seq_length=16,
+        micro_batch_size=4,
+        gradient_accumulation_steps=1,
+    )
+    trainer = Trainer(
+        model=model,
+        train_dataset=dataset,
+        eval_dataset=eval_dataset,
+        args=TrainingArguments(
+            output_dir=f"outputs/{app_name}",
+            per_device_train_batch_size=batch_config["micro_batch_size"],
+            gradient_accumulation_steps=batch_config["gradient_accumulation_steps"],
+            max_steps=max_steps,
+            learning_rate=1e-3,
+            logging_steps=1,
+            save_strategy="no",
+            eval_strategy="steps",
+            eval_steps=eval_steps,
+            per_device_eval_batch_size=4,
+            report_to="none",
+            use_cpu=True,
+            ddp_backend="gloo",
+        ),
+    )
+    best_adapter = add_training_callbacks(trainer, task_id, save_steps=eval_steps)
+    trainer.train()
+
+    world_size = dist.get_world_size() if dist.is_initialized() else 1
+    save_on_main_process(
+        task_id,
+        app_name,
+        model,
+        tokenizer,
+        {
+            "metrics": {
+                "world_size": world_size,
+                "batches_per_rank": len(trainer.get_train_dataloader()),
+                "samples_per_step": batch_config["effective_batch_size"] * world_size,
+                "train_loss": trainer.state.log_history[-1].get("train_loss"),
+                "early_stopping": best_adapter.summary(),
+            },
+            "log_history": trainer.state.log_history,
+        },
+    )
+
+
+def main(spec_path):
+    import torch
+    import torch.distributed as dist
+
+    with open(spec_path, "r") as f:
+        spec = json.load(f)
+    task_id = spec["task_id"]
+
+    if spec["backend"] == "nccl":
+        torch.cuda.set_device(int(os.environ.get("LOCAL_RANK", "0")))
+    # Initialised up front so batch probing can agree across ranks before the
+    # Trainer exists; accelerate reuses the existing process group.
+    dist.init_process_group(spec["backend"])
+
+    if is_main_process():
+
+        def forward_status(tid, status):
+            with open(_status_file(tid), "a") as f:
+                f.write(json.dumps({"status": status}, default=str) + "\n")
+
+        task_status.add_listener(forward_status)
+
+    try:
+        if spec["target"] == "smoke_test":
+            run_smoke_test(**spec["kwargs"])
+        else:
+            from services import training
+
+            getattr(training, spec["target"])(**spec["kwargs"])
+        if is_main_process() and task_id in trained_models:
+            with open(_status_file(task_id), "a") as f:
+                f.write(json.dumps({"trained_model": trained_models[task_id]}) + "\n")
+    finally:
+        dist.destroy_process_group()
+
+    # The train functions catch their own errors; exit non-zero so torchrun
+    # tears down the other ranks instead of leaving them in a collective.
+    if task_status.get(task_id, {}).get("status") == "FAILED":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
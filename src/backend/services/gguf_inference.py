@@ -0,0 +1,175 @@
+import base64
+import glob
+import os
+import threading
+from io import BytesIO
+
+from services.inference_device import cpu_threads
+from services.multi_lora import adapter_base_model
+from services.save import EXPORT_DIR
+
+try:
+    from llama_cpp import Llama, llama_chat_format
+except ImportError:  # Optional: only needed for INFERENCE_CPU_BACKEND=gguf.
+    Llama = None
+
+# Preferred quantization when an export holds several GGUF files.
+GGUF_QUANT = os.environ.get("GGUF_QUANT", "q4_k_m")
+GGUF_CONTEXT = int(os.environ.get("GGUF_CONTEXT", "4096"))
+
+# llama-cpp-python chat handler per base model family; it must match the
+# model's image prompt format. Llama 3.2 Vision and Pixtral have none, so
+# their exports only answer text questions.
+GGUF_CHAT_HANDLERS = (
+    ("qwen2-vl", "Qwen25VLChatHandler"),  # Same image tokens as Qwen2.5-VL
+    ("llava", "Llava15ChatHandler"),
+)
+
+
+def find_gguf_export(app_name, export_dir=EXPORT_DIR, quant=GGUF_QUANT):
+    """Newest GGUF export of an app as (model_path, mmproj_path or None)."""
+    exports = sorted(
+        glob.glob(os.path.join(export_dir, f"{app_name}_*")),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for export_path in exports:
+        files = sorted(glob.glob(os.path.join(export_path, "*.gguf")))
+        projectors = [f for f in files if "mmproj" in os.path.basename(f).lower()]
+        models = [f for f in files if f not in projectors]
+        if not models:
+            continue
+        preferred = [f for f in models if quant.lower() in os.path.basename(f).lower()]
+        return (preferred or models)[0], (projectors[0] if projectors else None)
+    raise FileNotFoundError(
+        f"No GGUF export found for {app_name} in {export_dir}; export it with "
+        "/save-gguf first"
+    )
+
+
+def chat_handler_name(base_model):
+    base_model = (base_model or "").lower()
+    for family, handler_name in GGUF_CHAT_HANDLERS:
+        if family in base_model:
+            return handler_name
+    return None
+
+
+def _base_model(app_name):
+    try:
+        return adapter_base_model(app_name)
+    except FileNotFoundError:
+        return None
+
+
+def _image_url(image):
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def _completion_kwargs(generation_kwargs):
+    kwargs = {"max_tokens": generation_kwargs.get("max_new_tokens", 128)}
+    if generation_kwargs.get("do_sample") is False:
+        kwargs["temperature"] = 0.0
+    else:
+        kwargs["temperature"] = generation_kwargs.get("temperature", 1.0)
+        kwargs["min_p"] = generation_kwargs.get("min_p", 0.05)
+    return kwargs
+
+
+class GGUFBackend:
+    """Serves fine-tuned apps from their GGUF exports with llama.cpp.
+
+    Images need the export's vision projector (mmproj) and a chat handler
+    for the app's base model; without them only text questions can be
+    answered. One llama.cpp context is kept per app and calls on it are
+    serialized, as a context is not thread-safe.
+    """
+
+    def __init__(self, threads=None):
+        self.threads = threads
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def load(self, app_name):
+        if Llama is None:
+            raise RuntimeError(
+                "INFERENCE_CPU_BACKEND=gguf needs llama-cpp-python: "
+                "pip install llama-cpp-python"
+            )
+        with self._lock:
+            entry = self._models.get(app_name)
+            if entry is None:
+                model_path, mmproj_path = find_gguf_export(app_name)
+                base_model = _base_model(app_name)
+                handler, vision_error = None, None
+                handler_name = chat_handler_name(base_model)
+                handler_class = handler_name and getattr(
+                    llama_chat_format, handler_name, None
+                )
+                if mmproj_path is None:
+                    vision_error = "has no vision projector (mmproj)"
+                elif handler_class is None:
+                    vision_error = (
+                        f"is based on {base_model or 'an unknown model'}, which "
+                        "llama-cpp-python has no image chat handler for"
+                    )
+                else:
+                    handler = handler_class(clip_model_path=mmproj_path, verbose=False)
+                entry = {
+                    "llm": Llama(
+                        model_path=model_path,
+                        chat_handler=handler,
+                        n_ctx=GGUF_CONTEXT,
+                        n_threads=self.threads or cpu_threads(),
+                        verbose=False,
+                    ),
+                    "model_path": model_path,
+                    "base_model": base_model,
+                    "vision": handler is not None,
+                    "vision_error": vision_error,
+                    "lock": threading.Lock(),
+                }
+                self._models[app_name] = entry
+                print(f"[INFERENCE] Loaded GGUF {model_path} for {app_name}")
+            return entry
+
+    def stream(self, app_name, image, question, generation_kwargs):
+        """Yields the answer's text chunks as llama.cpp produces them."""
+        entry = self.load(app_name)
+        content = [{"type": "text", "text": question}]
+        if image is not None:
+            if not entry["vision"]:
+                raise ValueError(
+                    f"The GGUF export of {app_name} {entry['vision_error']}"
+                )
+            content.insert(0, {"type": "image_url", "image_url": _image_url(image)})
+
+        with entry["lock"]:
+            chunks = entry["llm"].create_chat_completion(
+                messages=[{"role": "user", "content": content}],
+                stream=True,
+                **_completion_kwargs(generation_kwargs),
+            )
+            for chunk in chunks:
+                text = chunk["choices"][0]["delta"].get("content")
+                if text:
+                    yield text
+
+    def answer(self, app_name, image, question, generation_kwargs):
+        return "".join(self.stream(app_name, image, question, generation_kwargs))
+
+    def describe(self):
+        with self._lock:
+            return {
+                app_name: {
+                    "model_path": entry["model_path"],
+                    "base_model": entry["base_model"],
+                    "vision": entry["vision"],
+                }
+                for app_name, entry in self._models.items()
+            }
+
+
+gguf_backend = GGUFBackend()
@@ -0,0 +1,258 @@
+import itertools
+import math
+import os
+import random
+import shutil
+import traceback
+
+from fastapi import HTTPException
+from services.model_pool import base_model_pool
+from services.training_metrics import task_status
+from sklearn.model_selection import train_test_split
+from utils.config_loader import append_model_config, load_model_config
+from utils.dataset_utils import get_custom_dataset
+
+SEARCH_OUTPUT_DIR = os.path.join("outputs", "hparam_search")
+
+SEARCH_SPACE = {
+    "learning_rate": [5e-5, 1e-4, 2e-4, 3e-4],
+    "lora_rank": [8, 16, 32],
+    "batch_size": [1, 2, 4],
+}
+
+
+def sample_configs(base_config, num_trials, seed=3407):
+    grid = [
+        dict(zip(SEARCH_SPACE.keys(), values))
+        for values in itertools.product(*SEARCH_SPACE.values())
+    ]
+    picked = random.Random(seed).sample(grid, min(num_trials, len(grid)))
+    return [dict(base_config, **values) for values in picked]
+
+
+def trial_step_budget(min_steps, eta, max_trial_steps=None):
+    """Largest per-trial step budget; defaults to three rungs of halving."""
+    if eta < 2 or min_steps < 1:
+        raise ValueError("eta must be at least 2 and min_steps at least 1")
+    if max_trial_steps is None:
+        max_trial_steps = min_steps * eta**2
+    if max_trial_steps < min_steps * eta:
+        raise ValueError(
+            f"max_trial_steps must be at least min_steps * eta "
+            f"({min_steps * eta}) for the search to run more than one rung"
+        )
+    return max_trial_steps
+
+
+def successive_halving(configs, evaluate, min_steps, max_steps, eta=3):
+    """Runs successive halving over `configs` and returns (winner, rungs).
+
+    Every surviving config is trained up to the rung's step budget and scored
+    with `evaluate(trial, config, steps, from_steps)` (lower is better).
+    `trial` is the config's index in `configs` and `from_steps` the budget it
+    reached in the previous rung (0 in the first), so a survivor continues
+    from where it stopped instead of retraining. The best 1/eta move on with
+    eta times the budget until one config is left or the next budget would
+    exceed `max_steps`.
+    """
+    survivors = list(enumerate(configs))
+    steps, from_steps = min_steps, 0
+    rungs = []
+    while True:
+        scored = sorted(
+            (
+                (evaluate(trial, config, steps, from_steps), trial, config)
+                for trial, config in survivors
+            ),
+            key=lambda item: item[:2],
+        )
+        rungs.append(
+            {
+                "steps": steps,
+                "trials": [
+                    {"trial": trial, "config": config, "eval_loss": loss}
+                    for loss, trial, config in scored
+                ],
+            }
+        )
+        keep = max(len(survivors) // eta, 1)
+        survivors = [(trial, config) for _, trial, config in scored[:keep]]
+        if keep == 1 or steps * eta > max_steps:
+            return survivors[0][1], rungs
+        steps, from_steps = steps * eta, steps
+
+
+def _run_trial(
+    model_name,
+    train_dataset,
+    eval_dataset,
+    config,
+    max_steps,
+    output_dir,
+    warmup_steps,
+    resume_from_checkpoint=None,
+):
+    # The search logic above is importable without a GPU; the training stack
+    # is only needed once a trial runs.
+    from unsloth import FastVisionModel, is_bf16_supported
+    from unsloth.trainer import UnslothVisionDataCollator
+    from trl import SFTConfig, SFTTrainer
+
+    model = None
+    try:
+        model, tokenizer = base_model_pool.acquire(model_name, training=True)
+        model = FastVisionModel.get_peft_model(
+            model,
+            finetune_vision_layers=False,
+            finetune_language_layers=True,
+            finetune_attention_modules=True,
+            finetune_mlp_modules=True,
+            r=config["lora_rank"],
+            lora_alpha=config["lora_rank"],
+            lora_dropout=0,
+            bias="none",
+            random_state=3407,
+            use_rslora=False,
+            loftq_config=None,
+        )
+        FastVisionModel.for_training(model)
+
+        trainer = SFTTrainer(
+            model=model,
+            tokenizer=tokenizer,
+            data_collator=UnslothVisionDataCollator(model, tokenizer),
+            train_dataset=train_dataset,
+            eval_dataset=eval_dataset,
+            args=SFTConfig(
+                per_device_train_batch_size=config["batch_size"],
+                gradient_accumulation_steps=4,
+                # Fixed across rungs so a resumed trial keeps its schedule.
+                warmup_steps=warmup_steps,
+                max_steps=max_steps,
+                learning_rate=config["learning_rate"],
+                fp16=not is_bf16_supported() if config["mixed_precision"] else False,
+                bf16=is_bf16_supported() if config["mixed_precision"] else False,
+                logging_steps=1,
+                optim="adamw_8bit",
+                output_dir=output_dir,
+                remove_unused_columns=False,
+                dataset_kwargs={"skip_prepare_dataset": True},
+                dataset_num_proc=4,
+                max_seq_length=config["sequence_length"],
+                per_device_eval_batch_size=config["batch_size"],
+                # One checkpoint at the end of the rung for the next to resume.
+                save_strategy="steps",
+                save_steps=max_steps,
+                save_total_limit=1,
+                report_to="none",
+            ),
+        )
+        trainer.train(resume_from_checkpoint=resume_from_checkpoint)
+        return trainer.evaluate()["eval_loss"]
+    except Exception as e:
+        print(f"[SEARCH] Trial {config} failed: {str(e)}")
+        return math.inf
+    finally:
+        if model is not None:
+            base_model_pool.release(model_name, model)
+
+
+def run_hyperparameter_search(
+    task_id: str,
+    model_name: str,
+    dataset_path: str,
+    goal_type: str,
+    target: str,
+    app_name: str,
+    num_trials: int = 9,
+    eta: int = 3,
+    min_steps: int = 5,
+    subset_size: int = 64,
+    max_trial_steps: int = None,
+):
+    from services.training import AVAILABLE_MODELS, train_model_with_goal
+
+    if model_name not in AVAILABLE_MODELS:
+        raise HTTPException(status_code=400, detail="Invalid model name")
+
+    json_file_path = os.path.join("jsons", f"{dataset_path}.json")
+    root_folder = os.path.join("datasets", dataset_path)
+
+    if not os.path.exists(json_file_path) or not os.path.exists(root_folder):
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    max_trial_steps = trial_step_budget(min_steps, eta, max_trial_steps)
+    base_config = load_model_config(model_name, goal_type, target)
+    configs = sample_configs(base_config, num_trials)
+    print(
+        f"[SEARCH] Task {task_id}: {len(configs)} trials, eta={eta}, "
+        f"{min_steps}-{max_trial_steps} steps per trial"
+    )
+
+    task_status[task_id] = {
+        "status": "SEARCHING",
+        "progress": 0,
+        "error": None,
+        "search": {"trials_run": 0, "rungs": []},
+    }
+
+    converted_dataset = get_custom_dataset(json_file_path, root_folder)
+    train_dataset, eval_dataset = train_test_split(
+        converted_dataset, test_size=0.2, random_state=42
+    )
+    rng = random.Random(3407)
+    train_subset = rng.sample(train_dataset, min(subset_size, len(train_dataset)))
+    eval_subset = rng.sample(eval_dataset, min(subset_size // 4, len(eval_dataset)))
+
+    search_dir = os.path.join(SEARCH_OUTPUT_DIR, task_id)
+    warmup_steps = min(5, min_steps // 2)
+    trials_run = 0
+
+    def evaluate(trial, config, steps, from_steps):
+        nonlocal trials_run
+        output_dir = os.path.join(search_dir, f"trial-{trial}")
+        checkpoint = os.path.join(output_dir, f"checkpoint-{from_steps}")
+        loss = _run_trial(
+            model_name,
+            train_subset,
+            eval_subset,
+            config,
+            steps,
+            output_dir,
+            warmup_steps,
+            resume_from_checkpoint=checkpoint if os.path.isdir(checkpoint) else None,
+        )
+        trials_run += 1
+        print(f"[SEARCH] Trial {trial}, {steps} steps, eval_loss={loss}: {config}")
+        task_status.update_task(
+            task_id, search=dict(task_status[task_id]["search"], trials_run=trials_run)
+        )
+        return loss
+
+    try:
+        winner, rungs = successive_halving(
+            configs,
+            evaluate,
+            min_steps=min_steps,
+            max_steps=max_trial_steps,
+            eta=eta,
+        )
+    except Exception as e:
+        traceback.print_exc()
+        task_status[task_id] = {"status": "FAILED", "progress": 0, "error": str(e)}
+        raise
+    finally:
+        shutil.rmtree(search_dir, ignore_errors=True)
+
+    search_summary = {"trials_run": trials_run, "rungs": rungs, "winner": winner}
+    print(f"[SEARCH] Winner: {winner}")
+
+    # Only the winner is trained to completion on the full dataset.
+    train_model_with_goal(
+        task_id, model_name, dataset_path, goal_type, target, app_name, config=winner
+    )
+
+    if task_status[task_id]["status"] == "COMPLETED":
+        row = append_model_config(model_name, goal_type, target, winner)
+        print(f"[SEARCH] Appended searched config: {row}")
+    task_status.update_task(task_id, search=search_summary)
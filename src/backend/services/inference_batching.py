@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from collections import Counter
+
+from services.inference_executor import inference_executor
+
+INFERENCE_BATCHING = os.environ.get("INFERENCE_BATCHING", "1") == "1"
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "20"))
+
+
+class DynamicBatcher:
+    """Coalesces concurrent requests for one model into batched generates.
+
+    The first queued request opens a batch, which closes once it holds
+    `max_batch_size` requests or `max_wait_ms` has passed. The batch runs on
+    the model's inference executor through `run_batch(key, images, questions)`
+    and each caller gets its own answer back. Only one batch per model is in flight,
+    so requests that arrive meanwhile form the next batch.
+    """
+
+    def __init__(
+        self,
+        key,
+        run_batch,
+        max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms=INFERENCE_MAX_WAIT_MS,
+    ):
+        self.key = key
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = asyncio.Queue()
+        self._worker = None
+        self.batch_sizes = Counter()
+        self.queue_depths = Counter()
+        self.stats = {
+            "requests": 0,
+            "dispatched": 0,
+            "batches": 0,
+            "total_wait_ms": 0.0,
+        }
+
+    async def submit(self, image, question):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, question, future, time.perf_counter()))
+        self.stats["requests"] += 1
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Requests whose client went away are dropped before generating.
+            batch = [request for request in batch if not request[2].cancelled()]
+            if not batch:
+                continue
+
+            now = time.perf_counter()
+            self.batch_sizes[len(batch)] += 1
+            self.queue_depths[len(batch) + self._queue.qsize()] += 1
+            self.stats["batches"] += 1
+            self.stats["dispatched"] += len(batch)
+            self.stats["total_wait_ms"] += sum(
+                (now - request[3]) * 1000 for request in batch
+            )
+
+            images = [request[0] for request in batch]
+            questions = [request[1] for request in batch]
+            try:
+                answers = await inference_executor.run(
+                    self.key, self.run_batch, self.key, images, questions
+                )
+            except Exception as e:
+                for request in batch:
+                    if not request[2].done():
+                        request[2].set_exception(e)
+                continue
+            for request, answer in zip(batch, answers):
+                if not request[2].done():
+                    request[2].set_result(answer)
+
+    def describe(self):
+        requests = self.stats["requests"]
+        dispatched = self.stats["dispatched"]
+        batches = self.stats["batches"]
+        return {
+            "queue_depth": self._queue.qsize(),
+            "requests": requests,
+            "batches": batches,
+            "mean_batch_size": round(dispatched / batches, 3) if batches else 0.0,
+            "mean_wait_ms": (
+                round(self.stats["total_wait_ms"] / dispatched, 3)
+                if dispatched
+                else 0.0
+            ),
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "queue_depth_histogram": dict(sorted(self.queue_depths.items())),
+        }
+
+
+class BatchingRegistry:
+    """One DynamicBatcher per loaded model, created on first request."""
+
+    def __init__(self, run_batch):
+        self.run_batch = run_batch
+        self._batchers = {}
+
+    async def submit(self, key, image, question):
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            batcher = self._batchers[key] = DynamicBatcher(key, self.run_batch)
+        return await batcher.submit(image, question)
+
+    def describe(self):
+        return {
+            "enabled": INFERENCE_BATCHING,
+            "max_batch_size": INFERENCE_MAX_BATCH_SIZE,
+            "max_wait_ms": INFERENCE_MAX_WAIT_MS,
+            "models": {
+                key: batcher.describe() for key, batcher in self._batchers.items()
+            },
+        }
@@ -0,0 +1,97 @@
+import json
+import os
+
+import psutil
+import torch
+
+# "auto" serves on CUDA when a GPU is visible and on the CPU otherwise.
+INFERENCE_DEVICE_SETTING = os.environ.get("INFERENCE_DEVICE", "auto")
+# CPU runtime: "int8" dynamically quantizes Linear layers, "fp32" keeps full
+# precision and "gguf" serves each app's GGUF export through llama.cpp.
+INFERENCE_CPU_BACKEND = os.environ.get("INFERENCE_CPU_BACKEND", "int8")
+# 0 uses one thread per physical core.
+INFERENCE_CPU_THREADS = int(os.environ.get("INFERENCE_CPU_THREADS", "0"))
+
+CPU_BACKENDS = ("int8", "fp32", "gguf")
+
+
+def resolve_device(setting=INFERENCE_DEVICE_SETTING):
+    if setting == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if setting not in ("cuda", "cpu"):
+        raise ValueError(f"Unknown inference device: {setting}")
+    return setting
+
+
+INFERENCE_DEVICE = resolve_device()
+
+if INFERENCE_CPU_BACKEND not in CPU_BACKENDS:
+    raise ValueError(f"Unknown CPU inference backend: {INFERENCE_CPU_BACKEND}")
+
+
+def cpu_threads():
+    if INFERENCE_CPU_THREADS > 0:
+        return INFERENCE_CPU_THREADS
+    # Hyperthreads share the vector units, so matmul-bound inference scales
+    # with physical cores.
+    return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+
+
+def configure_cpu_threads(threads=None):
+    threads = threads or cpu_threads()
+    torch.set_num_threads(threads)
+    return threads
+
+
+def cpu_model_name(model_name):
+    # bitsandbytes 4-bit checkpoints need CUDA; on the CPU the full-precision
+    # original is loaded instead.
+    return model_name.removesuffix("-bnb-4bit")
+
+
+def load_cpu_model(model_name_or_path, backend=INFERENCE_CPU_BACKEND):
+    """Loads a base model or a trained app directory for CPU inference.
+
+    An app's LoRA adapter is merged into its full-precision base. With the
+    int8 backend every Linear layer is then dynamically quantized, which
+    roughly quarters the weights and speeds up the matmuls. The gguf backend
+    only covers apps with an export, so base models fall back to int8.
+    """
+    from peft import PeftModel
+    from transformers import AutoModelForVision2Seq, AutoProcessor
+
+    configure_cpu_threads()
+    adapter_config = os.path.join(model_name_or_path, "adapter_config.json")
+    if os.path.exists(adapter_config):
+        with open(adapter_config, "r") as f:
+            base = json.load(f)["base_model_name_or_path"]
+        model = AutoModelForVision2Seq.from_pretrained(
+            cpu_model_name(base), torch_dtype=torch.float32
+        )
+        model = PeftModel.from_pretrained(model, model_name_or_path).merge_and_unload()
+        processor = AutoProcessor.from_pretrained(model_name_or_path)
+    else:
+        name = cpu_model_name(model_name_or_path)
+        model = AutoModelForVision2Seq.from_pretrained(name, torch_dtype=torch.float32)
+        processor = AutoProcessor.from_pretrained(name)
+
+    model.eval()
+    if backend != "fp32":
+        torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    print(f"[INFERENCE] Loaded {model_name_or_path} on CPU ({backend})")
+    return model, processor
+
+
+def describe():
+    info = {"device": INFERENCE_DEVICE, "setting": INFERENCE_DEVICE_SETTING}
+    if INFERENCE_DEVICE == "cpu":
+        info.update(
+            cpu_backend=INFERENCE_CPU_BACKEND,
+            threads=torch.get_num_threads(),
+            physical_cores=psutil.cpu_count(logical=False),
+        )
+    else:
+        info["gpu"] = torch.cuda.get_device_name(0)
+    return info
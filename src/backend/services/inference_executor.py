@@ -0,0 +1,63 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads per model. One keeps generate calls on a model strictly serial.
+INFERENCE_THREADS_PER_MODEL = int(os.environ.get("INFERENCE_THREADS_PER_MODEL", "1"))
+
+
+class InferenceExecutor:
+    """Runs blocking model calls off the event loop, serialized per model.
+
+    Each model key gets its own small thread pool, so a long generate on one
+    model queues only requests for that model while the event loop keeps
+    serving every other endpoint. A pool is shut down once it has no pending
+    calls, so keys taken from requests cannot pile up idle threads. run() is
+    awaitable and returns the call's result or raises its exception.
+    """
+
+    def __init__(self, threads_per_model=INFERENCE_THREADS_PER_MODEL):
+        self.threads_per_model = threads_per_model
+        self._executors = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _executor(self, key):
+        with self._lock:
+            executor = self._executors.get(key)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=self.threads_per_model,
+                    thread_name_prefix=f"inference-{key}",
+                )
+                self._executors[key] = executor
+                self._pending[key] = 0
+            self._pending[key] += 1
+            return executor
+
+    def _done(self, key):
+        with self._lock:
+            self._pending[key] -= 1
+            if self._pending[key] == 0:
+                del self._pending[key]
+                # Runs on the pool's own thread, so it must not wait for it.
+                self._executors.pop(key).shutdown(wait=False)
+
+    def submit(self, key, fn, *args, **kwargs):
+        future = self._executor(key).submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._done(key))
+        return future
+
+    async def run(self, key, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(key, fn, *args, **kwargs))
+
+    def describe(self):
+        with self._lock:
+            return {
+                "threads_per_model": self.threads_per_model,
+                "pending": dict(self._pending),
+            }
+
+
+inference_executor = InferenceExecutor()
@@ -1,17 +1,67 @@
-from unsloth import FastVisionModel
+from services.inference_device import (
+    INFERENCE_CPU_BACKEND,
+    INFERENCE_DEVICE,
+    load_cpu_model,
+)
+
+if INFERENCE_DEVICE == "cuda":
+    # unsloth patches transformers on import and refuses to load without a GPU.
+    from unsloth import FastVisionModel
 import os
+import threading
+from contextlib import contextmanager
 from io import BytesIO
 
 from bert_score import score as bert_scorer
 from peft import PeftConfig, PeftModel
 from PIL import Image
 from sentence_transformers import SentenceTransformer
+from services.gguf_inference import gguf_backend
+from services.inference_batching import BatchingRegistry
+from services.inference_executor import inference_executor
+from services.model_cache import ModelCache
+from services.model_pool import base_model_pool
+from services.multi_lora import (
+    INFERENCE_SERVING_MODE,
+    adapter_version,
+    multi_lora_server,
+)
+from services.prefix_cache import prefix_cache
+from services.response_cache import ResponseCache
+from services.vision_cache import vision_cache
 from sklearn.metrics.pairwise import cosine_similarity
-from transformers import AutoTokenizer, TextStreamer
+from transformers import (
+    AutoTokenizer,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
 
 snt_model = SentenceTransformer("all-MiniLM-L6-v2")
 
-loaded_models = {}
+# Fine-tuned apps answer from their GGUF exports instead of the adapter.
+GGUF_SERVING = INFERENCE_DEVICE == "cpu" and INFERENCE_CPU_BACKEND == "gguf"
+# Adapters on a shared base need the 4-bit GPU runtime.
+MULTI_LORA_SERVING = (
+    INFERENCE_SERVING_MODE == "multi_lora" and INFERENCE_DEVICE == "cuda"
+)
+
+loaded_models = ModelCache()
+
+# Greedy decoding makes answers reproducible, which the response cache needs.
+INFERENCE_GREEDY = os.environ.get("INFERENCE_GREEDY", "0") == "1"
+
+if INFERENCE_GREEDY:
+    GENERATION_KWARGS = {"max_new_tokens": 128, "use_cache": True, "do_sample": False}
+else:
+    GENERATION_KWARGS = {
+        "max_new_tokens": 128,
+        "use_cache": True,
+        "temperature": 1.5,
+        "min_p": 0.1,
+    }
+
+response_cache = ResponseCache(GENERATION_KWARGS)
 
 
 def list_models():
@@ -25,25 +75,117 @@ def list_models():
     }
 
 
-def load_model(app_name):
+def _load_finetuned(app_name):
     task_path = os.path.join("outputs", app_name)
+    if INFERENCE_DEVICE == "cpu":
+        return load_cpu_model(task_path)
 
     model, tokenizer = FastVisionModel.from_pretrained(
         model_name=task_path,
         load_in_4bit=True,  # Set to False for 16bit LoRA
     )
     FastVisionModel.for_inference(model)
-
-    loaded_models[app_name] = (model, tokenizer)
     return model, tokenizer
 
 
-def process_vqa(app_name, image, question):
-    if app_name not in loaded_models:
-        load_model(app_name)
+@contextmanager
+def finetuned_model(app_name):
+    """Yields (model, tokenizer) for an app under the configured serving mode."""
+    version = adapter_version(app_name)
+    if MULTI_LORA_SERVING:
+        with multi_lora_server.adapter(app_name) as (model, tokenizer):
+            with vision_cache.scope(model, tokenizer, app_name, version):
+                with prefix_cache.scope(app_name, version):
+                    yield model, tokenizer
+        return
 
-    model, tokenizer = loaded_models[app_name]
+    model, tokenizer = loaded_models.acquire(
+        app_name, lambda: _load_finetuned(app_name)
+    )
+    try:
+        with vision_cache.scope(model, tokenizer, app_name, version):
+            with prefix_cache.scope(app_name, version):
+                yield model, tokenizer
+    finally:
+        loaded_models.release(app_name)
 
+
+def load_model(app_name):
+    if GGUF_SERVING:
+        return gguf_backend.load(app_name)
+    with finetuned_model(app_name) as (model, tokenizer):
+        return model, tokenizer
+
+
+def process_vqa(app_name, image, question):
+    if GGUF_SERVING:
+        return gguf_backend.answer(app_name, image, question, GENERATION_KWARGS)
+    with finetuned_model(app_name) as (model, tokenizer):
+        return _generate_finetuned(model, tokenizer, image, question)
+
+
+def process_vqa_batch(app_name, images, questions):
+    """Answers several (image, question) pairs for one app in batched generates.
+
+    Requests with and without an image are generated separately since the
+    processor cannot mix them in one batch. With the prefix cache on, each
+    request instead generates from its cached prefix state in turn: the
+    left padding of a batched generate shifts every prompt, so a batch
+    cannot start from per-request KV states.
+    """
+    if GGUF_SERVING:
+        return [
+            gguf_backend.answer(app_name, image, question, GENERATION_KWARGS)
+            for image, question in zip(images, questions)
+        ]
+
+    answers = [None] * len(questions)
+    with finetuned_model(app_name) as (model, tokenizer):
+        if prefix_cache.enabled:
+            return [
+                _generate_finetuned(model, tokenizer, image, question)
+                for image, question in zip(images, questions)
+            ]
+        for has_image in (True, False):
+            indices = [
+                i for i, image in enumerate(images) if (image is not None) == has_image
+            ]
+            if not indices:
+                continue
+            results = _generate_finetuned_batch(
+                model,
+                tokenizer,
+                [images[i] for i in indices] if has_image else None,
+                [questions[i] for i in indices],
+            )
+            for i, answer in zip(indices, results):
+                answers[i] = answer
+    return answers
+
+
+def _generate_finetuned_batch(model, tokenizer, images, questions):
+    input_texts = [_vqa_prompt(tokenizer, question) for question in questions]
+    # Decoder-only generation needs the padding on the left.
+    text_tokenizer = getattr(tokenizer, "tokenizer", tokenizer)
+    padding_side = text_tokenizer.padding_side
+    text_tokenizer.padding_side = "left"
+    with vision_cache.images(images or []):
+        try:
+            inputs = tokenizer(
+                [[image] for image in images] if images else None,
+                input_texts,
+                add_special_tokens=False,
+                padding=True,
+                return_tensors="pt",
+            ).to(INFERENCE_DEVICE)
+        finally:
+            text_tokenizer.padding_side = padding_side
+
+        outputs = model.generate(**inputs, **GENERATION_KWARGS)
+    return [tokenizer.decode(output, skip_special_tokens=True) for output in outputs]
+
+
+def _vqa_prompt(tokenizer, question):
     messages = [
         {
             "role": "user",
@@ -51,72 +193,172 @@ def process_vqa(app_name, image, question):
         }
     ]
 
-    input_text = tokenizer.apply_chat_template(messages, add_generation_prompt=True)
-    inputs = tokenizer(
-        image,
-        input_text,
-        add_special_tokens=False,
-        return_tensors="pt",
-    ).to("cuda")
-
-    text_streamer = TextStreamer(tokenizer, skip_prompt=True)
-    outputs = model.generate(
-        **inputs,
-        streamer=text_streamer,
-        max_new_tokens=128,
-        use_cache=True,
-        temperature=1.5,
-        min_p=0.1,
-    )
+    return tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+
+
+def _generate_one(model, tokenizer, image, question, **kwargs):
+    """Generates one answer through the vision-feature and prefix KV caches."""
+    input_text = _vqa_prompt(tokenizer, question)
+    with vision_cache.images([image]):
+        inputs = tokenizer(
+            image,
+            input_text,
+            add_special_tokens=False,
+            return_tensors="pt",
+        ).to(INFERENCE_DEVICE)
+        return prefix_cache.generate(
+            model,
+            tokenizer,
+            inputs,
+            image,
+            input_text,
+            question,
+            **GENERATION_KWARGS,
+            **kwargs,
+        )
+
+
+def _generate_finetuned(model, tokenizer, image, question):
+    outputs = _generate_one(model, tokenizer, image, question)
 
     return tokenizer.decode(outputs[0], skip_special_tokens=True)
 
 
-def process_unfinetuned_vqa(image, question, model_name):
+@contextmanager
+def unfinetuned_model(model_name):
+    if multi_lora_server.has_base(model_name):
+        # Served base with its adapters switched off.
+        with multi_lora_server.base(model_name) as (model, tokenizer):
+            with vision_cache.scope(model, tokenizer, model_name):
+                with prefix_cache.scope(model_name):
+                    yield model, tokenizer
+        return
 
-    model, tokenizer = FastVisionModel.from_pretrained(
-        model_name=model_name,
-        load_in_4bit=True,
-        use_gradient_checkpointing="unsloth",
-    )
+    model, tokenizer = base_model_pool.acquire(model_name)
+    try:
+        with vision_cache.scope(model, tokenizer, model_name):
+            with prefix_cache.scope(model_name):
+                yield model, tokenizer
+    finally:
+        base_model_pool.release(model_name, model)
 
-    print(f"Loaded model: {model_name}")
 
-    FastVisionModel.for_inference(model)
+def process_unfinetuned_vqa(image, question, model_name):
+    with unfinetuned_model(model_name) as (model, tokenizer):
+        return _generate_unfinetuned(model, tokenizer, image, question, model_name)
 
-    messages = [
-        {
-            "role": "user",
-            "content": [{"type": "image"}, {"type": "text", "text": question}],
-        }
-    ]
 
-    input_text = tokenizer.apply_chat_template(messages, add_generation_prompt=True)
-
-    print(f"Input text: {input_text}")
-
-    inputs = tokenizer(
-        image,
-        input_text,
-        add_special_tokens=False,
-        return_tensors="pt",
-    ).to("cuda")
-
-    text_streamer = TextStreamer(tokenizer, skip_prompt=True)
-    outputs = model.generate(
-        **inputs,
-        streamer=text_streamer,
-        max_new_tokens=128,
-        use_cache=True,
-        temperature=1.5,
-        min_p=0.1,
-    )
+def _generate_unfinetuned(model, tokenizer, image, question, model_name):
+    print(f"Loaded model: {model_name}")
+
+    outputs = _generate_one(model, tokenizer, image, question)
 
     print(f"Generated output: {outputs}")
 
     return tokenizer.decode(outputs[0], skip_special_tokens=True)
 
 
+class _StopOnEvent(StoppingCriteria):
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.event.is_set()
+
+
+class VQAStream:
+    """Generates one answer on the model's executor and yields it as it decodes.
+
+    `acquire` is a context manager factory returning (model, tokenizer); the
+    model is held only while generating. cancel() stops generation at the
+    next token, which is how a disconnected client frees the GPU.
+    """
+
+    def __init__(self, key, acquire, image, question):
+        self._start(key, acquire, image, question)
+
+    def _start(self, key, *run_args):
+        self._cancel = threading.Event()
+        self._ready = threading.Event()
+        self._streamer = None
+        self.error = None
+        inference_executor.submit(key, self._run, *run_args)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def __iter__(self):
+        self._ready.wait()
+        if self._streamer is not None:
+            for text in self._streamer:
+                if text:
+                    yield text
+        if self.error is not None:
+            raise self.error
+
+    def _run(self, acquire, image, question):
+        try:
+            with acquire() as (model, tokenizer):
+                self._streamer = TextIteratorStreamer(
+                    tokenizer, skip_prompt=True, skip_special_tokens=True
+                )
+                self._ready.set()
+                if self._cancel.is_set():
+                    return
+                _generate_one(
+                    model,
+                    tokenizer,
+                    image,
+                    question,
+                    streamer=self._streamer,
+                    stopping_criteria=StoppingCriteriaList(
+                        [_StopOnEvent(self._cancel)]
+                    ),
+                )
+        except Exception as e:
+            self.error = e
+        finally:
+            # generate() ends the streamer itself unless it failed or never ran.
+            if self._streamer is not None:
+                self._streamer.end()
+            self._ready.set()
+
+
+class GGUFVQAStream(VQAStream):
+    """VQAStream over an app's GGUF export, fed chunk by chunk by llama.cpp."""
+
+    def __init__(self, app_name, image, question):
+        self._start(app_name, app_name, image, question)
+
+    def _run(self, app_name, image, question):
+        self._streamer = TextIteratorStreamer(None)
+        self._ready.set()
+        try:
+            for text in gguf_backend.stream(
+                app_name, image, question, GENERATION_KWARGS
+            ):
+                if self._cancel.is_set():
+                    break
+                self._streamer.on_finalized_text(text)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._streamer.end()
+
+
+def stream_vqa(app_name, image, question):
+    if GGUF_SERVING:
+        return GGUFVQAStream(app_name, image, question)
+    return VQAStream(app_name, lambda: finetuned_model(app_name), image, question)
+
+
+def stream_unfinetuned_vqa(image, question, model_name):
+    return VQAStream(model_name, lambda: unfinetuned_model(model_name), image, question)
+
+
+inference_batcher = BatchingRegistry(process_vqa_batch)
+
+
 def compare_responses(question, response1, response2):
     try:
         embeddings = snt_model.encode([response1, response2])
@@ -0,0 +1,165 @@
+import gc
+import os
+import threading
+import time
+
+import torch
+
+MODEL_CACHE_BUDGET_GB = float(os.environ.get("MODEL_CACHE_BUDGET_GB", "24"))
+# "lru" evicts the least recently used model, "lfu" the least frequently used.
+MODEL_CACHE_POLICY = os.environ.get("MODEL_CACHE_POLICY", "lru")
+MODEL_CACHE_PINNED = [
+    name for name in os.environ.get("MODEL_CACHE_PINNED", "").split(",") if name
+]
+
+
+def _footprint_gb(model):
+    try:
+        return round(model.get_memory_footprint() / 1024**3, 3)
+    except Exception:
+        return round(
+            sum(p.numel() * p.element_size() for p in model.parameters()) / 1024**3,
+            3,
+        )
+
+
+class ModelCache:
+    """Fine-tuned models kept resident for inference under a memory budget.
+
+    Entries are loaded on first use through the loader passed to acquire()
+    and accounted at their memory footprint. Once the cache is over budget,
+    idle unpinned entries are evicted by the configured policy (LRU or LFU);
+    models that are in use or pinned are never evicted.
+    """
+
+    def __init__(
+        self,
+        budget_gb=MODEL_CACHE_BUDGET_GB,
+        policy=MODEL_CACHE_POLICY,
+        pinned=MODEL_CACHE_PINNED,
+    ):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown model cache policy: {policy}")
+        self.budget_gb = budget_gb
+        self.policy = policy
+        self._entries = {}
+        self._pinned = set(pinned)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def acquire(self, key, loader):
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["in_use"] += 1
+                    entry["hits"] += 1
+                    entry["last_used"] = time.time()
+                    self.stats["hits"] += 1
+                    return entry["model"], entry["tokenizer"]
+
+            start = time.time()
+            model, tokenizer = loader()
+            load_seconds = round(time.time() - start, 2)
+
+            with self._lock:
+                self._entries[key] = {
+                    "model": model,
+                    "tokenizer": tokenizer,
+                    "in_use": 1,
+                    "hits": 0,
+                    "footprint_gb": _footprint_gb(model),
+                    "loaded_at": time.time(),
+                    "last_used": time.time(),
+                    "load_seconds": load_seconds,
+                }
+                self.stats["misses"] += 1
+                print(f"[MODEL CACHE] Loaded {key} in {load_seconds}s")
+                self._enforce_budget(keep=key)
+                return model, tokenizer
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["in_use"] = max(entry["in_use"] - 1, 0)
+            self._enforce_budget()
+
+    def pin(self, key, pinned=True):
+        with self._lock:
+            if pinned:
+                self._pinned.add(key)
+            else:
+                self._pinned.discard(key)
+                self._enforce_budget()
+
+    def evict(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["in_use"] > 0:
+                return False
+            self._evict(key)
+            return True
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def describe(self):
+        with self._lock:
+            return {
+                "budget_gb": self.budget_gb,
+                "used_gb": round(self._used_gb(), 3),
+                "policy": self.policy,
+                "resident": [
+                    {
+                        "app_name": key,
+                        "footprint_gb": entry["footprint_gb"],
+                        "hits": entry["hits"],
+                        "in_use": entry["in_use"],
+                        "pinned": key in self._pinned,
+                        "loaded_at": entry["loaded_at"],
+                        "last_used": entry["last_used"],
+                        "load_seconds": entry["load_seconds"],
+                    }
+                    for key, entry in self._entries.items()
+                ],
+                "pinned": sorted(self._pinned),
+                "stats": dict(self.stats),
+            }
+
+    def _used_gb(self):
+        return sum(entry["footprint_gb"] for entry in self._entries.values())
+
+    def _eviction_order(self):
+        if self.policy == "lfu":
+            rank = lambda item: (item[1]["hits"], item[1]["last_used"])
+        else:
+            rank = lambda item: item[1]["last_used"]
+        return [key for key, _ in sorted(self._entries.items(), key=rank)]
+
+    def _enforce_budget(self, keep=None):
+        for key in self._eviction_order():
+            if self._used_gb() <= self.budget_gb:
+                break
+            entry = self._entries[key]
+            if key == keep or key in self._pinned or entry["in_use"] > 0:
+                continue
+            self._evict(key)
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        self.stats["evictions"] += 1
+        print(
+            f"[MODEL CACHE] Evicted {key} ({entry['footprint_gb']} GB, "
+            f"{entry['hits']} hits) to stay within {self.budget_gb} GB budget"
+        )
+        del entry
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
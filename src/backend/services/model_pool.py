@@ -0,0 +1,227 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+from services.inference_device import INFERENCE_DEVICE, load_cpu_model
+
+if INFERENCE_DEVICE == "cuda":
+    from unsloth import FastVisionModel
+
+BASE_MODEL_POOL_BUDGET_GB = float(os.environ.get("BASE_MODEL_POOL_BUDGET_GB", "40"))
+
+
+def _load_base_model(model_name):
+    if INFERENCE_DEVICE == "cpu":
+        return load_cpu_model(model_name)
+    kwargs = {}
+    if "LOCAL_RANK" in os.environ:
+        # Under torchrun each rank holds its own replica on its own device.
+        kwargs["device_map"] = {"": int(os.environ["LOCAL_RANK"])}
+    return FastVisionModel.from_pretrained(
+        model_name,
+        load_in_4bit=True,
+        use_gradient_checkpointing="unsloth",
+        **kwargs,
+    )
+
+
+def _detach_adapters(model):
+    # get_peft_model injects LoRA layers into the base in place; unload() strips
+    # them again without merging so the quantized weights stay reusable.
+    if hasattr(model, "unload") and hasattr(model, "peft_config"):
+        model = model.unload()
+    if hasattr(model, "peft_config"):
+        del model.peft_config
+    return model
+
+
+def _prepare_for_inference(model):
+    # CPU bases are loaded in eval mode and never trained.
+    if INFERENCE_DEVICE == "cuda":
+        FastVisionModel.for_inference(model)
+
+
+def _free_memory():
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class BaseModelPool:
+    """Pool of 4-bit base models, one per process.
+
+    Model weights cannot cross a process boundary, so each process keeps its
+    own pool: the API server's serves inference and every training worker's
+    stays warm across the jobs that worker runs. Entries inherited through a
+    fork are dropped rather than reused.
+
+    Entries are reference counted. Training jobs acquire a base exclusively
+    because they attach a LoRA adapter to it; inference shares it. The pool
+    owns the base's train/inference mode: a base is only switched back to
+    inference once no training job holds it, so callers never toggle a
+    shared model. When the pooled copy is busy a private copy is loaded and
+    dropped on release. Idle entries are evicted least-recently-used first
+    once the pool exceeds its memory budget.
+    """
+
+    def __init__(self, budget_gb=BASE_MODEL_POOL_BUDGET_GB, loader=_load_base_model):
+        self.budget_gb = budget_gb
+        self.loader = loader
+        self._pid = os.getpid()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.stats = {"hits": 0, "loads": 0, "private_loads": 0, "evictions": 0}
+
+    def acquire(self, model_name, exclusive=False, training=False):
+        """Returns (model, tokenizer) for `model_name`.
+
+        Training implies exclusive use and leaves switching the model to
+        training mode to the caller, after it has attached its adapter.
+        Inference callers get the base already in inference mode.
+        """
+        exclusive = exclusive or training
+        mode = "training" if training else "inference"
+        with self._lock:
+            self._check_process()
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(model_name)
+                if entry is not None and self._can_share(entry, exclusive):
+                    if entry["mode"] != mode and mode == "inference":
+                        _prepare_for_inference(entry["model"])
+                    entry["mode"] = mode
+                    entry["refcount"] += 1
+                    entry["exclusive"] = exclusive
+                    entry["last_used"] = time.time()
+                    entry["hits"] += 1
+                    self._entries.move_to_end(model_name)
+                    self.stats["hits"] += 1
+                    print(
+                        f"[MODEL POOL] Reusing warm base {model_name} "
+                        f"(refcount={entry['refcount']})"
+                    )
+                    return entry["model"], entry["tokenizer"]
+                pooled = entry is None
+
+            start = time.time()
+            model, tokenizer = self.loader(model_name)
+            if mode == "inference":
+                _prepare_for_inference(model)
+            load_seconds = round(time.time() - start, 2)
+
+            with self._lock:
+                if not pooled:
+                    self.stats["private_loads"] += 1
+                    print(
+                        f"[MODEL POOL] {model_name} is busy, loaded private copy "
+                        f"in {load_seconds}s"
+                    )
+                    return model, tokenizer
+
+                self._entries[model_name] = {
+                    "model": model,
+                    "tokenizer": tokenizer,
+                    "refcount": 1,
+                    "exclusive": exclusive,
+                    "mode": mode,
+                    "footprint_gb": round(model.get_memory_footprint() / 1024**3, 3),
+                    "loaded_at": time.time(),
+                    "last_used": time.time(),
+                    "hits": 0,
+                }
+                self.stats["loads"] += 1
+                print(f"[MODEL POOL] Loaded base {model_name} in {load_seconds}s")
+                self._enforce_budget(keep=model_name)
+                return model, tokenizer
+
+    def release(self, model_name, model):
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry is None or not self._is_pooled(entry, model):
+                # Private copy: nothing else references it.
+                del model
+                _free_memory()
+                return
+
+            entry["model"] = _detach_adapters(model)
+            entry["refcount"] = max(entry["refcount"] - 1, 0)
+            if entry["refcount"] == 0:
+                entry["exclusive"] = False
+            entry["last_used"] = time.time()
+            self._enforce_budget()
+
+    def is_warm(self, model_name):
+        with self._lock:
+            return model_name in self._entries
+
+    def describe(self):
+        with self._lock:
+            resident = [
+                {
+                    "model": name,
+                    "refcount": entry["refcount"],
+                    "exclusive": entry["exclusive"],
+                    "mode": entry["mode"],
+                    "footprint_gb": entry["footprint_gb"],
+                    "hits": entry["hits"],
+                    "loaded_at": entry["loaded_at"],
+                    "last_used": entry["last_used"],
+                }
+                for name, entry in self._entries.items()
+            ]
+            return {
+                "pid": self._pid,
+                "budget_gb": self.budget_gb,
+                "used_gb": round(self._used_gb(), 3),
+                "resident": resident,
+                "stats": dict(self.stats),
+            }
+
+    def _check_process(self):
+        if os.getpid() == self._pid:
+            return
+        # A forked child inherits the parent's entries, but not a usable CUDA
+        # context for them.
+        print(f"[MODEL POOL] Dropping {len(self._entries)} bases inherited by fork")
+        self._entries = OrderedDict()
+        self._load_locks = {}
+        self._pid = os.getpid()
+
+    def _can_share(self, entry, exclusive):
+        if entry["refcount"] == 0:
+            return True
+        return not exclusive and not entry["exclusive"]
+
+    def _is_pooled(self, entry, model):
+        # A training job hands back the PeftModel wrapping the pooled base.
+        inner = getattr(getattr(model, "base_model", None), "model", None)
+        return model is entry["model"] or inner is entry["model"]
+
+    def _used_gb(self):
+        return sum(entry["footprint_gb"] for entry in self._entries.values())
+
+    def _enforce_budget(self, keep=None):
+        for name in list(self._entries.keys()):
+            if self._used_gb() <= self.budget_gb:
+                break
+            entry = self._entries[name]
+            if name == keep or entry["refcount"] > 0:
+                continue
+            del self._entries[name]
+            self.stats["evictions"] += 1
+            print(
+                f"[MODEL POOL] Evicted idle base {name} "
+                f"({entry['footprint_gb']} GB) to stay within "
+                f"{self.budget_gb} GB budget"
+            )
+            del entry
+            _free_memory()
+
+
+base_model_pool = BaseModelPool()
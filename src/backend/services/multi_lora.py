@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from peft import PeftModel
+from services.model_pool import base_model_pool
+
+# "full" loads every app as its own model through the model cache;
+# "multi_lora" serves all apps of a base as adapters on one shared copy.
+INFERENCE_SERVING_MODE = os.environ.get("INFERENCE_SERVING_MODE", "full")
+MULTI_LORA_MAX_ADAPTERS = int(os.environ.get("MULTI_LORA_MAX_ADAPTERS", "32"))
+
+KNOWN_BASE_MODELS = [
+    "unsloth/Llama-3.2-11B-Vision-bnb-4bit",
+    "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit",
+    "unsloth/Pixtral-12B-2409",
+]
+
+
+def adapter_path(app_name):
+    return os.path.join("outputs", app_name)
+
+
+def adapter_base_model(app_name):
+    """Base model an app's LoRA adapter was trained on, from adapter_config.json."""
+    config_path = os.path.join(adapter_path(app_name), "adapter_config.json")
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"No LoRA adapter found for {app_name}")
+    with open(config_path, "r") as f:
+        base = json.load(f)["base_model_name_or_path"]
+    for known in KNOWN_BASE_MODELS:
+        if known.lower() == base.lower():
+            return known
+    return base
+
+
+def adapter_version(app_name):
+    weights = os.path.join(adapter_path(app_name), "adapter_model.safetensors")
+    return os.path.getmtime(weights) if os.path.exists(weights) else None
+
+
+class MultiLoraServer:
+    """Serves many LoRA apps from one resident copy of each base model.
+
+    The base is taken from the shared pool exclusively, so training never
+    attaches its own adapter to it, and each app's adapter is loaded onto it
+    by name the first time it is requested. A request activates its adapter
+    with set_adapter, which only flips which LoRA weights the layers use.
+    Requests on one base are serialized; the least recently used adapters
+    are unloaded beyond MULTI_LORA_MAX_ADAPTERS.
+    """
+
+    def __init__(self, max_adapters=MULTI_LORA_MAX_ADAPTERS):
+        self.max_adapters = max_adapters
+        self._bases = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "adapter_loads": 0,
+            "adapter_swaps": 0,
+            "adapter_evictions": 0,
+            "total_swap_ms": 0.0,
+            "total_load_ms": 0.0,
+        }
+
+    def has_base(self, model_name):
+        with self._lock:
+            return model_name in self._bases
+
+    @contextmanager
+    def adapter(self, app_name):
+        """Yields (model, tokenizer) with `app_name`'s adapter active."""
+        entry = self._base_entry(adapter_base_model(app_name))
+        with entry["lock"]:
+            self._activate(entry, app_name)
+            yield entry["model"], entry["tokenizer"]
+
+    @contextmanager
+    def base(self, model_name):
+        """Yields (model, tokenizer) with every adapter disabled."""
+        entry = self._base_entry(model_name)
+        with entry["lock"]:
+            model = entry["model"]
+            if isinstance(model, PeftModel):
+                with model.disable_adapter():
+                    yield model, entry["tokenizer"]
+            else:
+                yield model, entry["tokenizer"]
+
+    def describe(self):
+        with self._lock:
+            swaps = self.stats["adapter_swaps"]
+            loads = self.stats["adapter_loads"]
+            return {
+                "mode": INFERENCE_SERVING_MODE,
+                "max_adapters": self.max_adapters,
+                "bases": {
+                    name: {
+                        "adapters": list(entry["adapters"].keys()),
+                        "active": entry["active"],
+                    }
+                    for name, entry in self._bases.items()
+                },
+                "stats": dict(
+                    self.stats,
+                    mean_swap_ms=(
+                        round(self.stats["total_swap_ms"] / swaps, 3) if swaps else 0.0
+                    ),
+                    mean_load_ms=(
+                        round(self.stats["total_load_ms"] / loads, 3) if loads else 0.0
+                    ),
+                ),
+            }
+
+    def _base_entry(self, model_name):
+        with self._lock:
+            entry = self._bases.get(model_name)
+            if entry is None:
+                entry = {
+                    "model": None,
+                    "tokenizer": None,
+                    "adapters": OrderedDict(),
+                    "active": None,
+                    "lock": threading.Lock(),
+                }
+                self._bases[model_name] = entry
+        with entry["lock"]:
+            if entry["model"] is None:
+                model, tokenizer = base_model_pool.acquire(model_name, exclusive=True)
+                entry["model"], entry["tokenizer"] = model, tokenizer
+                print(f"[MULTI-LORA] Serving base {model_name}")
+        return entry
+
+    def _activate(self, entry, app_name):
+        from unsloth import FastVisionModel
+
+        version = adapter_version(app_name)
+        if entry["adapters"].get(app_name, version) != version:
+            # The app was retrained since its adapter was loaded.
+            self._unload_adapter(entry, app_name, fallback=None)
+        model = entry["model"]
+        if app_name not in entry["adapters"]:
+            start = time.perf_counter()
+            if isinstance(model, PeftModel):
+                model.load_adapter(adapter_path(app_name), adapter_name=app_name)
+            else:
+                model = PeftModel.from_pretrained(
+                    model, adapter_path(app_name), adapter_name=app_name
+                )
+                entry["model"] = model
+            FastVisionModel.for_inference(model)
+            load_ms = (time.perf_counter() - start) * 1000
+            entry["adapters"][app_name] = version
+            with self._lock:
+                self.stats["adapter_loads"] += 1
+                self.stats["total_load_ms"] += load_ms
+            print(f"[MULTI-LORA] Loaded adapter {app_name} in {round(load_ms)}ms")
+            self._evict_adapters(entry, keep=app_name)
+
+        if entry["active"] != app_name:
+            start = time.perf_counter()
+            model.set_adapter(app_name)
+            entry["active"] = app_name
+            with self._lock:
+                self.stats["adapter_swaps"] += 1
+                self.stats["total_swap_ms"] += (time.perf_counter() - start) * 1000
+        entry["adapters"].move_to_end(app_name)
+
+    def _evict_adapters(self, entry, keep):
+        while len(entry["adapters"]) > self.max_adapters:
+            name = next(name for name in entry["adapters"] if name != keep)
+            self._unload_adapter(entry, name, fallback=keep)
+            with self._lock:
+                self.stats["adapter_evictions"] += 1
+
+    def _unload_adapter(self, entry, name, fallback):
+        model = entry["model"]
+        if entry["active"] == name:
+            # PEFT refuses to delete the active adapter.
+            other = fallback or next(
+                (other for other in entry["adapters"] if other != name), None
+            )
+            if other is None:
+                entry["model"] = model.unload()
+                entry["adapters"].clear()
+                entry["active"] = None
+                return
+            model.set_adapter(other)
+            entry["active"] = other
+        model.delete_adapter(name)
+        del entry["adapters"][name]
+        print(f"[MULTI-LORA] Unloaded adapter {name}")
+
+
+multi_lora_server = MultiLoraServer()
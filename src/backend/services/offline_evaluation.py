@@ -0,0 +1,224 @@
+import json
+import os
+import time
+import traceback
+
+from PIL import Image
+from services.training_metrics import task_status
+from torch.utils.data import DataLoader, Dataset
+from utils.dataset_utils import instruction
+
+OFFLINE_EVAL_DIR = os.environ.get("OFFLINE_EVAL_DIR", "evaluations")
+OFFLINE_EVAL_BATCH_SIZE = int(os.environ.get("OFFLINE_EVAL_BATCH_SIZE", "8"))
+OFFLINE_EVAL_LOADER_WORKERS = int(os.environ.get("OFFLINE_EVAL_LOADER_WORKERS", "4"))
+
+OUTPUT_FORMATS = ("jsonl", "parquet")
+
+
+def evaluation_dir(eval_id):
+    return os.path.join(OFFLINE_EVAL_DIR, eval_id)
+
+
+def results_path(eval_id):
+    return os.path.join(evaluation_dir(eval_id), "results.jsonl")
+
+
+def save_evaluation_spec(eval_id, spec):
+    os.makedirs(evaluation_dir(eval_id), exist_ok=True)
+    with open(os.path.join(evaluation_dir(eval_id), "spec.json"), "w") as f:
+        json.dump(spec, f, indent=4)
+
+
+def load_evaluation_spec(eval_id):
+    path = os.path.join(evaluation_dir(eval_id), "spec.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_results(eval_id):
+    """Completed rows of an evaluation, skipping a line cut off by a crash."""
+    path = results_path(eval_id)
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return rows
+
+
+def _truncate_to_valid(eval_id, rows):
+    # Rewrite the checkpoint without a partial trailing line so appends
+    # after a resume start on a clean line.
+    path = results_path(eval_id)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    os.replace(tmp_path, path)
+
+
+class CaptionedImageDataset(Dataset):
+    """Rows of a captioned dataset whose images are decoded in loader workers."""
+
+    def __init__(self, records, root_folder, indices):
+        self.records = records
+        self.root_folder = root_folder
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, position):
+        index = self.indices[position]
+        record = self.records[index]
+        row = {
+            "index": index,
+            "image": record["image"],
+            "reference": record.get("caption"),
+            "error": None,
+        }
+        try:
+            path = os.path.join(self.root_folder, record["image"])
+            row["pixels"] = Image.open(path).convert("RGB")
+        except Exception as e:
+            row["pixels"] = None
+            row["error"] = f"Could not load image: {e}"
+        return row
+
+
+def _generate(process_vqa_batch, app_name, batch, question):
+    """Fills in predictions; a batch that fails is retried one row at a time."""
+    rows = [row for row in batch if row["error"] is None]
+    if not rows:
+        return
+    try:
+        answers = process_vqa_batch(
+            app_name, [row["pixels"] for row in rows], [question] * len(rows)
+        )
+        for row, answer in zip(rows, answers):
+            row["prediction"] = answer
+    except Exception as e:
+        print(f"[EVALUATION] Batch failed ({e}), retrying row by row")
+        for row in rows:
+            try:
+                row["prediction"] = process_vqa_batch(
+                    app_name, [row["pixels"]], [question]
+                )[0]
+            except Exception as row_error:
+                row["error"] = str(row_error)
+
+
+def run_offline_evaluation(
+    eval_id: str,
+    app_name: str,
+    dataset_path: str,
+    question: str = None,
+    batch_size: int = OFFLINE_EVAL_BATCH_SIZE,
+    num_workers: int = OFFLINE_EVAL_LOADER_WORKERS,
+    output_format: str = "jsonl",
+    limit: int = None,
+):
+    """Answers every image of a captioned dataset with a fine-tuned app.
+
+    Images are decoded by a multi-process DataLoader while the model
+    generates batch by batch. Each finished batch is appended to
+    results.jsonl and fsynced, so the file is the checkpoint: running the
+    same eval_id again skips the rows it already holds. With the parquet
+    format the rows are also written to results.parquet once complete.
+    """
+    # The model stack is only needed inside the worker running the job.
+    from services.inference_service import process_vqa_batch
+
+    question = question or instruction
+    json_file_path = os.path.join("jsons", f"{dataset_path}.json")
+    root_folder = os.path.join("datasets", dataset_path)
+    output_path = results_path(eval_id)
+
+    try:
+        with open(json_file_path, "r") as f:
+            records = json.load(f)
+        if limit:
+            records = records[:limit]
+
+        os.makedirs(evaluation_dir(eval_id), exist_ok=True)
+        done = load_results(eval_id)
+        if os.path.exists(output_path):
+            _truncate_to_valid(eval_id, done)
+            print(f"[EVALUATION] Resuming {eval_id} after {len(done)} rows")
+        done_indices = {row["index"] for row in done}
+        pending = [i for i in range(len(records)) if i not in done_indices]
+        failed = sum(1 for row in done if row.get("error"))
+
+        total = len(records)
+        processed = len(done)
+        task_status[eval_id] = {
+            "status": "EVALUATING",
+            "progress": round(100 * processed / total, 2) if total else 100,
+            "processed": processed,
+            "failed": failed,
+            "total": total,
+            "rows_per_second": None,
+            "output_path": output_path,
+            "error": None,
+        }
+
+        loader = DataLoader(
+            CaptionedImageDataset(records, root_folder, pending),
+            batch_size=batch_size,
+            num_workers=num_workers,
+            collate_fn=list,
+            prefetch_factor=2 if num_workers else None,
+        )
+        start = time.time()
+        with open(output_path, "a") as f:
+            for batch in loader:
+                _generate(process_vqa_batch, app_name, batch, question)
+                for row in batch:
+                    row.pop("pixels", None)
+                    row.setdefault("prediction", None)
+                    f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+                processed += len(batch)
+                failed += sum(1 for row in batch if row["error"])
+                elapsed = time.time() - start
+                task_status.update_task(
+                    eval_id,
+                    progress=round(100 * processed / total, 2),
+                    processed=processed,
+                    failed=failed,
+                    rows_per_second=(
+                        round((processed - len(done)) / elapsed, 3) if elapsed else None
+                    ),
+                )
+
+        parquet_path = None
+        if output_format == "parquet":
+            import pandas as pd
+
+            parquet_path = os.path.join(evaluation_dir(eval_id), "results.parquet")
+            pd.DataFrame(load_results(eval_id)).sort_values("index").to_parquet(
+                parquet_path, index=False
+            )
+
+        spec = load_evaluation_spec(eval_id)
+        if spec is not None:
+            save_evaluation_spec(eval_id, dict(spec, status="COMPLETED"))
+        task_status.update_task(
+            eval_id,
+            status="COMPLETED",
+            progress=100,
+            parquet_path=parquet_path,
+        )
+        print(f"[EVALUATION] {eval_id}: {processed} rows ({failed} failed)")
+    except Exception as e:
+        print(f"An error occurred during evaluation: {e}")
+        traceback.print_exc()
+        task_status.update_task(eval_id, status="FAILED", error=str(e))
@@ -0,0 +1,237 @@
+import copy
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+from services.response_cache import image_hash
+from transformers import DynamicCache
+
+# Off by default: reusing a KV state relies on each backbone's
+# prepare_inputs_for_generation skipping the cached positions correctly.
+# When on, batched /process requests also generate one by one from their
+# cached prefixes instead of in one padded generate.
+PREFIX_CACHE = os.environ.get("PREFIX_CACHE", "0") == "1"
+PREFIX_CACHE_BUDGET_MB = float(os.environ.get("PREFIX_CACHE_BUDGET_MB", "2048"))
+
+
+def _cache_nbytes(cache):
+    layers = getattr(cache, "layers", None)
+    if layers is not None:
+        tensors = [t for layer in layers for t in (layer.keys, layer.values)]
+    else:
+        tensors = list(cache.key_cache) + list(cache.value_cache)
+    return sum(
+        t.numel() * t.element_size() for t in tensors if isinstance(t, torch.Tensor)
+    )
+
+
+def _rope_modules(model):
+    # Qwen2-VL keeps the image's rope offset on the model between forwards.
+    return [module for module in model.modules() if hasattr(module, "rope_deltas")]
+
+
+class _StreamGuard:
+    """Forwards to a generate() streamer and notes once answer tokens reach it.
+
+    generate() puts the prompt before any new token; retry() drops the
+    prompt put of the next generate if the client already has it.
+    """
+
+    def __init__(self, streamer):
+        self.streamer = streamer
+        self.streamed = False
+        self._prompt_sent = False
+        self._expect_prompt = True
+
+    def put(self, value):
+        if self._expect_prompt:
+            self._expect_prompt = False
+            if self._prompt_sent:
+                return
+            self._prompt_sent = True
+        else:
+            self.streamed = True
+        self.streamer.put(value)
+
+    def end(self):
+        self.streamer.end()
+
+    def retry(self):
+        self._expect_prompt = True
+
+
+class PrefixKVCache:
+    """KV state of the prompt up to the question, reused across requests.
+
+    A VQA prompt is the chat template header, then the image, then the
+    question. Everything before the question depends only on the model and
+    the image, so its KV state is computed once with a forward pass and each
+    request generates from a copy of it, only prefilling the question and
+    the assistant header. For text-only questions this is the template
+    prefix alone; with an image it also covers the image tokens (and, for
+    Mllama, the cross-attention states).
+
+    Entries are keyed by model, adapter version, image hash and prefix text,
+    and the least recently used are dropped beyond `budget_mb`. A model whose
+    generate rejects the reused state is remembered and served uncached;
+    once answer tokens have been streamed the error is raised instead, since
+    a second generate would stream the answer again.
+    """
+
+    def __init__(self, enabled=PREFIX_CACHE, budget_mb=PREFIX_CACHE_BUDGET_MB):
+        self.enabled = enabled
+        self.budget_bytes = int(budget_mb * 1024**2)
+        self._entries = OrderedDict()
+        self._used_bytes = 0
+        self._unsupported = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "skipped": 0,
+            "evictions": 0,
+            "reused_tokens": 0,
+        }
+
+    @contextmanager
+    def scope(self, model_id, version=None):
+        self._local.model = (model_id, version)
+        try:
+            yield
+        finally:
+            self._local.model = None
+
+    def generate(self, model, tokenizer, inputs, image, prompt, question, **kwargs):
+        """model.generate(**inputs) starting from the cached prefix state.
+
+        `prompt` is the chat-template text `inputs` were built from.
+        """
+        model_key = getattr(self._local, "model", None)
+        if not self.enabled or model_key is None or model_key in self._unsupported:
+            return model.generate(**inputs, **kwargs)
+
+        split = prompt.rfind(question) if question else -1
+        if split <= 0:
+            self._count("skipped")
+            return model.generate(**inputs, **kwargs)
+        prefix_text = prompt[:split]
+
+        key = model_key + (image_hash(image), prefix_text)
+        entry = self._get(key, inputs["input_ids"])
+        if entry is None:
+            entry = self._compute(model, tokenizer, inputs, image, prefix_text)
+            if entry is None:
+                self._count("skipped")
+                return model.generate(**inputs, **kwargs)
+            self._put(key, entry)
+
+        for module in _rope_modules(model):
+            module.rope_deltas = entry["rope_deltas"]
+        guard = None
+        if kwargs.get("streamer") is not None:
+            kwargs["streamer"] = guard = _StreamGuard(kwargs["streamer"])
+        try:
+            outputs = model.generate(
+                **inputs, past_key_values=copy.deepcopy(entry["cache"]), **kwargs
+            )
+        except Exception as e:
+            if guard is not None and guard.streamed:
+                raise
+            print(f"[PREFIX CACHE] Disabled for {model_key[0]}: {e}")
+            with self._lock:
+                self._unsupported.add(model_key)
+            if guard is not None:
+                guard.retry()
+            return model.generate(**inputs, **kwargs)
+        with self._lock:
+            self.stats["reused_tokens"] += entry["length"]
+        return outputs
+
+    def describe(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "budget_mb": round(self.budget_bytes / 1024**2, 1),
+                "used_mb": round(self._used_bytes / 1024**2, 1),
+                "entries": len(self._entries),
+                "unsupported": sorted(model_id for model_id, _ in self._unsupported),
+                "stats": dict(
+                    self.stats,
+                    hit_rate=(
+                        round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+                    ),
+                ),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used_bytes = 0
+            self._unsupported.clear()
+
+    def _compute(self, model, tokenizer, inputs, image, prefix_text):
+        input_ids = inputs["input_ids"]
+        prefix_inputs = tokenizer(
+            image,
+            prefix_text,
+            add_special_tokens=False,
+            return_tensors="pt",
+        ).to(input_ids.device)
+        prefix_ids = prefix_inputs["input_ids"]
+        length = prefix_ids.shape[1]
+        # The prefix must tokenize exactly as the start of the full prompt
+        # and leave at least one token for generate to prefill.
+        if length >= input_ids.shape[1] or not torch.equal(
+            input_ids[:, :length], prefix_ids
+        ):
+            return None
+
+        with torch.no_grad():
+            outputs = model(
+                **prefix_inputs, past_key_values=DynamicCache(), use_cache=True
+            )
+        rope_modules = _rope_modules(model)
+        return {
+            "cache": outputs.past_key_values,
+            "ids": prefix_ids,
+            "length": length,
+            "rope_deltas": rope_modules[0].rope_deltas if rope_modules else None,
+            "bytes": _cache_nbytes(outputs.past_key_values),
+        }
+
+    def _get(self, key, input_ids):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not torch.equal(
+                input_ids[:, : entry["length"]], entry["ids"]
+            ):
+                entry = None
+            self.stats["hits" if entry else "misses"] += 1
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        if entry["bytes"] > self.budget_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._used_bytes -= previous["bytes"]
+            self._entries[key] = entry
+            self._used_bytes += entry["bytes"]
+            while self._used_bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._used_bytes -= evicted["bytes"]
+                self.stats["evictions"] += 1
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+
+prefix_cache = PrefixKVCache()
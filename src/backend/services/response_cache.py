@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Opt-in: answers are only reused when decoding is deterministic.
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+
+
+def image_hash(image):
+    """Content hash of a decoded PIL image, or None for text-only questions."""
+    if image is None:
+        return None
+    digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def is_deterministic(generation_kwargs):
+    # Without an explicit do_sample the model's generation_config decides,
+    # which for most chat models means sampling.
+    return generation_kwargs.get("do_sample") is False
+
+
+class ResponseCache:
+    """Answers to repeated VQA queries, reused only under greedy decoding.
+
+    Keys combine the model (app or base model), the adapter version, the
+    image content hash, the question and the generation parameters, so any
+    change to one of them misses. Entries expire after `ttl_seconds` and the
+    least recently used are evicted beyond `max_entries`. A model's entries
+    are dropped as soon as a lookup sees a newer adapter version, which is
+    how a retrained app in outputs/ stops serving its old answers.
+    """
+
+    def __init__(
+        self,
+        generation_kwargs,
+        enabled=RESPONSE_CACHE,
+        ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        self.generation_kwargs = generation_kwargs
+        self.enabled = enabled and is_deterministic(generation_kwargs)
+        if enabled and not self.enabled:
+            print(
+                "[RESPONSE CACHE] Disabled: generation samples, so repeated "
+                "queries are not guaranteed the same answer"
+            )
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def key(self, model_id, version, image, question):
+        """Cache key for one query, or None when the cache is off."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._versions.get(model_id, version) != version:
+                self._invalidate(model_id)
+            self._versions[model_id] = version
+        params = json.dumps(self.generation_kwargs, sort_keys=True)
+        return (model_id, version, image_hash(image), question, params)
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["expires_at"] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry["answer"]
+
+    def put(self, key, answer):
+        if key is None:
+            return
+        with self._lock:
+            if self._versions.get(key[0]) != key[1]:
+                # The adapter changed while this answer was being generated.
+                return
+            self._entries[key] = {
+                "answer": answer,
+                "expires_at": time.time() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self, model_id=None):
+        with self._lock:
+            if model_id is None:
+                count = len(self._entries)
+                self._entries.clear()
+                self._versions.clear()
+                return count
+            return self._invalidate(model_id)
+
+    def describe(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+                "entries": len(self._entries),
+                "generation_kwargs": self.generation_kwargs,
+                "stats": dict(
+                    self.stats,
+                    hit_rate=(
+                        round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+                    ),
+                ),
+            }
+
+    def _invalidate(self, model_id):
+        stale = [key for key in self._entries if key[0] == model_id]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.stats["invalidations"] += 1
+            print(f"[RESPONSE CACHE] Dropped {len(stale)} answers for {model_id}")
+        return len(stale)
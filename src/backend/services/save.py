@@ -2,67 +2,126 @@ import os
 import traceback
 
 from huggingface_hub import HfApi
-from services.training import trained_models
-
-# def save_model(model, app_name, hf_username, hf_token):
-#     model_path = f"models/{app_name}_finetuned"
-#     os.makedirs(model_path, exist_ok=True)
-#     model.save_pretrained(model_path)
-#     HfApi().upload_folder(
-#         folder_path=model_path,
-#         repo_id=f"{hf_username}/{app_name}_finetuned",
-#         token=hf_token,
-#     )
-#     return {"message": "Model saved to Hugging Face", "model_path": model_path}
-
-
-def save_model(task_id, app_name, hf_username, hf_token):
-    model, tokenizer = trained_models.get(task_id)
-    if model is None:
-        raise ValueError(f"No model found for task ID {task_id}")
-
-    model_path = f"models/{app_name}_finetuned"
-    os.makedirs(model_path, exist_ok=True)
-    print(model_path)
-
-    # model.save_pretrained(model_path)
-    model.save_pretrained_merged(
-        "model_path",
-        tokenizer,
-        save_method="q4_k_m",
+from services.training_metrics import task_status
+
+# Point at a self-hosted hub (or a local stand-in) instead of huggingface.co.
+EXPORT_HUB_ENDPOINT = os.environ.get("EXPORT_HUB_ENDPOINT") or None
+# Where run_export writes its <app_name>_<export id> directories; GGUF
+# serving looks for exports here too.
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+
+GGUF_QUANT_METHODS = (
+    "not_quantized",
+    "fast_quantized",
+    "quantized",
+    "f16",
+    "bf16",
+    "q8_0",
+    "q6_k",
+    "q5_k_m",
+    "q4_k_m",
+    "q3_k_m",
+    "q2_k",
+)
+
+
+def validate_quant_methods(quant_methods):
+    unknown = [method for method in quant_methods if method not in GGUF_QUANT_METHODS]
+    if unknown:
+        raise ValueError(f"Unsupported quantization methods: {unknown}")
+    return list(dict.fromkeys(quant_methods))
+
+
+def load_trained_model(adapter_path):
+    from unsloth import FastVisionModel
+
+    # Training releases its base back to the shared pool, so exports load their
+    # own copy of the adapter from the path it was saved to.
+    return FastVisionModel.from_pretrained(
+        model_name=adapter_path,
+        load_in_4bit=True,
     )
 
-    print("Model saved locally")
 
-    HfApi().upload_folder(
-        folder_path=model_path,
-        repo_id=f"{hf_username}/{app_name}_finetuned",
-        token=hf_token,
+def _update_export(export_id, stage, progress, **fields):
+    print(f"[EXPORT] {export_id}: {stage} ({progress}%)")
+    task_status.update_task(
+        export_id, status="EXPORTING", stage=stage, progress=progress, **fields
     )
-    return {"message": "Model saved to Hugging Face", "model_path": model_path}
 
 
-def save_gguf_model(
-    task_id: str, output_dir: str = "gguf_models", quant_method: str = "q4_k_m"
+def run_export(
+    export_id: str,
+    adapter_path: str,
+    app_name: str,
+    quant_methods: list = None,
+    output_dir: str = None,
+    repo_id: str = None,
+    hf_token: str = None,
 ):
-    if task_id not in trained_models:
-        raise ValueError(f"No model/tokenizer found for task ID {task_id}")
-
-    model, tokenizer = trained_models[task_id]
-    os.makedirs(output_dir, exist_ok=True)
+    """Merges a trained adapter once and derives every requested artifact from it.
 
-    save_path = os.path.join(output_dir, task_id.replace("-", "_"))
-    os.makedirs(save_path, exist_ok=True)  # Ensure the save_path directory exists
+    With GGUF targets, a single save_pretrained_gguf call writes the merged
+    16-bit checkpoint, converts it to GGUF once and quantizes that file to
+    each method. Without them only the merged checkpoint is written. The
+    export directory is then uploaded to `repo_id` if one is given.
+    """
+    quant_methods = validate_quant_methods(quant_methods or [])
+    export_path = os.path.join(output_dir or EXPORT_DIR, f"{app_name}_{export_id[:8]}")
+    task_status[export_id] = {
+        "status": "EXPORTING",
+        "stage": "queued",
+        "progress": 0,
+        "error": None,
+        "quant_methods": quant_methods,
+        "export_path": export_path,
+    }
 
     try:
-        model.save_pretrained_merged(save_path)
-        model.save_pretrained_gguf(save_path)
-        return {
-            "message": "Model saved locally in GGUF format",
-            "output_path": save_path,
-            "quantization": quant_method,
+        _update_export(export_id, "loading", 5)
+        model, tokenizer = load_trained_model(adapter_path)
+        os.makedirs(export_path, exist_ok=True)
+
+        if quant_methods:
+            _update_export(export_id, "merging_and_quantizing", 20)
+            model.save_pretrained_gguf(
+                export_path, tokenizer, quantization_method=quant_methods
+            )
+        else:
+            _update_export(export_id, "merging", 20)
+            model.save_pretrained_merged(
+                export_path, tokenizer, save_method="merged_16bit"
+            )
+        del model
+
+        gguf_files = sorted(
+            name for name in os.listdir(export_path) if name.endswith(".gguf")
+        )
+        _update_export(export_id, "saved", 70, gguf_files=gguf_files)
+
+        hub_url = None
+        if repo_id:
+            _update_export(export_id, "uploading", 75)
+            api = HfApi(endpoint=EXPORT_HUB_ENDPOINT, token=hf_token)
+            api.create_repo(repo_id, repo_type="model", exist_ok=True)
+            # Chunked, resumable multi-worker upload; large files go up as
+            # multipart LFS uploads.
+            api.upload_large_folder(
+                repo_id=repo_id, folder_path=export_path, repo_type="model"
+            )
+            hub_url = f"{api.endpoint}/{repo_id}"
+
+        task_status[export_id] = {
+            "status": "COMPLETED",
+            "stage": "done",
+            "progress": 100,
+            "error": None,
+            "quant_methods": quant_methods,
+            "export_path": export_path,
+            "gguf_files": gguf_files,
+            "hub_url": hub_url,
         }
     except Exception as e:
-        print(f"An error occurred while saving the model: {e}")
+        print(f"An error occurred while exporting the model: {e}")
         traceback.print_exc()
-        return {"message": "Model not saved locally in GGUF format", "error": str(e)}
+        task_status.update_task(export_id, status="FAILED", error=str(e))
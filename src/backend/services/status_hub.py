@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+
+from services.training_metrics import task_status
+
+STATUS_HEARTBEAT_SECONDS = float(os.environ.get("STATUS_HEARTBEAT_SECONDS", "15"))
+STATUS_HISTORY_SIZE = int(os.environ.get("STATUS_HISTORY_SIZE", "256"))
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get("SUBSCRIBER_QUEUE_SIZE", "256"))
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED")
+
+# Keys that are never sent to viewers.
+_PRIVATE_KEYS = ("model",)
+
+
+def _encode(value):
+    return json.dumps(value, default=str, sort_keys=True)
+
+
+def _public(status):
+    return {
+        key: value for key, value in (status or {}).items() if key not in _PRIVATE_KEYS
+    }
+
+
+class _Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.lagged = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The viewer is too slow; it resyncs from a snapshot instead.
+            self.lagged = True
+
+
+class _TaskChannel:
+    def __init__(self):
+        self.seq = 0
+        self.encoded = {}
+        self.snapshot = {}
+        self.last_epoch = None
+        self.history = deque(maxlen=STATUS_HISTORY_SIZE)
+        self.subscribers = set()
+
+
+class StatusHub:
+    """Fans task status changes out to SSE viewers as they happen.
+
+    Registered as a task_status listener, so every write (in-process
+    training, forwarded worker statuses, the scheduler) is published once and
+    turned into a delta of the keys that changed. Each event gets a per-task
+    id and is kept in a short history so reconnecting clients can resume from
+    `Last-Event-ID`; clients that fall too far behind get a fresh snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def publish(self, task_id, status):
+        status = _public(status)
+        with self._lock:
+            channel = self._channels.setdefault(task_id, _TaskChannel())
+            encoded = {key: _encode(value) for key, value in status.items()}
+            changed = {
+                key: status[key]
+                for key, value in encoded.items()
+                if channel.encoded.get(key) != value
+            }
+            removed = [key for key in channel.encoded if key not in encoded]
+            channel.encoded = encoded
+            channel.snapshot = status
+
+            events = []
+            epoch_metrics = status.get("epoch_metrics")
+            if epoch_metrics and epoch_metrics.get("epoch") != channel.last_epoch:
+                channel.last_epoch = epoch_metrics.get("epoch")
+                events.append({"type": "epoch_update", "data": epoch_metrics})
+            if changed or removed:
+                events.append(
+                    {"type": "status_update", "data": changed, "removed": removed}
+                )
+
+            for event in events:
+                channel.seq += 1
+                channel.history.append((channel.seq, event))
+                for subscriber in list(channel.subscribers):
+                    try:
+                        subscriber.loop.call_soon_threadsafe(
+                            subscriber.offer, (channel.seq, event)
+                        )
+                    except RuntimeError:
+                        # The viewer's event loop has shut down.
+                        channel.subscribers.discard(subscriber)
+
+    def _snapshot_event(self, channel):
+        return (
+            channel.seq,
+            {"type": "status_update", "data": channel.snapshot, "full": True},
+        )
+
+    def _subscribe(self, task_id, last_event_id):
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        if task_id not in self._channels and task_id in task_status:
+            # Statuses written before the hub was listening.
+            self.publish(task_id, task_status.get(task_id))
+        with self._lock:
+            channel = self._channels.setdefault(task_id, _TaskChannel())
+            oldest = channel.history[0][0] if channel.history else None
+            resumable = (
+                last_event_id is not None
+                and oldest is not None
+                and oldest - 1 <= last_event_id <= channel.seq
+            )
+            backlog = (
+                [item for item in channel.history if item[0] > last_event_id]
+                if resumable
+                else []
+            )
+            # A fresh viewer, one we cannot replay for, or one reconnecting
+            # after the task already finished starts from a full snapshot.
+            if not backlog and (
+                not resumable or channel.snapshot.get("status") in TERMINAL_STATUSES
+            ):
+                backlog = [self._snapshot_event(channel)]
+            channel.subscribers.add(subscriber)
+        return channel, subscriber, backlog
+
+    def _unsubscribe(self, channel, subscriber):
+        with self._lock:
+            channel.subscribers.discard(subscriber)
+
+    async def stream(self, task_id, last_event_id=None):
+        """Async generator of SSE frames for one viewer of `task_id`."""
+        channel, subscriber, backlog = self._subscribe(task_id, last_event_id)
+        try:
+            pending = deque(backlog)
+            while True:
+                if subscriber.lagged:
+                    subscriber.lagged = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    with self._lock:
+                        pending = deque([self._snapshot_event(channel)])
+
+                if not pending:
+                    try:
+                        pending.append(
+                            await asyncio.wait_for(
+                                subscriber.queue.get(), STATUS_HEARTBEAT_SECONDS
+                            )
+                        )
+                    except asyncio.TimeoutError:
+                        yield ": heartbeat\n\n"
+                        continue
+
+                event_id, event = pending.popleft()
+                yield f"id: {event_id}\ndata: {json.dumps(event, default=str)}\n\n"
+                if (
+                    event["type"] == "status_update"
+                    and event["data"].get("status") in TERMINAL_STATUSES
+                ):
+                    return
+        finally:
+            self._unsubscribe(channel, subscriber)
+
+    def describe(self):
+        with self._lock:
+            return {
+                task_id: {
+                    "last_event_id": channel.seq,
+                    "subscribers": len(channel.subscribers),
+                }
+                for task_id, channel in self._channels.items()
+                if channel.subscribers
+            }
+
+
+status_hub = StatusHub()
+task_status.add_listener(status_hub.publish)
@@ -0,0 +1,86 @@
+import os
+import threading
+
+from tensorboard.backend.event_processing import event_accumulator
+from utils.downsampling import DEFAULT_POINTS, downsample_series
+
+TENSORBOARD_TAGS = {
+    "train": {"loss": "train/loss", "accuracy": "train/accuracy"},
+    "eval": {"loss": "eval/loss", "accuracy": "eval/accuracy"},
+}
+
+# Keep every scalar (we downsample per request) and skip everything else.
+SIZE_GUIDANCE = {
+    event_accumulator.SCALARS: 0,
+    event_accumulator.TENSORS: 1,
+    event_accumulator.IMAGES: 1,
+    event_accumulator.AUDIO: 1,
+    event_accumulator.HISTOGRAMS: 1,
+    event_accumulator.COMPRESSED_HISTOGRAMS: 1,
+}
+
+
+class TensorboardLogReader:
+    """Tails the event files of one `logs/{app_name}` directory.
+
+    The accumulator is kept between requests; its directory watcher
+    remembers how far into each event file it has read, so every Reload()
+    only ingests events written since the previous request.
+    """
+
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self._lock = threading.Lock()
+        self._accumulator = None
+
+    def _reload(self):
+        if self._accumulator is None:
+            self._accumulator = event_accumulator.EventAccumulator(
+                self.log_dir, size_guidance=SIZE_GUIDANCE
+            )
+        try:
+            self._accumulator.Reload()
+        except Exception:
+            # The directory was replaced (e.g. a retrain); start over.
+            self._accumulator = event_accumulator.EventAccumulator(
+                self.log_dir, size_guidance=SIZE_GUIDANCE
+            )
+            self._accumulator.Reload()
+
+    def scalars(self, points=DEFAULT_POINTS):
+        with self._lock:
+            self._reload()
+            available = set(self._accumulator.Tags().get("scalars", []))
+            series = {
+                tag: self._accumulator.Scalars(tag)
+                for split in TENSORBOARD_TAGS.values()
+                for tag in split.values()
+                if tag in available
+            }
+
+        metrics = {"steps": {}, "total_points": {}}
+        for split, tags in TENSORBOARD_TAGS.items():
+            metrics[split] = {}
+            for name, tag in tags.items():
+                events = series.get(tag, [])
+                steps = [event.step for event in events]
+                values = [event.value for event in events]
+                metrics["total_points"][tag] = len(values)
+                if points:
+                    steps, values = downsample_series(steps, values, points)
+                metrics[split][name] = values
+                metrics["steps"][tag] = steps
+        return metrics
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_tensorboard_logs(app_name: str, points: int = DEFAULT_POINTS):
+    log_dir = f"logs/{app_name}"
+    if not os.path.isdir(log_dir):
+        raise FileNotFoundError(f"No TensorBoard logs for {app_name}")
+    with _readers_lock:
+        reader = _readers.setdefault(log_dir, TensorboardLogReader(log_dir))
+    return reader.scalars(points)
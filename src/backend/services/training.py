@@ -3,25 +3,35 @@ from unsloth.trainer import UnslothVisionDataCollator
 import json
 import os
 import traceback
-from datetime import datetime
 
-import pandas as pd
 from datasets import load_dataset
 from fastapi import HTTPException
 from PIL import Image
+from services.batch_size_finder import resolve_batch_config
+from services.distributed_training import (
+    add_training_callbacks,
+    save_on_main_process,
+)
+from services.model_pool import base_model_pool
 from services.training_metrics import (
-    ProgressCallback,
-    compute_metrics,
+    StreamingTokenMetrics,
+    preprocess_logits_for_metrics,
     print_training_summary,
     task_status,
+    trained_models,
 )
 from sklearn.model_selection import train_test_split
-from tensorboard.backend.event_processing import event_accumulator
 from trl import SFTConfig, SFTTrainer
 from utils.config_loader import get_adaptive_config, load_model_config
-from utils.dataset_utils import get_custom_dataset
+from utils.dataset_utils import get_custom_dataset, stratified_eval_subset
+from utils.run_registry import record_run
+
+EVAL_SUBSET_SIZE = int(os.environ.get("EVAL_SUBSET_SIZE", "32"))
+EVAL_STEPS = int(os.environ.get("EVAL_STEPS", "5"))
 
 os.environ["UNSLOTH_COMPILED_CACHE"] = "/tmp/unsloth_compiled_cache"
+# Needed for eval logits at all; preprocess_logits_for_metrics reduces them
+# to token ids per batch.
 os.environ["UNSLOTH_RETURN_LOGITS"] = "1"
 
 AVAILABLE_MODELS = [
@@ -30,8 +40,6 @@ AVAILABLE_MODELS = [
     "unsloth/Pixtral-12B-2409",
 ]
 
-trained_models = {}
-
 
 def retreive_captioned_dataset():
     dataset_dir = "datasets"
@@ -50,46 +58,28 @@ def retreive_captioned_dataset():
         raise HTTPException(status_code=500, detail="Dataset loading failed")
 
 
-def save_training_log(model_name, config, metrics):
-    print("Model Name:", model_name)
-    print("Config:", config)
-    print("Metrics:", metrics)
-
-    log_data = {
-        "model": model_name,
-        "batch_size": config["batch_size"],
-        "learning_rate": config["learning_rate"],
-        "epochs": config["epochs"],
-        "peak_memory_gb": metrics.get("peak_memory_gb", 0),
-        "training_time": metrics.get("train_runtime_minutes", 0),
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    }
-
-    print(f"[LOG DATA]: {log_data}")
-
-    log_file = os.path.join("src/backend/configs", "adapt_training_logs.xlsx")
-
-    if not os.path.exists(log_file):
-        df = pd.DataFrame(columns=log_data.keys())
-        df.to_excel(log_file, index=False)
+def trained_config(trainer, batch_config, config):
+    """`config` with the batch layout and budget the trainer actually used."""
+    return dict(
+        config,
+        batch_size=batch_config["micro_batch_size"],
+        gradient_accumulation_steps=batch_config["gradient_accumulation_steps"],
+        effective_batch_size=batch_config["effective_batch_size"],
+        learning_rate=trainer.args.learning_rate,
+        # The configs' "epochs" are the run's optimizer steps.
+        epochs=trainer.args.max_steps,
+        max_steps=trainer.args.max_steps,
+        sequence_length=trainer.args.max_seq_length,
+    )
 
-        print(f"Training log file created at {log_file}.")
 
-    try:
-        if os.path.exists(log_file):
-            df = pd.read_excel(log_file)
-        else:
-            df = pd.DataFrame(columns=log_data.keys())
-
-        df = pd.concat([df, pd.DataFrame([log_data])], ignore_index=True)
-        df.to_excel(log_file, index=False)
-
-        print(f"Training log saved successfully to {log_file}.")
-    except Exception as e:
-        print(f"Failed to save training log: {str(e)}")
-
-
-def train_model(model_name: str, task_id: str, dataset_path: str, app_name: str):
+def train_model(
+    model_name: str,
+    task_id: str,
+    dataset_path: str,
+    app_name: str,
+    resume_from_checkpoint: str = None,
+):
     if model_name not in AVAILABLE_MODELS:
         raise HTTPException(status_code=400, detail="Invalid model name")
 
@@ -102,12 +92,9 @@ def train_model(model_name: str, task_id: str, dataset_path: str, app_name: str)
     task_status[task_id] = {"status": "RUNNING", "progress": 0, "error": None}
     converted_dataset = get_custom_dataset(json_file_path, root_folder)
 
+    model = None
     try:
-        model, tokenizer = FastVisionModel.from_pretrained(
-            model_name,
-            load_in_4bit=True,
-            use_gradient_checkpointing="unsloth",
-        )
+        model, tokenizer = base_model_pool.acquire(model_name, training=True)
         model = FastVisionModel.get_peft_model(
             model,
             finetune_vision_layers=False,
@@ -134,17 +121,33 @@ def train_model(model_name: str, task_id: str, dataset_path: str, app_name: str)
         train_dataset, eval_dataset = train_test_split(
             converted_dataset, test_size=0.2, random_state=42
         )
+        # Periodic evals run on a fixed, stratified slice of the held-out split.
+        eval_dataset = stratified_eval_subset(eval_dataset, EVAL_SUBSET_SIZE)
+
+        data_collator = UnslothVisionDataCollator(model, tokenizer)
+        batch_config = resolve_batch_config(
+            model_name,
+            model,
+            tokenizer,
+            data_collator,
+            train_dataset,
+            max_seq_length=2048,
+            micro_batch_size=2,
+            gradient_accumulation_steps=4,
+        )
+        print(f"[BATCH CONFIG] {batch_config}")
 
         trainer = SFTTrainer(
             model=model,
             tokenizer=tokenizer,
-            data_collator=UnslothVisionDataCollator(model, tokenizer),
+            data_collator=data_collator,
             train_dataset=train_dataset,
             eval_dataset=eval_dataset,
-            # compute_metrics=compute_metrics,
+            compute_metrics=StreamingTokenMetrics(),
+            preprocess_logits_for_metrics=preprocess_logits_for_metrics,
             args=SFTConfig(
-                per_device_train_batch_size=2,
-                gradient_accumulation_steps=4,
+                per_device_train_batch_size=batch_config["micro_batch_size"],
+                gradient_accumulation_steps=batch_config["gradient_accumulation_steps"],
                 warmup_steps=5,
                 max_steps=20,
                 learning_rate=2e-4,
@@ -156,65 +159,59 @@ def train_model(model_name: str, task_id: str, dataset_path: str, app_name: str)
                 remove_unused_columns=False,
                 dataset_kwargs={"skip_prepare_dataset": True},
                 dataset_num_proc=4,
+                save_strategy="no",  # AsyncCheckpointCallback handles saving
+                batch_eval_metrics=True,
                 lr_scheduler_type="cosine",  # linear
                 max_seq_length=2048,
                 report_to="tensorboard",
                 logging_dir=f"logs/{app_name}",
-                eval_strategy="epoch",
+                eval_strategy="steps",
+                eval_steps=EVAL_STEPS,
                 per_device_eval_batch_size=2,
-                # load_best_model_at_end=True,
-                # metric_for_best_model="eval_loss",
             ),
         )
 
         print("[TRAINING] Starting training...")
-        trainer.add_callback(ProgressCallback(task_id, trainer.args.max_steps))
-        trainer.train()
+        best_adapter = add_training_callbacks(trainer, task_id, resume_from_checkpoint)
+        trainer.train(resume_from_checkpoint=resume_from_checkpoint)
 
         print("[TRAINING COMPLETE] Training completed successfully.")
         stats = print_training_summary(trainer)
+        stats["batch_config"] = batch_config
+        stats["early_stopping"] = best_adapter.summary()
         log_history = trainer.state.log_history
 
-        print("[SAVING MODEL] Saving model and tokenizer.")
-        task_path = f"outputs/{app_name}"
-        model.save_pretrained(
-            task_path,
-            safe_serialization=True,
-            save_adapter=True,  # Critical for PEFT
+        # Under torchrun every rank trains; only rank 0 saves and records.
+        task_path = save_on_main_process(
+            task_id,
+            app_name,
+            model,
+            tokenizer,
+            {
+                "metrics": stats,
+                "log_history": log_history,
+                "log_dir": f"logs/{app_name}",
+            },
+        )
+        if task_path is None:
+            return
+        record_run(
+            task_id,
+            "standard",
+            model_name,
+            app_name,
+            dataset_path,
+            len(converted_dataset),
+            trained_config(trainer, batch_config, {"lora_rank": 8}),
+            stats,
+            log_history,
         )
-        tokenizer.save_pretrained(task_path)
-
-        task_status[task_id] = {
-            "status": "COMPLETED",
-            "progress": 100,
-            "error": None,
-            "metrics": stats,
-            "log_history": log_history,
-            "log_dir": f"logs/{app_name}",
-        }
-        trained_models[task_id] = (model, tokenizer)
 
     except Exception as e:
         task_status[task_id] = {"status": "FAILED", "progress": 0, "error": str(e)}
-
-
-def get_tensorboard_logs(app_name: str):
-
-    log_dir = f"logs/{app_name}"
-    ea = event_accumulator.EventAccumulator(log_dir)
-    ea.Reload()
-
-    metrics = {
-        "train": {
-            "loss": [scalar.value for scalar in ea.Scalars("train/loss")],
-            "accuracy": [scalar.value for scalar in ea.Scalars("train/accuracy")],
-        },
-        "eval": {
-            "loss": [scalar.value for scalar in ea.Scalars("eval/loss")],
-            "accuracy": [scalar.value for scalar in ea.Scalars("eval/accuracy")],
-        },
-    }
-    return metrics
+    finally:
+        if model is not None:
+            base_model_pool.release(model_name, model)
 
 
 def train_model_with_goal(
@@ -224,6 +221,8 @@ def train_model_with_goal(
     goal_type: str,
     target: str,
     app_name: str,
+    resume_from_checkpoint: str = None,
+    config: dict = None,
 ):
 
     if model_name not in AVAILABLE_MODELS:
@@ -238,8 +237,10 @@ def train_model_with_goal(
     task_status[task_id] = {"status": "RUNNING", "progress": 0, "error": None}
     converted_dataset = get_custom_dataset(json_file_path, root_folder)
 
+    model = None
     try:
-        config = load_model_config(model_name, goal_type, target)
+        if config is None:
+            config = load_model_config(model_name, goal_type, target)
 
         print(f"[TRAIN START] Task ID: {task_id}")
         print(
@@ -248,9 +249,7 @@ def train_model_with_goal(
         print("[TRAIN CONFIG] Hyperparameters loaded:")
         print(config)
 
-        model, tokenizer = FastVisionModel.from_pretrained(
-            model_name, load_in_4bit=True, use_gradient_checkpointing="unsloth"
-        )
+        model, tokenizer = base_model_pool.acquire(model_name, training=True)
 
         model = FastVisionModel.get_peft_model(
             model,
@@ -258,8 +257,8 @@ def train_model_with_goal(
             finetune_language_layers=True,
             finetune_attention_modules=True,
             finetune_mlp_modules=True,
-            r=16,
-            lora_alpha=16,
+            r=config.get("lora_rank", 16),
+            lora_alpha=config.get("lora_rank", 16),
             lora_dropout=0,
             bias="none",
             random_state=3407,
@@ -271,18 +270,33 @@ def train_model_with_goal(
         train_dataset, eval_dataset = train_test_split(
             converted_dataset, test_size=0.2, random_state=42
         )
+        eval_dataset = stratified_eval_subset(eval_dataset, EVAL_SUBSET_SIZE)
         FastVisionModel.for_training(model)
 
+        data_collator = UnslothVisionDataCollator(model, tokenizer)
+        batch_config = resolve_batch_config(
+            model_name,
+            model,
+            tokenizer,
+            data_collator,
+            train_dataset,
+            max_seq_length=config["sequence_length"],
+            micro_batch_size=config["batch_size"],
+            gradient_accumulation_steps=4,
+        )
+        print(f"[BATCH CONFIG] {batch_config}")
+
         trainer = SFTTrainer(
             model=model,
             tokenizer=tokenizer,
-            data_collator=UnslothVisionDataCollator(model, tokenizer),
+            data_collator=data_collator,
             train_dataset=train_dataset,
             eval_dataset=eval_dataset,
-            compute_metrics=compute_metrics,
+            compute_metrics=StreamingTokenMetrics(),
+            preprocess_logits_for_metrics=preprocess_logits_for_metrics,
             args=SFTConfig(
-                per_device_train_batch_size=config["batch_size"],
-                gradient_accumulation_steps=4,
+                per_device_train_batch_size=batch_config["micro_batch_size"],
+                gradient_accumulation_steps=batch_config["gradient_accumulation_steps"],
                 warmup_steps=5,
                 max_steps=config["epochs"],
                 learning_rate=config["learning_rate"],
@@ -298,42 +312,63 @@ def train_model_with_goal(
                 remove_unused_columns=False,
                 dataset_kwargs={"skip_prepare_dataset": True},
                 dataset_num_proc=4,
+                save_strategy="no",  # AsyncCheckpointCallback handles saving
+                batch_eval_metrics=True,
                 max_seq_length=config["sequence_length"],
                 report_to="none",
+                eval_strategy="steps",
+                eval_steps=EVAL_STEPS,
+                per_device_eval_batch_size=2,
             ),
         )
 
         print("[TRAINING] Starting training...")
-        trainer.add_callback(ProgressCallback(task_id, trainer.args.max_steps))
-        trainer.train()
+        best_adapter = add_training_callbacks(trainer, task_id, resume_from_checkpoint)
+        trainer.train(resume_from_checkpoint=resume_from_checkpoint)
 
         print("[TRAINING COMPLETE] Training completed successfully.")
         stats = print_training_summary(trainer)
+        stats["batch_config"] = batch_config
+        stats["early_stopping"] = best_adapter.summary()
         log_history = trainer.state.log_history
 
-        print("[SAVING MODEL] Saving model and tokenizer.")
-        task_path = f"outputs/{app_name}"
-        model.save_pretrained(
-            task_path,
-            safe_serialization=True,
-            save_adapter=True,  # Critical for PEFT
+        # Under torchrun every rank trains; only rank 0 saves and records.
+        task_path = save_on_main_process(
+            task_id,
+            app_name,
+            model,
+            tokenizer,
+            {
+                "metrics": stats,
+                "log_history": log_history,
+            },
+        )
+        if task_path is None:
+            return
+        record_run(
+            task_id,
+            "goal",
+            model_name,
+            app_name,
+            dataset_path,
+            len(converted_dataset),
+            trained_config(
+                trainer,
+                batch_config,
+                dict(config, goal_type=goal_type, target=target),
+            ),
+            stats,
+            log_history,
         )
-        tokenizer.save_pretrained(task_path)
-
-        task_status[task_id] = {
-            "status": "COMPLETED",
-            "progress": 100,
-            "error": None,
-            "metrics": stats,
-            "log_history": log_history,
-        }
-        trained_models[task_id] = (model, tokenizer)
 
     except Exception as e:
         print("[ERROR] Training failed with error:")
         traceback.print_exc()
         task_status[task_id] = {"status": "FAILED", "progress": 0, "error": str(e)}
         raise HTTPException(status_code=500, detail="Training failed")
+    finally:
+        if model is not None:
+            base_model_pool.release(model_name, model)
 
 
 def train_adapt_model(
@@ -344,6 +379,7 @@ def train_adapt_model(
     batch_size: int = None,
     learning_rate: float = None,
     epochs: int = None,
+    resume_from_checkpoint: str = None,
 ):
     config = get_adaptive_config(model_name)
 
@@ -367,12 +403,9 @@ def train_adapt_model(
     task_status[task_id] = {"status": "RUNNING", "progress": 0, "error": None}
     converted_dataset = get_custom_dataset(json_file_path, root_folder)
 
+    model = None
     try:
-        model, tokenizer = FastVisionModel.from_pretrained(
-            model_name,
-            load_in_4bit=True,
-            use_gradient_checkpointing="unsloth",
-        )
+        model, tokenizer = base_model_pool.acquire(model_name, training=True)
         model = FastVisionModel.get_peft_model(
             model,
             finetune_vision_layers=False,
@@ -399,17 +432,32 @@ def train_adapt_model(
         train_dataset, eval_dataset = train_test_split(
             converted_dataset, test_size=0.2, random_state=42
         )
+        eval_dataset = stratified_eval_subset(eval_dataset, EVAL_SUBSET_SIZE)
+
+        data_collator = UnslothVisionDataCollator(model, tokenizer)
+        batch_config = resolve_batch_config(
+            model_name,
+            model,
+            tokenizer,
+            data_collator,
+            train_dataset,
+            max_seq_length=2048,
+            micro_batch_size=final_config["batch_size"],
+            gradient_accumulation_steps=4,
+        )
+        print(f"[BATCH CONFIG] {batch_config}")
 
         trainer = SFTTrainer(
             model=model,
             tokenizer=tokenizer,
-            data_collator=UnslothVisionDataCollator(model, tokenizer),
+            data_collator=data_collator,
             train_dataset=train_dataset,
             eval_dataset=eval_dataset,
-            compute_metrics=compute_metrics,
+            compute_metrics=StreamingTokenMetrics(),
+            preprocess_logits_for_metrics=preprocess_logits_for_metrics,
             args=SFTConfig(
-                per_device_train_batch_size=final_config["batch_size"],
-                gradient_accumulation_steps=4,
+                per_device_train_batch_size=batch_config["micro_batch_size"],
+                gradient_accumulation_steps=batch_config["gradient_accumulation_steps"],
                 warmup_steps=5,
                 max_steps=final_config["epochs"],
                 learning_rate=final_config["learning_rate"],
@@ -421,48 +469,55 @@ def train_adapt_model(
                 remove_unused_columns=False,
                 dataset_kwargs={"skip_prepare_dataset": True},
                 dataset_num_proc=4,
+                save_strategy="no",  # AsyncCheckpointCallback handles saving
+                batch_eval_metrics=True,
                 lr_scheduler_type="cosine",  # linear
                 max_seq_length=2048,
                 report_to="none",
-                # evaluation_strategy="epoch",
-                # per_device_eval_batch_size=2,
-                # load_best_model_at_end=True,
-                # metric_for_best_model="eval_loss",
+                # BestAdapterCallback replaces load_best_model_at_end.
+                eval_strategy="steps",
+                eval_steps=EVAL_STEPS,
+                per_device_eval_batch_size=2,
             ),
         )
 
         print("[TRAINING] Starting training...")
-        trainer.add_callback(ProgressCallback(task_id, trainer.args.max_steps))
-        trainer.train()
+        best_adapter = add_training_callbacks(trainer, task_id, resume_from_checkpoint)
+        trainer.train(resume_from_checkpoint=resume_from_checkpoint)
 
         print("[TRAINING COMPLETE] Training completed successfully.")
         stats = print_training_summary(trainer)
+        stats["batch_config"] = batch_config
+        stats["early_stopping"] = best_adapter.summary()
         log_history = trainer.state.log_history
 
-        print("[SAVING MODEL] Saving model and tokenizer.")
-        task_path = f"outputs/{app_name}"
-        model.save_pretrained(
-            task_path,
-            safe_serialization=True,
-            save_adapter=True,  # Critical for PEFT
+        # Under torchrun every rank trains; only rank 0 saves and records.
+        task_path = save_on_main_process(
+            task_id,
+            app_name,
+            model,
+            tokenizer,
+            {
+                "metrics": stats,
+                "log_history": log_history,
+            },
+        )
+        if task_path is None:
+            return
+        record_run(
+            task_id,
+            "adapt",
+            model_name,
+            app_name,
+            dataset_path,
+            len(converted_dataset),
+            trained_config(trainer, batch_config, dict(final_config, lora_rank=8)),
+            stats,
+            log_history,
         )
-        tokenizer.save_pretrained(task_path)
-
-        task_status[task_id] = {
-            "status": "COMPLETED",
-            "progress": 100,
-            "error": None,
-            "metrics": stats,
-            "log_history": log_history,
-        }
-        trained_models[task_id] = (model, tokenizer)
-
-        print("[SAVING TRAINING LOG] Saving training log.")
-        print(task_status[task_id]["status"])
-        print(task_status[task_id]["metrics"])
-
-        if task_status[task_id]["status"] == "COMPLETED":
-            save_training_log(model_name, final_config, task_status[task_id]["metrics"])
 
     except Exception as e:
         task_status[task_id] = {"status": "FAILED", "progress": 0, "error": str(e)}
+    finally:
+        if model is not None:
+            base_model_pool.release(model_name, model)
@@ -1,5 +1,10 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psutil
 import torch
-from sklearn.metrics import accuracy_score
 from transformers import (
     TrainerCallback,
     TrainerControl,
@@ -7,7 +12,236 @@ from transformers import (
     TrainingArguments,
 )
 
-task_status = {}
+
+class TaskStatusStore(dict):
+    """task_id -> status dict that notifies listeners whenever a task changes.
+
+    Whole-status writes notify automatically; in-place changes go through
+    update_task so that listeners (e.g. the worker IPC bridge) see them too.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.listeners = []
+
+    def __setitem__(self, task_id, status):
+        super().__setitem__(task_id, status)
+        self.notify(task_id)
+
+    def update_task(self, task_id, **fields):
+        self.setdefault(task_id, {}).update(fields)
+        self.notify(task_id)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def wait_for(self, task_id, statuses):
+        """Blocks until `task_id` reaches one of `statuses` and returns it."""
+        reached = threading.Event()
+
+        def listener(updated_id, status):
+            if updated_id == task_id and (status or {}).get("status") in statuses:
+                reached.set()
+
+        self.add_listener(listener)
+        try:
+            if self.get(task_id, {}).get("status") not in statuses:
+                reached.wait()
+        finally:
+            self.remove_listener(listener)
+        return self[task_id]
+
+    def notify(self, task_id):
+        status = self.get(task_id)
+        for listener in list(self.listeners):
+            listener(task_id, status)
+
+
+task_status = TaskStatusStore()
+# task_id -> directory of the adapter a finished training run saved.
+trained_models = {}
+
+TELEMETRY_BUFFER_SIZE = int(os.environ.get("TELEMETRY_BUFFER_SIZE", "500"))
+# Synchronising at phase boundaries makes GPU timings honest at a small cost.
+TELEMETRY_CUDA_SYNC = os.environ.get("TELEMETRY_CUDA_SYNC", "1") == "1"
+
+task_telemetry = {}
+
+
+def record_step_telemetry(task_id, status):
+    """task_status listener that keeps a bounded per-task ring of step records."""
+    step = (status or {}).get("step_telemetry")
+    if not step:
+        return
+    buffer = task_telemetry.setdefault(task_id, deque(maxlen=TELEMETRY_BUFFER_SIZE))
+    if not buffer or buffer[-1]["step"] != step["step"]:
+        buffer.append(step)
+
+
+task_status.add_listener(record_step_telemetry)
+
+
+def get_step_telemetry(task_id, last=None):
+    steps = list(task_telemetry.get(task_id, ()))
+    if last:
+        steps = steps[-last:]
+    if not steps:
+        return {"steps": [], "summary": {}}
+    keys = [key for key in steps[-1] if key not in ("step", "world_size")]
+    summary = {
+        f"mean_{key}": sum(step[key] for step in steps) / len(steps)
+        for key in keys
+        if not key.endswith("high_water_gb")
+    }
+    summary["gpu_memory_high_water_gb"] = max(
+        step["gpu_memory_high_water_gb"] for step in steps
+    )
+    summary["cpu_memory_high_water_gb"] = max(
+        step["cpu_memory_high_water_gb"] for step in steps
+    )
+    return {"steps": steps, "summary": summary}
+
+
+# Under DDP throughput adds up across ranks; times and memory take the worst rank.
+_SUMMED_TELEMETRY = ("samples_per_second", "tokens_per_second")
+
+
+def _aggregate_across_ranks(record):
+    if not (torch.distributed.is_available() and torch.distributed.is_initialized()):
+        return record
+    device = (
+        torch.device("cuda", torch.cuda.current_device())
+        if torch.distributed.get_backend() == "nccl"
+        else torch.device("cpu")
+    )
+    keys = [key for key in record if key != "step"]
+    summed = [key for key in keys if key in _SUMMED_TELEMETRY]
+    maxed = [key for key in keys if key not in _SUMMED_TELEMETRY]
+    sums = torch.tensor([record[key] for key in summed], device=device)
+    maxes = torch.tensor([record[key] for key in maxed], device=device)
+    torch.distributed.all_reduce(sums, op=torch.distributed.ReduceOp.SUM)
+    torch.distributed.all_reduce(maxes, op=torch.distributed.ReduceOp.MAX)
+    aggregated = dict(record, world_size=torch.distributed.get_world_size())
+    aggregated.update(zip(summed, sums.tolist()))
+    aggregated.update(zip(maxed, maxes.tolist()))
+    return aggregated
+
+
+class StepTelemetry:
+    """Times the phases of each optimizer step through model and Trainer hooks.
+
+    between_steps is the gap between the end of one step and the start of
+    the next: the Trainer's batch fetch plus whatever logging, evaluation and
+    checkpointing falls between the two steps. forward time is
+    measured with hooks on the model; backward is the rest of the compute
+    phase up to the optimizer, and optimizer time runs from the
+    pre-optimizer hook to the end of the step. The GPU high-water mark is
+    sampled after each forward pass (activations held), before the optimizer
+    (gradients held) and at the end of the step, so the process-wide peak
+    that print_training_summary reports is never reset. The CPU high-water
+    mark is the largest RSS seen at those points since training began.
+    """
+
+    def __init__(self):
+        self._handles = []
+        self._process = psutil.Process()
+        self._last_step_end = None
+        self._cpu_high_water = 0
+        self._reset()
+
+    def attach(self, model):
+        self._handles = [
+            model.register_forward_pre_hook(self._before_forward, with_kwargs=True),
+            model.register_forward_hook(self._after_forward),
+        ]
+
+    def detach(self):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+    def step_begin(self):
+        now = self._now()
+        self._reset()
+        self._step_begin = now
+        self._between_steps = (
+            now - self._last_step_end if self._last_step_end is not None else 0.0
+        )
+
+    def pre_optimizer(self):
+        self._optimizer_begin = self._now()
+        self._sample_memory()
+
+    def step_end(self, global_step):
+        now = self._now()
+        self._last_step_end = now
+        if self._step_begin is None:
+            return None
+
+        optimizer_begin = self._optimizer_begin or now
+        step_time = now - self._step_begin
+        compute_time = optimizer_begin - self._step_begin
+        gpu_high_water, cpu_high_water = self._sample_memory()
+        record = {
+            "step": global_step,
+            "step_time_s": step_time,
+            "between_steps_s": self._between_steps,
+            "forward_s": self._forward_time,
+            "backward_s": max(compute_time - self._forward_time, 0.0),
+            "optimizer_s": now - optimizer_begin,
+            "samples_per_second": self._samples / step_time if step_time else 0.0,
+            "tokens_per_second": self._tokens / step_time if step_time else 0.0,
+            "gpu_memory_high_water_gb": gpu_high_water / 1024**3,
+            "cpu_memory_high_water_gb": cpu_high_water / 1024**3,
+        }
+        record = _aggregate_across_ranks(record)
+        return {key: round(value, 4) for key, value in record.items()}
+
+    def _before_forward(self, module, args, kwargs):
+        self._forward_begin = self._now()
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        if torch.is_tensor(input_ids):
+            self._samples += input_ids.shape[0]
+            attention_mask = kwargs.get("attention_mask")
+            self._tokens += (
+                int(attention_mask.sum())
+                if torch.is_tensor(attention_mask)
+                else input_ids.numel()
+            )
+
+    def _after_forward(self, module, args, output):
+        if self._forward_begin is not None:
+            self._forward_time += self._now() - self._forward_begin
+            self._forward_begin = None
+        self._sample_memory()
+
+    def _sample_memory(self):
+        if torch.cuda.is_available():
+            self._gpu_high_water = max(
+                self._gpu_high_water, torch.cuda.memory_allocated()
+            )
+        self._cpu_high_water = max(
+            self._cpu_high_water, self._process.memory_info().rss
+        )
+        return self._gpu_high_water, self._cpu_high_water
+
+    def _reset(self):
+        self._step_begin = None
+        self._optimizer_begin = None
+        self._forward_begin = None
+        self._forward_time = 0.0
+        self._between_steps = 0.0
+        self._samples = 0
+        self._tokens = 0
+        self._gpu_high_water = 0
+
+    def _now(self):
+        if TELEMETRY_CUDA_SYNC and torch.cuda.is_available():
+            torch.cuda.synchronize()
+        return time.perf_counter()
 
 
 class ProgressCallback(TrainerCallback):
@@ -15,6 +249,13 @@ class ProgressCallback(TrainerCallback):
         self.task_id = task_id
         self.total_steps = total_steps
         self.current_epoch = 0
+        self.telemetry = StepTelemetry()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.telemetry.step_begin()
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self.telemetry.pre_optimizer()
 
     def on_step_end(
         self,
@@ -35,9 +276,12 @@ class ProgressCallback(TrainerCallback):
             ),
             "epoch": state.epoch,
             "error": None,
+            "step_telemetry": self.telemetry.step_end(state.global_step),
         }
 
     def on_train_begin(self, args, state, control, **kwargs):
+        if kwargs.get("model") is not None:
+            self.telemetry.attach(kwargs["model"])
         task_status[self.task_id] = {
             "status": "RUNNING",
             "progress": 0,
@@ -48,7 +292,8 @@ class ProgressCallback(TrainerCallback):
         }
 
     def on_train_end(self, args, state, control, **kwargs):
-        task_status[self.task_id].update({"status": "COMPLETED", "progress": 100})
+        self.telemetry.detach()
+        task_status.update_task(self.task_id, status="COMPLETED", progress=100)
 
     def on_epoch_end(self, args, state, control, **kwargs):
         train_metrics = {
@@ -61,13 +306,16 @@ class ProgressCallback(TrainerCallback):
         )
 
         if eval_metrics:
-            task_status[self.task_id]["epoch_metrics"] = {
-                "epoch": self.current_epoch,
-                "training_loss": train_metrics["training_loss"],
-                "training_accuracy": train_metrics["training_accuracy"],
-                "validation_loss": eval_metrics.get("eval_loss"),
-                "validation_accuracy": eval_metrics.get("eval_accuracy"),
-            }
+            task_status.update_task(
+                self.task_id,
+                epoch_metrics={
+                    "epoch": self.current_epoch,
+                    "training_loss": train_metrics["training_loss"],
+                    "training_accuracy": train_metrics["training_accuracy"],
+                    "validation_loss": eval_metrics.get("eval_loss"),
+                    "validation_accuracy": eval_metrics.get("eval_accuracy"),
+                },
+            )
 
         self.current_epoch += 1
 
@@ -85,6 +333,7 @@ def print_training_summary(trainer):
     lora_percentage = round(used_memory_for_lora / max_memory * 100, 3)
 
     runtime_seconds = trainer.state.log_history[-1]["train_runtime"]
+    samples_per_second = trainer.state.log_history[-1].get("train_samples_per_second")
     runtime_minutes = round(runtime_seconds / 60, 2)
 
     print(f"TRAINING SUMMARY")
@@ -101,19 +350,58 @@ def print_training_summary(trainer):
         "lora_memory_gb": used_memory_for_lora,
         "memory_usage_percent": used_percentage,
         "lora_memory_percent": lora_percentage,
+        "train_samples_per_second": samples_per_second,
     }
 
 
-def compute_metrics(eval_preds):
-    predictions, labels = eval_preds
-    predictions = predictions.argmax(axis=-1)
-    acc = accuracy_score(labels, predictions)
+def preprocess_logits_for_metrics(logits, labels):
+    # Reduce [batch, seq, vocab] logits to token ids on device so the Trainer
+    # never gathers full-vocabulary tensors for the eval set.
+    if isinstance(logits, tuple):
+        logits = logits[0]
+    return logits.argmax(dim=-1)
 
-    loss = None
-    if isinstance(eval_preds, tuple) and len(eval_preds) >= 3:
-        loss = eval_preds[2].mean().item()
 
-    return {
-        "eval_accuracy": acc,
-        "eval_loss": loss,
-    }
+class StreamingTokenMetrics:
+    """compute_metrics for `batch_eval_metrics=True`.
+
+    Called once per eval batch with predicted token ids, it accumulates
+    next-token accuracy (and loss when the Trainer passes it) and returns
+    the totals on the final call, so eval memory does not grow with the
+    size of the eval set.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def __call__(self, eval_preds, compute_result=True):
+        predictions = torch.as_tensor(eval_preds.predictions)
+        labels = torch.as_tensor(eval_preds.label_ids, device=predictions.device)
+
+        # Logits at position t predict the label at t + 1.
+        predictions = predictions[:, :-1]
+        labels = labels[:, 1:]
+        mask = labels != -100
+        self.correct += ((predictions == labels) & mask).sum().item()
+        self.total += mask.sum().item()
+
+        losses = getattr(eval_preds, "losses", None)
+        if losses is not None:
+            losses = torch.as_tensor(losses)
+            self.loss_sum += losses.sum().item()
+            self.loss_count += losses.numel()
+
+        if not compute_result:
+            return {}
+
+        metrics = {"accuracy": self.correct / self.total if self.total else 0.0}
+        if self.loss_count:
+            metrics["token_loss"] = self.loss_sum / self.loss_count
+        self._reset()
+        return metrics
+
+    def _reset(self):
+        self.correct = 0
+        self.total = 0
+        self.loss_sum = 0.0
+        self.loss_count = 0
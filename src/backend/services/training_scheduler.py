@@ -0,0 +1,214 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+
+from services.checkpointing import save_task_spec
+from services.training_metrics import task_status
+from services.training_workers import training_worker_pool
+from utils.memory_estimates import estimate_peak_memory_gb, gpu_memory_gb
+
+TRAINING_MEMORY_HEADROOM = float(os.environ.get("TRAINING_MEMORY_HEADROOM", "0.9"))
+
+
+class CudaMemoryProvider:
+    def total_gb(self):
+        return gpu_memory_gb()
+
+
+class SimulatedMemoryProvider:
+    """Fixed-capacity provider for exercising the scheduler without a GPU."""
+
+    def __init__(self, total_gb):
+        self._total_gb = total_gb
+
+    def total_gb(self):
+        return self._total_gb
+
+
+def run_in_thread(job, on_finished):
+    def target():
+        try:
+            job["fn"](**job["kwargs"])
+        except Exception as e:
+            traceback.print_exc()
+            status = task_status.get(job["task_id"], {})
+            if status.get("status") not in ("COMPLETED", "FAILED"):
+                task_status[job["task_id"]] = {
+                    "status": "FAILED",
+                    "progress": 0,
+                    "error": getattr(e, "detail", str(e)),
+                }
+        finally:
+            on_finished(job["task_id"])
+
+    threading.Thread(target=target, daemon=True).start()
+
+
+class TrainingScheduler:
+    """Priority queue with memory-based admission control for training jobs.
+
+    Each job carries an estimated peak memory. A job is admitted when its
+    estimate fits in the provider's capacity next to the jobs already
+    running; otherwise it waits in priority order (higher priority first,
+    then submission order). A job larger than the whole budget is still
+    admitted when nothing else is running so it can never starve. Exclusive
+    (distributed) jobs only run with nothing else admitted beside them.
+    """
+
+    def __init__(self, memory_provider=None, runner=None):
+        self.memory_provider = memory_provider or CudaMemoryProvider()
+        self.runner = runner or training_worker_pool.run
+        self._queue = []
+        self._running = {}
+        self._counter = itertools.count()
+        self._lock = threading.RLock()
+
+    def submit(
+        self,
+        task_id,
+        fn,
+        kwargs,
+        model_name,
+        batch_size=None,
+        sequence_length=None,
+        priority=0,
+        exclusive=False,
+        estimated_memory_gb=None,
+        resumable=True,
+        status_fields=None,
+    ):
+        """Queues `fn(**kwargs)` and returns its queue position (0 if admitted).
+
+        `estimated_memory_gb` replaces the training estimate for jobs that
+        load a model without training it. Jobs that are not `resumable` keep
+        no task spec, so their kwargs never reach the disk. `status_fields`
+        are added to the task's QUEUED status.
+        """
+        if estimated_memory_gb is None:
+            estimated_memory_gb = estimate_peak_memory_gb(
+                model_name, batch_size, sequence_length
+            )
+        job = {
+            "task_id": task_id,
+            "fn": fn,
+            "kwargs": kwargs,
+            "model_name": model_name,
+            "priority": priority,
+            "exclusive": exclusive,
+            "estimated_memory_gb": estimated_memory_gb,
+            "submitted_at": time.time(),
+        }
+        if resumable:
+            save_task_spec(
+                task_id,
+                {
+                    "job": fn.__name__,
+                    "kwargs": kwargs,
+                    "model_name": model_name,
+                    "batch_size": batch_size,
+                    "sequence_length": sequence_length,
+                    "priority": priority,
+                    "exclusive": exclusive,
+                    "status": "QUEUED",
+                    "error": None,
+                },
+            )
+        with self._lock:
+            heapq.heappush(self._queue, (-priority, next(self._counter), job))
+            task_status[task_id] = {
+                "status": "QUEUED",
+                "progress": 0,
+                "error": None,
+                "estimated_memory_gb": job["estimated_memory_gb"],
+                **(status_fields or {}),
+            }
+            self._dispatch()
+            return self._position(task_id)
+
+    def cancel(self, task_id):
+        with self._lock:
+            remaining = [item for item in self._queue if item[2]["task_id"] != task_id]
+            if len(remaining) == len(self._queue):
+                return False
+            self._queue = remaining
+            heapq.heapify(self._queue)
+            task_status[task_id] = {
+                "status": "CANCELLED",
+                "progress": 0,
+                "error": None,
+            }
+            self._refresh_positions()
+            return True
+
+    def queue_position(self, task_id):
+        with self._lock:
+            return self._position(task_id)
+
+    def describe(self):
+        with self._lock:
+            return {
+                "capacity_gb": round(self._capacity_gb(), 2),
+                "reserved_gb": round(self._reserved_gb(), 2),
+                "running": [self._job_summary(job) for job in self._running.values()],
+                "queued": [self._job_summary(item[2]) for item in sorted(self._queue)],
+            }
+
+    def _on_finished(self, task_id):
+        with self._lock:
+            self._running.pop(task_id, None)
+            self._dispatch()
+
+    def _dispatch(self):
+        while self._queue:
+            job = self._queue[0][2]
+            fits = (
+                self._reserved_gb() + job["estimated_memory_gb"] <= self._capacity_gb()
+            )
+            # Distributed jobs span every GPU, so they never share the box.
+            shares = not job["exclusive"] and not any(
+                running["exclusive"] for running in self._running.values()
+            )
+            if self._running and not (fits and shares):
+                break
+            heapq.heappop(self._queue)
+            self._running[job["task_id"]] = job
+            print(
+                f"[SCHEDULER] Admitting task {job['task_id']} "
+                f"({job['estimated_memory_gb']} GB, "
+                f"{round(self._reserved_gb(), 2)} GB reserved)"
+            )
+            task_status.update_task(job["task_id"], status="STARTING", queue_position=0)
+            self.runner(job, self._on_finished)
+        self._refresh_positions()
+
+    def _refresh_positions(self):
+        for position, item in enumerate(sorted(self._queue), start=1):
+            if item[2]["task_id"] in task_status:
+                task_status.update_task(item[2]["task_id"], queue_position=position)
+
+    def _position(self, task_id):
+        for position, item in enumerate(sorted(self._queue), start=1):
+            if item[2]["task_id"] == task_id:
+                return position
+        return 0
+
+    def _capacity_gb(self):
+        return self.memory_provider.total_gb() * TRAINING_MEMORY_HEADROOM
+
+    def _reserved_gb(self):
+        return sum(job["estimated_memory_gb"] for job in self._running.values())
+
+    def _job_summary(self, job):
+        return {
+            "task_id": job["task_id"],
+            "model_name": job["model_name"],
+            "priority": job["priority"],
+            "estimated_memory_gb": job["estimated_memory_gb"],
+            "submitted_at": job["submitted_at"],
+        }
+
+
+training_scheduler = TrainingScheduler()
@@ -0,0 +1,213 @@
+import atexit
+import copy
+import importlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+from services.training_metrics import task_status, trained_models
+
+TRAINING_WORKERS = int(os.environ.get("TRAINING_WORKERS", "1"))
+# Jobs a worker runs before it is recycled; 0 keeps workers alive so their
+# base-model pool stays warm across jobs. Setting it to 1 returns all GPU
+# memory to the driver after every job at the cost of reloading the base.
+TRAINING_WORKER_MAX_JOBS = int(os.environ.get("TRAINING_WORKER_MAX_JOBS", "0"))
+# Imported by each worker before it reports ready.
+TRAINING_WORKER_PRELOAD = ("services.training",)
+
+
+def _worker_main(worker_id, job_queue, event_queue, max_jobs, preload):
+    # Import the training stack up front so a fresh worker is ready to go
+    # by the time the next job is dispatched.
+    for module in preload:
+        importlib.import_module(module)
+
+    def forward_status(task_id, status):
+        event_queue.put(("status", worker_id, task_id, copy.deepcopy(status)))
+
+    task_status.add_listener(forward_status)
+    event_queue.put(("ready", worker_id, os.getpid()))
+
+    for _ in range(max_jobs) if max_jobs else itertools.count():
+        job = job_queue.get()
+        if job is None:
+            return
+        task_id = job["task_id"]
+        error = None
+        try:
+            job["fn"](**job["kwargs"])
+        except Exception as e:
+            traceback.print_exc()
+            error = getattr(e, "detail", str(e))
+        status = task_status.get(task_id, {})
+        if error and status.get("status") not in ("COMPLETED", "FAILED"):
+            task_status[task_id] = {"status": "FAILED", "progress": 0, "error": error}
+        event_queue.put(("finished", worker_id, task_id, trained_models.get(task_id)))
+
+
+class TrainingWorkerPool:
+    """Runs training jobs in spawned worker processes outside the API server.
+
+    Status written to task_status inside a worker is forwarded over a queue
+    and mirrored into the server's task_status, and the trained adapter is
+    handed back as its output path. Workers live across jobs so the base
+    models they pool stay loaded; with `max_jobs` set a worker is recycled
+    after that many jobs instead. A worker that dies mid-job marks the job
+    FAILED and is replaced.
+    """
+
+    def __init__(
+        self,
+        num_workers=TRAINING_WORKERS,
+        max_jobs=TRAINING_WORKER_MAX_JOBS,
+        preload=TRAINING_WORKER_PRELOAD,
+    ):
+        self.num_workers = num_workers
+        self.max_jobs = max_jobs
+        self.preload = preload
+        self._context = multiprocessing.get_context("spawn")
+        self._event_queue = None
+        self._workers = {}
+        self._pending = []
+        self._callbacks = {}
+        self._lock = threading.RLock()
+        self._started = False
+        self._stopping = False
+
+    def run(self, job, on_finished):
+        with self._lock:
+            self._ensure_started()
+            self._callbacks[job["task_id"]] = on_finished
+            self._pending.append(
+                {"task_id": job["task_id"], "fn": job["fn"], "kwargs": job["kwargs"]}
+            )
+            self._dispatch()
+
+    def describe(self):
+        with self._lock:
+            return {
+                "workers": [
+                    {
+                        "worker_id": worker_id,
+                        "pid": worker["process"].pid,
+                        "alive": worker["process"].is_alive(),
+                        "task_id": worker["task_id"],
+                        "jobs_run": worker["jobs_run"],
+                    }
+                    for worker_id, worker in self._workers.items()
+                ],
+                "pending": [job["task_id"] for job in self._pending],
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._stopping = True
+            for worker in self._workers.values():
+                if worker["process"].is_alive():
+                    worker["jobs"].put(None)
+            for worker in self._workers.values():
+                worker["process"].join(timeout=5)
+                if worker["process"].is_alive():
+                    worker["process"].terminate()
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        self._event_queue = self._context.Queue()
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        threading.Thread(target=self._listen, daemon=True).start()
+        threading.Thread(target=self._monitor, daemon=True).start()
+        atexit.register(self.shutdown)
+        self._started = True
+
+    def _spawn(self, worker_id):
+        jobs = self._context.Queue()
+        # Not daemonic: dataset preprocessing inside a job starts its own
+        # processes, which daemonic processes are not allowed to do.
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, jobs, self._event_queue, self.max_jobs, self.preload),
+            name=f"training-worker-{worker_id}",
+        )
+        process.start()
+        self._workers[worker_id] = {
+            "process": process,
+            "jobs": jobs,
+            "task_id": None,
+            "jobs_run": 0,
+        }
+
+    def _dispatch(self):
+        for worker in self._workers.values():
+            if not self._pending:
+                return
+            if worker["task_id"] is None and self._accepts_jobs(worker):
+                job = self._pending.pop(0)
+                worker["task_id"] = job["task_id"]
+                worker["jobs_run"] += 1
+                worker["jobs"].put(job)
+
+    def _accepts_jobs(self, worker):
+        return not self.max_jobs or worker["jobs_run"] < self.max_jobs
+
+    def _listen(self):
+        while True:
+            event = self._event_queue.get()
+            kind, worker_id = event[0], event[1]
+            if kind == "status":
+                task_status[event[2]] = event[3]
+            elif kind == "ready":
+                print(f"[WORKER POOL] Worker {worker_id} ready (pid {event[2]})")
+            elif kind == "finished":
+                task_id, adapter_path = event[2], event[3]
+                if adapter_path:
+                    trained_models[task_id] = adapter_path
+                self._finish(worker_id, task_id)
+
+    def _monitor(self):
+        while not self._stopping:
+            time.sleep(1)
+            crashed = []
+            with self._lock:
+                if self._stopping:
+                    return
+                for worker_id, worker in list(self._workers.items()):
+                    if worker["process"].is_alive():
+                        continue
+                    task_id = worker["task_id"]
+                    exit_code = worker["process"].exitcode
+                    # A clean exit is a recycled worker; its "finished" event
+                    # is still on the way through the queue.
+                    if task_id is not None and exit_code != 0:
+                        print(
+                            f"[WORKER POOL] Worker {worker_id} died during task "
+                            f"{task_id} (exit code {exit_code})"
+                        )
+                        task_status[task_id] = {
+                            "status": "FAILED",
+                            "progress": 0,
+                            "error": f"Training worker exited with code {exit_code}",
+                        }
+                        crashed.append((worker_id, task_id))
+                    self._spawn(worker_id)
+                self._dispatch()
+            # Completion callbacks re-enter the scheduler, so run them unlocked.
+            for worker_id, task_id in crashed:
+                self._finish(worker_id, task_id)
+
+    def _finish(self, worker_id, task_id):
+        with self._lock:
+            worker = self._workers.get(worker_id)
+            if worker is not None and worker["task_id"] == task_id:
+                worker["task_id"] = None
+            on_finished = self._callbacks.pop(task_id, None)
+            self._dispatch()
+        if on_finished is not None:
+            on_finished(task_id)
+
+
+training_worker_pool = TrainingWorkerPool()
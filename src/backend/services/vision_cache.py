@@ -0,0 +1,211 @@
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import torch
+from services.response_cache import image_hash
+
+VISION_CACHE = os.environ.get("VISION_CACHE", "1") == "1"
+VISION_CACHE_BUDGET_MB = float(os.environ.get("VISION_CACHE_BUDGET_MB", "1024"))
+
+# Attribute names of the vision encoder in the supported architectures:
+# Mllama (Llama 3.2 Vision), Qwen2-VL and Llava/Pixtral.
+VISION_TOWER_NAMES = ("vision_model", "visual", "vision_tower")
+
+
+def _nbytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    if isinstance(value, Mapping):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+def _signature(args, kwargs):
+    values = list(args) + list(kwargs.values())
+    return tuple(tuple(v.shape) for v in values if isinstance(v, torch.Tensor))
+
+
+def _nesting(images):
+    depth = 0
+    while isinstance(images, (list, tuple)) and images:
+        depth += 1
+        images = images[0]
+    return depth
+
+
+def find_vision_tower(model):
+    """Outermost vision encoder module of a (possibly PEFT-wrapped) model."""
+    for name, module in model.named_modules():
+        if name.rsplit(".", 1)[-1] in VISION_TOWER_NAMES:
+            return module
+    return None
+
+
+class _CachedImageProcessor:
+    """Stands in for a processor's image_processor and reuses its outputs."""
+
+    def __init__(self, image_processor, cache):
+        self._image_processor = image_processor
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._image_processor, name)
+
+    def __call__(self, *args, **kwargs):
+        key = self._cache.current_key("pixels")
+        if key is None:
+            return self._image_processor(*args, **kwargs)
+        # The same image passed flat or nested comes back in another layout.
+        images = args[0] if args else kwargs.get("images")
+        options = {k: v for k, v in kwargs.items() if k not in ("images", "videos")}
+        signature = (_nesting(images), repr(sorted(options.items())))
+        features = self._cache.get(key, signature)
+        if features is None:
+            features = self._image_processor(*args, **kwargs)
+            self._cache.put(key, features, signature)
+        # Callers may move the returned features to the GPU in place.
+        return type(features)(dict(features))
+
+
+class VisionFeatureCache:
+    """Preprocessed pixels and vision-encoder outputs reused across questions.
+
+    Follow-up questions about the same image only pay for the language
+    model: the processor's image preprocessing and the vision tower forward
+    are served from here. Entries are keyed by model, adapter version and
+    image content hash, so LoRA weights on vision layers never leak across
+    apps, and the least recently used are dropped beyond `budget_mb`.
+    Encoder outputs stay on the model's device.
+
+    Generation code opts in with scope() around the model it holds and
+    images() around one processor call plus generate; outside both, the
+    wrapped modules behave exactly as before.
+    """
+
+    def __init__(self, enabled=VISION_CACHE, budget_mb=VISION_CACHE_BUDGET_MB):
+        self.enabled = enabled
+        self.budget_bytes = int(budget_mb * 1024**2)
+        self._entries = OrderedDict()
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {
+            "pixels": {"hits": 0, "misses": 0},
+            "encoder": {"hits": 0, "misses": 0},
+            "evictions": 0,
+        }
+
+    @contextmanager
+    def scope(self, model, tokenizer, model_id, version=None):
+        if not self.enabled:
+            yield
+            return
+        self._attach(model, tokenizer)
+        self._local.model = (model_id, version)
+        try:
+            yield
+        finally:
+            self._local.model = None
+
+    @contextmanager
+    def images(self, images):
+        hashes = [image_hash(image) for image in images if image is not None]
+        self._local.images = tuple(hashes) if hashes else None
+        try:
+            yield
+        finally:
+            self._local.images = None
+
+    def current_key(self, kind):
+        model = getattr(self._local, "model", None)
+        images = getattr(self._local, "images", None)
+        if model is None or images is None:
+            return None
+        return (kind,) + model + images
+
+    def get(self, key, signature=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["signature"] != signature:
+                entry = None
+            self.stats[key[0]]["hits" if entry else "misses"] += 1
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry["value"]
+
+    def put(self, key, value, signature=None):
+        size = _nbytes(value)
+        if size > self.budget_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._used_bytes -= previous["bytes"]
+            self._entries[key] = {"value": value, "bytes": size, "signature": signature}
+            self._used_bytes += size
+            while self._used_bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._used_bytes -= evicted["bytes"]
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used_bytes = 0
+
+    def describe(self):
+        with self._lock:
+            stats = {}
+            for kind in ("pixels", "encoder"):
+                lookups = self.stats[kind]["hits"] + self.stats[kind]["misses"]
+                stats[kind] = dict(
+                    self.stats[kind],
+                    hit_rate=(
+                        round(self.stats[kind]["hits"] / lookups, 3) if lookups else 0.0
+                    ),
+                )
+            return {
+                "enabled": self.enabled,
+                "budget_mb": round(self.budget_bytes / 1024**2, 1),
+                "used_mb": round(self._used_bytes / 1024**2, 1),
+                "entries": len(self._entries),
+                "evictions": self.stats["evictions"],
+                "stats": stats,
+            }
+
+    def _attach(self, model, tokenizer):
+        image_processor = getattr(tokenizer, "image_processor", None)
+        if image_processor is not None and not isinstance(
+            image_processor, _CachedImageProcessor
+        ):
+            tokenizer.image_processor = _CachedImageProcessor(image_processor, self)
+
+        tower = find_vision_tower(model)
+        if tower is None or getattr(tower, "_vision_cache_wrapped", False):
+            return
+        forward = tower.forward
+
+        def cached_forward(*args, **kwargs):
+            key = self.current_key("encoder")
+            if key is None:
+                return forward(*args, **kwargs)
+            signature = _signature(args, kwargs)
+            output = self.get(key, signature)
+            if output is None:
+                output = forward(*args, **kwargs)
+                self.put(key, output, signature)
+            return output
+
+        tower.forward = cached_forward
+        tower._vision_cache_wrapped = True
+
+
+vision_cache = VisionFeatureCache()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The backend runs from this directory, so its packages import top-level.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Some modules create their sqlite files and caches under the working
+# directory on import; keep those out of the source tree.
+os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
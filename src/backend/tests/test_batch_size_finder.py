@@ -0,0 +1,162 @@
+import json
+
+import pytest
+
+for module in ("torch", "transformers", "peft", "psutil"):
+    pytest.importorskip(module)
+
+import torch  # noqa: E402
+from services import batch_size_finder  # noqa: E402
+from services.batch_size_finder import (  # noqa: E402
+    _fits,
+    _max_batch_size,
+    fit_micro_batch,
+    resolve_batch_config,
+    search_max_batch_size,
+)
+
+
+class FakeModel(torch.nn.Module):
+    """Runs out of memory on batches larger than `capacity`."""
+
+    def __init__(self, capacity, error=None):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.ones(1))
+        self.capacity = capacity
+        self.error = error
+        self.batch_sizes = []
+
+    @property
+    def device(self):
+        return self.weight.device
+
+    def forward(self, input_ids, **kwargs):
+        self.batch_sizes.append(input_ids.shape[0])
+        if self.error is not None:
+            raise self.error
+        if input_ids.shape[0] > self.capacity:
+            raise torch.cuda.OutOfMemoryError("CUDA out of memory")
+        return type("Output", (), {"loss": (self.weight * input_ids.sum()).sum()})
+
+
+def collate(samples):
+    return {"input_ids": torch.ones(len(samples), 4, dtype=torch.long)}
+
+
+def _fits_model(model):
+    return lambda size: _fits(model, collate, [{}], size, 8, 0)
+
+
+@pytest.mark.parametrize("capacity", [1, 3, 5, 16, 37, 63, 64])
+def test_search_finds_the_largest_batch_that_fits(capacity):
+    model = FakeModel(capacity)
+
+    assert search_max_batch_size(_fits_model(model), limit=64) == capacity
+    # Doubling plus bisection, never a linear scan.
+    assert len(model.batch_sizes) <= 2 * 7
+
+
+def test_search_stops_at_the_limit():
+    assert search_max_batch_size(_fits_model(FakeModel(1000)), limit=64) == 64
+
+
+def test_nothing_fits():
+    assert search_max_batch_size(_fits_model(FakeModel(0)), limit=64) == 0
+
+
+def test_out_of_memory_runtime_errors_count_as_not_fitting():
+    model = FakeModel(8, error=RuntimeError("CUDA error: out of memory"))
+
+    assert not _fits(model, collate, [{}], 1, 8, 0)
+
+
+def test_other_errors_propagate():
+    model = FakeModel(8, error=RuntimeError("shape mismatch"))
+
+    with pytest.raises(RuntimeError, match="shape mismatch"):
+        _fits(model, collate, [{}], 1, 8, 0)
+
+
+def test_probe_batches_are_padded_to_the_max_length():
+    shapes = []
+
+    class Recorder(FakeModel):
+        def forward(self, input_ids, **kwargs):
+            shapes.append(tuple(input_ids.shape))
+            return super().forward(input_ids, **kwargs)
+
+    assert _fits(Recorder(8), collate, [{}], 2, 16, 0)
+    assert shapes == [(2, 16)]
+
+
+@pytest.mark.parametrize(
+    "effective, limit, micro",
+    [(8, 8, 8), (8, 5, 4), (8, 3, 2), (12, 5, 4), (7, 6, 1), (4, 64, 4)],
+)
+def test_micro_batch_divides_the_effective_batch(effective, limit, micro):
+    assert fit_micro_batch(effective, limit) == micro
+
+
+class FakeTokenizer:
+    pad_token_id = 0
+
+
+@pytest.fixture
+def cache_file(tmp_path, monkeypatch):
+    path = tmp_path / "batch_size_cache.json"
+    monkeypatch.setattr(batch_size_finder, "BATCH_SIZE_CACHE_FILE", str(path))
+    monkeypatch.setattr(batch_size_finder, "hardware_key", lambda: "fake-gpu")
+    return path
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    """Replaces the CUDA probe with a search over a fake model."""
+    models = []
+
+    def find_max_batch_size(model, collator, samples, max_seq_length, pad_token_id):
+        models.append(model)
+        return search_max_batch_size(
+            lambda size: _fits(
+                model, collator, samples, size, max_seq_length, pad_token_id
+            )
+        )
+
+    monkeypatch.setattr(batch_size_finder, "find_max_batch_size", find_max_batch_size)
+    return models
+
+
+def _probe(model):
+    return _max_batch_size("m", model, FakeTokenizer(), collate, [{}], 8)
+
+
+def test_probe_results_are_cached(cache_file, probe):
+    model = FakeModel(6)
+
+    assert _probe(model) == (6, "probe")
+    assert json.loads(cache_file.read_text()) == {"m|fake-gpu|8": 6}
+
+    assert _probe(model) == (6, "cache")
+    assert len(probe) == 1
+
+
+def test_failed_probes_keep_the_request_and_are_not_cached(cache_file, probe):
+    model = FakeModel(6, error=ValueError("unsupported batch"))
+
+    assert _probe(model) == (0, "requested")
+    assert not cache_file.exists()
+
+
+def test_resolve_keeps_the_effective_batch(cache_file, probe, monkeypatch):
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+
+    config = resolve_batch_config(
+        "m", FakeModel(5), FakeTokenizer(), collate, [{}], 8, 2, 4
+    )
+
+    assert config == {
+        "micro_batch_size": 4,
+        "gradient_accumulation_steps": 2,
+        "effective_batch_size": 8,
+        "source": "probe",
+    }
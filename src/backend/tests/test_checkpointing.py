@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+for module in ("torch", "transformers", "peft", "psutil"):
+    pytest.importorskip(module)
+
+import torch  # noqa: E402
+from peft import LoraConfig, get_peft_model  # noqa: E402
+from services import checkpointing  # noqa: E402
+from services.checkpointing import (  # noqa: E402
+    BestAdapterCallback,
+    load_task_spec,
+    persist_task_status,
+    recover_interrupted_tasks,
+    save_task_spec,
+)
+from services.training_metrics import task_status  # noqa: E402
+from transformers import (  # noqa: E402
+    GPT2Config,
+    GPT2LMHeadModel,
+    TrainerControl,
+    TrainerState,
+)
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(checkpointing, "_persisted_statuses", {})
+
+
+def test_status_transitions_are_written_to_the_spec():
+    save_task_spec("task", {"job": "train_model", "status": "QUEUED"})
+
+    persist_task_status("task", {"status": "RUNNING", "progress": 10})
+    persist_task_status("task", {"status": "FAILED", "error": "boom"})
+
+    spec = load_task_spec("task")
+    assert spec["status"] == "FAILED"
+    assert spec["error"] == "boom"
+
+
+def test_tasks_without_a_spec_never_touch_the_disk(monkeypatch):
+    def fail(task_id):
+        raise AssertionError("read a spec for a task that has none")
+
+    monkeypatch.setattr(checkpointing, "load_task_spec", fail)
+
+    persist_task_status("export", {"status": "RUNNING", "progress": 50})
+
+
+def test_recovery_marks_active_tasks_interrupted_on_disk(monkeypatch):
+    save_task_spec("recovered-task", {"job": "train_model", "status": "RUNNING"})
+    save_task_spec("recovered-done", {"job": "train_model", "status": "COMPLETED"})
+    checkpointing._persisted_statuses.clear()  # as after a restart
+    monkeypatch.setattr(
+        task_status, "listeners", task_status.listeners + [persist_task_status]
+    )
+
+    assert recover_interrupted_tasks() == ["recovered-task"]
+
+    assert task_status["recovered-task"]["status"] == "INTERRUPTED"
+    assert load_task_spec("recovered-task")["status"] == "INTERRUPTED"
+    assert task_status["recovered-done"]["progress"] == 100
+
+
+def _lora_model():
+    torch.manual_seed(3407)
+    model = GPT2LMHeadModel(
+        GPT2Config(vocab_size=16, n_positions=8, n_embd=8, n_layer=1, n_head=2)
+    )
+    return get_peft_model(
+        model,
+        LoraConfig(r=2, target_modules=["c_attn"], fan_in_fan_out=True),
+    )
+
+
+def _evaluate(callback, model, step, eval_loss):
+    # Each evaluation sees different adapter weights.
+    for parameter in model.parameters():
+        if parameter.requires_grad:
+            parameter.data.fill_(step)
+    control = TrainerControl()
+    callback.on_evaluate(
+        None,
+        TrainerState(global_step=step),
+        control,
+        metrics={"eval_loss": eval_loss},
+        model=model,
+    )
+    return control
+
+
+def _checkpoint(tmp_path, step):
+    checkpoint = tmp_path / "checkpoints" / "task" / f"checkpoint-{step}"
+    checkpoint.mkdir(parents=True)
+    (checkpoint / "trainer_state.json").write_text(json.dumps({"global_step": step}))
+    return str(checkpoint)
+
+
+def test_early_stopping_state_survives_a_resume(tmp_path):
+    model = _lora_model()
+    callback = BestAdapterCallback("task", patience=2)
+    _evaluate(callback, model, 5, 1.0)
+    _evaluate(callback, model, 10, 0.8)
+    _evaluate(callback, model, 15, 0.9)
+    checkpoint = _checkpoint(tmp_path, 15)
+    # Evaluated after the checkpoint, then the run died.
+    _evaluate(callback, model, 20, 0.7)
+
+    resumed = BestAdapterCallback("task", patience=2)
+    resumed.restore(checkpoint)
+
+    assert resumed.evals == [[5, 1.0], [10, 0.8], [15, 0.9]]
+    assert resumed.best_step == 10
+    assert resumed.bad_evals == 1
+    # The step-20 weights on disk are not the best as of step 15.
+    assert resumed.best_state is None
+
+    # One more evaluation without improvement uses up the saved patience.
+    assert _evaluate(resumed, model, 20, 0.95).should_training_stop
+
+
+def test_the_best_adapter_is_restored_with_its_weights(tmp_path):
+    model = _lora_model()
+    callback = BestAdapterCallback("task", patience=3)
+    _evaluate(callback, model, 5, 1.0)
+    _evaluate(callback, model, 10, 0.8)
+    checkpoint = _checkpoint(tmp_path, 10)
+
+    resumed = BestAdapterCallback("task", patience=3)
+    resumed.restore(checkpoint)
+
+    assert resumed.best_step == 10
+    assert all(torch.all(w == 10) for w in resumed.best_state.values())
+
+
+def test_only_the_saving_rank_writes(tmp_path):
+    callback = BestAdapterCallback("task", save=False)
+    _evaluate(callback, _lora_model(), 5, 1.0)
+
+    assert not (tmp_path / "checkpoints" / "task" / "early_stopping").exists()
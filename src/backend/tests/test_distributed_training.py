@@ -0,0 +1,56 @@
+import json
+import os
+import uuid
+
+import pytest
+
+for module in ("torch", "transformers", "peft", "datasets", "fastapi", "psutil"):
+    pytest.importorskip(module)
+
+from services.distributed_training import run_distributed  # noqa: E402
+from services.training_metrics import task_status, trained_models  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_gloo_ranks_shard_data_and_only_rank_zero_saves(tmp_path, monkeypatch):
+    # torchrun starts the ranks in the working directory, so they need the
+    # backend on their path; outputs and checkpoints land in tmp_path.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(
+        "PYTHONPATH",
+        os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+    )
+    # Saving a PEFT adapter otherwise asks the Hub about the base model.
+    monkeypatch.setenv("HF_HUB_OFFLINE", "1")
+    monkeypatch.setenv("TRANSFORMERS_OFFLINE", "1")
+    task_id = str(uuid.uuid4())
+
+    run_distributed(
+        task_id,
+        "smoke_test",
+        {"task_id": task_id, "max_steps": 4},
+        nproc_per_node=2,
+        backend="gloo",
+    )
+
+    status = task_status[task_id]
+    assert status["status"] == "COMPLETED", status.get("error")
+    assert status["distributed"]["world_size"] == 2
+    metrics = status["metrics"]
+    assert metrics["world_size"] == 2
+    # 64 samples split across two ranks in micro-batches of 4.
+    assert metrics["batches_per_rank"] == 8
+    assert metrics["samples_per_step"] == 8
+    # Both ranks evaluated at steps 2 and 4 on gathered metrics; rank 0 kept
+    # the record.
+    assert metrics["early_stopping"]["best_step"] in (2, 4)
+    early_stopping = tmp_path / "checkpoints" / task_id / "early_stopping"
+    with open(early_stopping / "state.json") as f:
+        assert [step for step, _ in json.load(f)["evals"]] == [2, 4]
+
+    assert trained_models[task_id] == "outputs/ddp_smoke_test"
+    assert (tmp_path / "outputs" / "ddp_smoke_test" / "adapter_config.json").exists()
+    assert (tmp_path / "outputs" / "ddp_smoke_test" / "tokenizer.json").exists()
+    checkpoints = os.listdir(tmp_path / "checkpoints" / task_id)
+    assert "checkpoint-2" in checkpoints and "checkpoint-4" in checkpoints
@@ -0,0 +1,99 @@
+import pytest
+
+for module in ("torch", "transformers", "peft", "psutil", "sklearn", "pandas", "PIL"):
+    pytest.importorskip(module)
+
+import pandas as pd  # noqa: E402
+from services.hparam_search import (  # noqa: E402
+    successive_halving,
+    trial_step_budget,
+)
+from utils import config_loader  # noqa: E402
+
+
+class FakeTrials:
+    """Scores each config by its "loss" and records every training call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, trial, config, steps, from_steps):
+        self.calls.append((trial, steps, from_steps))
+        return config["loss"] / steps
+
+
+def _configs(*losses):
+    return [{"loss": loss} for loss in losses]
+
+
+def test_survivors_continue_from_the_previous_rung():
+    trials = FakeTrials()
+
+    winner, rungs = successive_halving(
+        _configs(9, 3, 5, 1, 7, 2, 8, 4, 6), trials, min_steps=5, max_steps=45
+    )
+
+    assert winner == {"loss": 1}
+    assert [rung["steps"] for rung in rungs] == [5, 15]
+    # The three best of the first rung train from step 5 to 15, not from 0.
+    assert trials.calls[9:] == [(3, 15, 5), (5, 15, 5), (1, 15, 5)]
+    assert all(from_steps == 0 for _, _, from_steps in trials.calls[:9])
+
+
+def test_the_search_stops_at_the_step_budget():
+    trials = FakeTrials()
+
+    _, rungs = successive_halving(
+        _configs(*range(1, 10)), trials, min_steps=5, max_steps=14
+    )
+
+    assert [rung["steps"] for rung in rungs] == [5]
+    assert len(trials.calls) == 9
+
+
+def test_failed_trials_rank_last():
+    trials = FakeTrials()
+
+    winner, rungs = successive_halving(
+        _configs(float("inf"), 2, 1), trials, min_steps=1, max_steps=9
+    )
+
+    assert winner == {"loss": 1}
+    assert rungs[0]["trials"][-1]["trial"] == 0
+
+
+def test_trial_step_budget():
+    assert trial_step_budget(5, 3) == 45
+    assert trial_step_budget(5, 3, max_trial_steps=15) == 15
+    with pytest.raises(ValueError):
+        trial_step_budget(5, 3, max_trial_steps=14)
+    with pytest.raises(ValueError):
+        trial_step_budget(5, 1)
+
+
+def test_config_files_gain_the_lora_rank_column(tmp_path, monkeypatch):
+    monkeypatch.setattr(config_loader, "CONFIG_DIR", str(tmp_path))
+    model_name = "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit"
+    path = tmp_path / config_loader.CONFIG_FILES[model_name]
+    path.write_text(
+        "model_name,goal_type,target,batch_size,learning_rate,epochs,optimizer,"
+        "mixed_precision,sequence_length\n"
+        "unsloth/Qwen2-VL-2B-Instruct,Accuracy,80%,16,0.0003,6,AdamW,No,2048\n"
+    )
+
+    assert config_loader.migrate_model_configs(str(tmp_path)) == [path.name]
+    assert config_loader.migrate_model_configs(str(tmp_path)) == []
+    assert "lora_rank" not in config_loader.load_model_config(
+        model_name, "Accuracy", "80%"
+    )
+
+    searched = dict(
+        config_loader.load_model_config(model_name, "Accuracy", "80%"), lora_rank=32
+    )
+    config_loader.append_model_config(model_name, "Accuracy", "80%", searched)
+
+    assert (
+        config_loader.load_model_config(model_name, "Accuracy", "80%")["lora_rank"]
+        == 32
+    )
+    assert pd.read_csv(path)["lora_rank"].isna().tolist() == [True, False]
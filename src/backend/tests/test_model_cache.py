@@ -0,0 +1,129 @@
+import pytest
+
+for module in ("torch",):
+    pytest.importorskip(module)
+
+from services import model_cache  # noqa: E402
+from services.model_cache import ModelCache  # noqa: E402
+
+
+class FakeModel:
+    def __init__(self, gb):
+        self.gb = gb
+
+    def get_memory_footprint(self):
+        return self.gb * 1024**3
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Wall-clock ticks can tie within one test; recency needs a strict order.
+    fake = FakeClock()
+    monkeypatch.setattr(model_cache, "time", fake)
+    return fake
+
+
+class Loader:
+    def __init__(self, gb=4):
+        self.gb = gb
+        self.loaded = []
+
+    def __call__(self, key):
+        def load():
+            self.loaded.append(key)
+            return FakeModel(self.gb), object()
+
+        return load
+
+
+def _use(cache, loader, key):
+    cache.acquire(key, loader(key))
+    cache.release(key)
+
+
+def _resident(cache):
+    return [entry["app_name"] for entry in cache.describe()["resident"]]
+
+
+def test_models_load_once_and_are_then_hits():
+    cache, loader = ModelCache(budget_gb=10, pinned=[]), Loader()
+
+    _use(cache, loader, "a")
+    _use(cache, loader, "a")
+
+    assert loader.loaded == ["a"]
+    assert cache.describe()["stats"] == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_lru_evicts_the_least_recently_used_idle_model():
+    cache, loader = ModelCache(budget_gb=10, policy="lru", pinned=[]), Loader()
+    _use(cache, loader, "a")
+    _use(cache, loader, "b")
+    _use(cache, loader, "a")
+
+    _use(cache, loader, "c")
+
+    assert _resident(cache) == ["a", "c"]
+    assert cache.describe()["stats"]["evictions"] == 1
+
+
+def test_lfu_evicts_the_least_frequently_used_idle_model():
+    cache, loader = ModelCache(budget_gb=10, policy="lfu", pinned=[]), Loader()
+    _use(cache, loader, "a")
+    _use(cache, loader, "a")
+    _use(cache, loader, "b")
+    _use(cache, loader, "b")
+    _use(cache, loader, "a")
+
+    _use(cache, loader, "c")
+
+    # b was used more recently than a, but a has more hits.
+    assert _resident(cache) == ["a", "c"]
+
+
+def test_models_in_use_are_never_evicted():
+    cache, loader = ModelCache(budget_gb=6, pinned=[]), Loader()
+    cache.acquire("a", loader("a"))
+    cache.acquire("b", loader("b"))
+
+    assert _resident(cache) == ["a", "b"]
+    assert not cache.evict("a")
+
+    cache.release("a")
+    assert _resident(cache) == ["b"]
+
+
+def test_pinned_models_stay_until_unpinned():
+    cache, loader = ModelCache(budget_gb=6, pinned=["a"]), Loader()
+    _use(cache, loader, "a")
+    _use(cache, loader, "b")
+
+    assert _resident(cache) == ["a"]
+
+    cache.acquire("b", loader("b"))
+    cache.pin("a", pinned=False)
+
+    assert _resident(cache) == ["b"]
+
+
+def test_explicit_eviction_frees_an_idle_model():
+    cache, loader = ModelCache(budget_gb=10, pinned=[]), Loader()
+    _use(cache, loader, "a")
+
+    assert cache.evict("a")
+    assert "a" not in cache
+    assert not cache.evict("a")
+
+
+def test_unknown_policies_are_rejected():
+    with pytest.raises(ValueError):
+        ModelCache(policy="fifo")
@@ -0,0 +1,87 @@
+import pytest
+
+for module in ("torch", "transformers", "peft", "psutil"):
+    pytest.importorskip(module)
+
+from services.model_pool import BaseModelPool  # noqa: E402
+
+
+class FakeModel:
+    def get_memory_footprint(self):
+        return 2 * 1024**3
+
+
+class FakeLoader:
+    def __init__(self):
+        self.loaded = []
+
+    def __call__(self, model_name):
+        self.loaded.append(model_name)
+        return FakeModel(), object()
+
+
+@pytest.fixture
+def loader():
+    return FakeLoader()
+
+
+@pytest.fixture
+def pool(loader):
+    return BaseModelPool(budget_gb=5, loader=loader)
+
+
+def _resident(pool, model_name):
+    return next(e for e in pool.describe()["resident"] if e["model"] == model_name)
+
+
+def test_inference_shares_the_warm_base(pool, loader):
+    first, _ = pool.acquire("base")
+    second, _ = pool.acquire("base")
+
+    assert first is second
+    assert loader.loaded == ["base"]
+    assert _resident(pool, "base")["refcount"] == 2
+
+
+def test_training_gets_a_private_copy_while_inference_holds_the_base(pool, loader):
+    served, _ = pool.acquire("base")
+    trained, _ = pool.acquire("base", training=True)
+
+    assert trained is not served
+    assert pool.describe()["stats"]["private_loads"] == 1
+    assert _resident(pool, "base")["mode"] == "inference"
+
+    pool.release("base", trained)
+    assert _resident(pool, "base")["refcount"] == 1
+
+
+def test_a_released_training_base_is_reused_for_inference(pool, loader):
+    model, _ = pool.acquire("base", training=True)
+    assert _resident(pool, "base")["mode"] == "training"
+    pool.release("base", model)
+
+    again, _ = pool.acquire("base")
+
+    assert again is model
+    assert loader.loaded == ["base"]
+    assert _resident(pool, "base")["mode"] == "inference"
+
+
+def test_idle_bases_are_evicted_over_budget(pool, loader):
+    a, _ = pool.acquire("a")
+    pool.release("a", a)
+    b, _ = pool.acquire("b")
+    c, _ = pool.acquire("c")
+
+    assert [e["model"] for e in pool.describe()["resident"]] == ["b", "c"]
+    assert pool.describe()["stats"]["evictions"] == 1
+
+
+def test_bases_inherited_from_another_process_are_dropped(pool, loader):
+    model, _ = pool.acquire("base")
+    pool.release("base", model)
+    pool._pid = -1  # as seen from a forked child
+
+    pool.acquire("base")
+
+    assert loader.loaded == ["base", "base"]
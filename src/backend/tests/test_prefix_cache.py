@@ -0,0 +1,100 @@
+import pytest
+
+for module in ("torch", "transformers"):
+    pytest.importorskip(module)
+
+import torch  # noqa: E402
+from services.prefix_cache import PrefixKVCache  # noqa: E402
+from transformers import BatchEncoding  # noqa: E402
+
+PROMPT = "<user> what is this? <assistant>"
+QUESTION = "what is this?"
+
+
+def tokenizer(image, text, **kwargs):
+    # One token per character, so a prefix tokenizes as the prompt's start.
+    return BatchEncoding({"input_ids": torch.tensor([[ord(c) for c in text]])})
+
+
+class FakeModel:
+    """Streams two answer tokens, failing after `fail_after` when given a cache."""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.generates = []
+
+    def __call__(self, input_ids, past_key_values, use_cache):
+        return type("Output", (), {"past_key_values": past_key_values})
+
+    def modules(self):
+        return []
+
+    def generate(self, input_ids, streamer=None, past_key_values=None, **kwargs):
+        cached = past_key_values is not None
+        self.generates.append(cached)
+        if streamer is not None:
+            streamer.put(input_ids)
+        for token in range(2):
+            if cached and token == self.fail_after:
+                raise ValueError("cache rejected")
+            if streamer is not None:
+                streamer.put(torch.tensor([token]))
+        if streamer is not None:
+            streamer.end()
+        return torch.tensor([[0, 1]])
+
+
+class RecordingStreamer:
+    def __init__(self):
+        self.puts = []
+        self.ended = False
+
+    def put(self, value):
+        self.puts.append(value.tolist())
+
+    def end(self):
+        self.ended = True
+
+
+def _generate(cache, model, streamer):
+    inputs = tokenizer(None, PROMPT)
+    with cache.scope("app", 1):
+        return cache.generate(
+            model, tokenizer, inputs, None, PROMPT, QUESTION, streamer=streamer
+        )
+
+
+def test_generation_starts_from_the_cached_prefix():
+    cache, model = PrefixKVCache(enabled=True), FakeModel()
+
+    _generate(cache, model, RecordingStreamer())
+    _generate(cache, model, RecordingStreamer())
+
+    assert model.generates == [True, True]
+    assert cache.describe()["stats"]["hits"] == 1
+    assert cache.describe()["stats"]["reused_tokens"] == 2 * PROMPT.index(QUESTION)
+
+
+def test_a_rejected_cache_falls_back_before_anything_is_streamed():
+    cache, model = PrefixKVCache(enabled=True), FakeModel(fail_after=0)
+    streamer = RecordingStreamer()
+
+    assert _generate(cache, model, streamer).tolist() == [[0, 1]]
+
+    assert model.generates == [True, False]
+    # The client sees the prompt and each token exactly once.
+    assert streamer.puts == [tokenizer(None, PROMPT)["input_ids"].tolist(), [0], [1]]
+    assert streamer.ended
+    assert cache.describe()["unsupported"] == ["app"]
+
+
+def test_errors_after_streaming_are_raised_instead_of_repeating_the_answer():
+    cache, model = PrefixKVCache(enabled=True), FakeModel(fail_after=1)
+    streamer = RecordingStreamer()
+
+    with pytest.raises(ValueError, match="cache rejected"):
+        _generate(cache, model, streamer)
+
+    assert model.generates == [True]
+    assert streamer.puts[1:] == [[0]]
+    assert cache.describe()["unsupported"] == []
@@ -0,0 +1,121 @@
+import pytest
+
+for module in ("PIL",):
+    pytest.importorskip(module)
+
+from PIL import Image  # noqa: E402
+from services import response_cache  # noqa: E402
+from services.response_cache import ResponseCache  # noqa: E402
+
+GREEDY = {"do_sample": False, "max_new_tokens": 16}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(response_cache, "time", fake)
+    return fake
+
+
+def _cache(**kwargs):
+    return ResponseCache(GREEDY, **dict({"enabled": True}, **kwargs))
+
+
+def _store(cache, question, model_id="app", version=1, answer=None):
+    key = cache.key(model_id, version, None, question)
+    cache.put(key, answer or f"answer to {question}")
+    return key
+
+
+def test_repeated_queries_are_answered_from_the_cache():
+    cache = _cache()
+    _store(cache, "what is this?")
+
+    assert cache.get(cache.key("app", 1, None, "what is this?")) == (
+        "answer to what is this?"
+    )
+    assert cache.get(cache.key("app", 1, None, "and this?")) is None
+    assert cache.describe()["stats"]["hit_rate"] == 0.5
+
+
+def test_sampling_disables_the_cache():
+    cache = ResponseCache({"max_new_tokens": 16}, enabled=True)
+
+    assert not cache.enabled
+    assert cache.key("app", 1, None, "what is this?") is None
+
+
+def test_images_are_part_of_the_key():
+    cache = _cache()
+    red = Image.new("RGB", (4, 4), "red")
+    blue = Image.new("RGB", (4, 4), "blue")
+    cache.put(cache.key("app", 1, red, "colour?"), "red")
+
+    assert cache.get(cache.key("app", 1, red.copy(), "colour?")) == "red"
+    assert cache.get(cache.key("app", 1, blue, "colour?")) is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = _cache(ttl_seconds=60)
+    key = _store(cache, "q")
+
+    clock.now = 59
+    assert cache.get(key) is not None
+
+    clock.now = 60
+    assert cache.get(key) is None
+    assert cache.describe()["entries"] == 0
+
+
+def test_least_recently_used_answers_are_evicted():
+    cache = _cache(max_entries=2)
+    first = _store(cache, "first")
+    second = _store(cache, "second")
+    cache.get(first)
+
+    _store(cache, "third")
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.stats["evictions"] == 1
+
+
+def test_a_new_adapter_version_drops_the_old_answers():
+    cache = _cache()
+    old = _store(cache, "q", version=1)
+    other = _store(cache, "q", model_id="other")
+
+    new = cache.key("app", 2, None, "q")
+
+    assert cache.get(new) is None
+    assert old not in cache._entries
+    assert cache.get(other) is not None
+    assert cache.stats["invalidations"] == 1
+
+
+def test_answers_from_a_replaced_adapter_are_not_stored():
+    cache = _cache()
+    key = cache.key("app", 1, None, "q")
+    cache.key("app", 2, None, "other question")  # retrained mid-generation
+
+    cache.put(key, "stale")
+
+    assert cache.describe()["entries"] == 0
+
+
+def test_clear_drops_one_model_or_everything():
+    cache = _cache()
+    _store(cache, "q")
+    _store(cache, "q", model_id="other")
+
+    assert cache.clear("app") == 1
+    assert cache.clear() == 1
+    assert cache.describe()["entries"] == 0
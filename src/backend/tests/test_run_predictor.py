@@ -0,0 +1,90 @@
+import math
+
+import pytest
+
+for module in ("numpy", "pandas", "torch", "psutil"):
+    pytest.importorskip(module)
+
+import pandas as pd  # noqa: E402
+from utils import run_predictor as run_predictor_module  # noqa: E402
+from utils.run_predictor import RunPredictor, training_steps  # noqa: E402
+
+MODEL = "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit"
+BASE_CONFIG = {"batch_size": 8, "learning_rate": 3e-4, "epochs": 8}
+
+
+def _runs(batch_exponent, count=12):
+    """Runs whose time per step grows as batch_size ** batch_exponent."""
+    rows = []
+    for i in range(count):
+        batch_size = [1, 2, 4, 8][i % 4]
+        num_samples = [50, 100, 200][i % 3]
+        epochs = [4, 8][i % 2]
+        steps = math.ceil(num_samples / batch_size) * epochs
+        rows.append(
+            {
+                "model": MODEL,
+                "batch_size": batch_size,
+                "epochs": epochs,
+                "num_samples": num_samples,
+                "sequence_length": 2048,
+                "peak_memory_gb": 2.0 + batch_size,
+                "training_time": 0.01 * steps * batch_size**batch_exponent,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def fit_on(monkeypatch):
+    def fit_on(df):
+        monkeypatch.setattr(run_predictor_module, "load_runs_dataframe", lambda: df)
+        return RunPredictor()
+
+    return fit_on
+
+
+def test_no_recommendation_before_enough_runs(fit_on):
+    predictor = fit_on(_runs(0.5, count=4))
+
+    assert predictor.recommend(MODEL, BASE_CONFIG, hardware_gb=80) is None
+
+
+def test_runtime_is_fitted_on_steps_per_epoch(fit_on):
+    predictor = fit_on(_runs(0.5)).fit()
+
+    _, runtime = predictor.predict(
+        MODEL, [2, 8], sequence_length=2048, epochs=8, dataset_size=100
+    )
+
+    expected = [0.01 * 50 * 8 * 2**0.5, 0.01 * 13 * 8 * 8**0.5]
+    assert runtime == pytest.approx(expected, rel=0.05)
+
+
+def test_recommendations_keep_the_epochs(fit_on):
+    predictor = fit_on(_runs(0.5))
+
+    config = predictor.recommend(MODEL, BASE_CONFIG, dataset_size=100, hardware_gb=80)
+
+    # Larger batches are cheaper per sample here, and the epochs stay put.
+    assert config["batch_size"] == 16
+    assert config["epochs"] == 8
+    assert config["predicted_steps"] == training_steps(100, 16, 8) == 56
+
+
+def test_batches_that_do_not_pay_off_are_not_picked(fit_on):
+    predictor = fit_on(_runs(1.3))
+
+    config = predictor.recommend(MODEL, BASE_CONFIG, dataset_size=100, hardware_gb=80)
+
+    assert config["batch_size"] == 1
+    assert config["epochs"] == 8
+
+
+def test_recommendations_fit_in_memory(fit_on):
+    predictor = fit_on(_runs(0.5))
+
+    config = predictor.recommend(MODEL, BASE_CONFIG, dataset_size=100, hardware_gb=8)
+
+    assert config["batch_size"] == 4
+    assert config["predicted_peak_memory_gb"] <= 8 * 0.9
@@ -0,0 +1,36 @@
+import pytest
+
+for module in ("torch", "transformers", "peft", "psutil", "huggingface_hub"):
+    pytest.importorskip(module)
+
+from schemas.models import GGUFSaveRequest  # noqa: E402
+from services import save  # noqa: E402
+from services.gguf_inference import find_gguf_export  # noqa: E402
+from services.training_metrics import task_status  # noqa: E402
+
+
+class FakeModel:
+    def save_pretrained_gguf(self, path, tokenizer, quantization_method):
+        for method in quantization_method:
+            with open(f"{path}/unsloth.{method.upper()}.gguf", "w") as f:
+                f.write("gguf")
+
+
+def test_gguf_exports_with_the_defaults_are_served(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(save, "load_trained_model", lambda path: (FakeModel(), None))
+    request = GGUFSaveRequest(task_id="task", app_name="app")
+
+    save.run_export(
+        "export-id",
+        "outputs/task",
+        request.app_name,
+        request.quant_methods or [request.quant_method],
+        output_dir=request.output_dir,
+    )
+
+    status = task_status.pop("export-id")
+    assert status["status"] == "COMPLETED"
+    model_path, projector = find_gguf_export("app")
+    assert model_path == f"{status['export_path']}/unsloth.Q4_K_M.gguf"
+    assert projector is None
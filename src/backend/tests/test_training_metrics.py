@@ -0,0 +1,37 @@
+import threading
+
+import pytest
+
+for module in ("torch", "transformers", "psutil"):
+    pytest.importorskip(module)
+
+from services.training_metrics import TaskStatusStore  # noqa: E402
+
+
+def test_wait_for_returns_once_the_task_finishes():
+    store = TaskStatusStore()
+    store["export"] = {"status": "QUEUED"}
+    result = {}
+    waiter = threading.Thread(
+        target=lambda: result.update(store.wait_for("export", ("COMPLETED",)))
+    )
+    waiter.start()
+
+    store.update_task("export", status="EXPORTING", progress=50)
+    store["other"] = {"status": "COMPLETED"}
+    waiter.join(timeout=0.2)
+    assert waiter.is_alive()
+
+    store["export"] = {"status": "COMPLETED", "export_path": "exports/app"}
+    waiter.join(timeout=5)
+
+    assert result == {"status": "COMPLETED", "export_path": "exports/app"}
+    assert store.listeners == []
+
+
+def test_wait_for_a_task_that_already_finished():
+    store = TaskStatusStore()
+    store["export"] = {"status": "FAILED", "error": "boom"}
+
+    assert store.wait_for("export", ("COMPLETED", "FAILED"))["error"] == "boom"
+    assert store.listeners == []
@@ -0,0 +1,162 @@
+import pytest
+
+for module in ("torch", "transformers", "peft", "psutil"):
+    pytest.importorskip(module)
+
+from services.checkpointing import load_task_spec  # noqa: E402
+from services.training_metrics import task_status  # noqa: E402
+from services.training_scheduler import (  # noqa: E402
+    TRAINING_MEMORY_HEADROOM,
+    SimulatedMemoryProvider,
+    TrainingScheduler,
+)
+
+
+class FakeRunner:
+    """Records admitted jobs; a test finishes them by calling `finish`."""
+
+    def __init__(self):
+        self.started = []
+        self._on_finished = {}
+
+    def __call__(self, job, on_finished):
+        self.started.append(job["task_id"])
+        self._on_finished[job["task_id"]] = on_finished
+
+    def finish(self, task_id):
+        self._on_finished.pop(task_id)(task_id)
+
+
+def _job():
+    pass
+
+
+@pytest.fixture
+def runner():
+    return FakeRunner()
+
+
+@pytest.fixture
+def scheduler(runner, tmp_path, monkeypatch):
+    # Submitting writes task specs under checkpoints/.
+    monkeypatch.chdir(tmp_path)
+    # 10 GB of usable budget after the headroom.
+    provider = SimulatedMemoryProvider(10 / TRAINING_MEMORY_HEADROOM)
+    return TrainingScheduler(memory_provider=provider, runner=runner)
+
+
+def _submit(scheduler, task_id, memory_gb, priority=0, exclusive=False):
+    return scheduler.submit(
+        task_id,
+        _job,
+        {},
+        model_name="unsloth/Qwen2-VL-2B-Instruct-bnb-4bit",
+        priority=priority,
+        exclusive=exclusive,
+        estimated_memory_gb=memory_gb,
+    )
+
+
+def test_admits_jobs_while_they_fit_in_the_budget(scheduler, runner):
+    assert _submit(scheduler, "a", 4) == 0
+    assert _submit(scheduler, "b", 4) == 0
+    assert _submit(scheduler, "c", 4) == 1
+
+    assert runner.started == ["a", "b"]
+    assert task_status["a"]["status"] == "STARTING"
+    assert task_status["c"]["status"] == "QUEUED"
+    assert task_status["c"]["queue_position"] == 1
+    assert scheduler.describe()["reserved_gb"] == 8
+
+
+def test_releasing_memory_admits_the_next_job(scheduler, runner):
+    _submit(scheduler, "a", 6)
+    _submit(scheduler, "b", 6)
+    assert runner.started == ["a"]
+
+    runner.finish("a")
+
+    assert runner.started == ["a", "b"]
+    assert scheduler.queue_position("b") == 0
+    assert task_status["b"]["status"] == "STARTING"
+
+
+def test_higher_priority_jobs_are_admitted_first(scheduler, runner):
+    _submit(scheduler, "running", 6)
+    _submit(scheduler, "low", 6, priority=0)
+    _submit(scheduler, "high", 6, priority=5)
+    _submit(scheduler, "low-later", 6, priority=0)
+
+    assert scheduler.queue_position("high") == 1
+    assert scheduler.queue_position("low") == 2
+    assert scheduler.queue_position("low-later") == 3
+
+    runner.finish("running")
+    assert runner.started == ["running", "high"]
+    assert task_status["low"]["queue_position"] == 1
+    assert task_status["low-later"]["queue_position"] == 2
+
+    runner.finish("high")
+    assert runner.started == ["running", "high", "low"]
+
+
+def test_a_job_larger_than_the_budget_runs_alone(scheduler, runner):
+    _submit(scheduler, "small", 2)
+    _submit(scheduler, "huge", 50)
+    assert runner.started == ["small"]
+
+    runner.finish("small")
+    assert runner.started == ["small", "huge"]
+
+
+def test_exclusive_jobs_never_share_the_device(scheduler, runner):
+    _submit(scheduler, "a", 1)
+    _submit(scheduler, "distributed", 1, exclusive=True)
+    _submit(scheduler, "b", 1)
+    assert runner.started == ["a"]
+
+    runner.finish("a")
+    assert runner.started == ["a", "distributed"]
+    assert scheduler.queue_position("b") == 1
+
+    runner.finish("distributed")
+    assert runner.started == ["a", "distributed", "b"]
+
+
+def test_cancel_removes_a_queued_job(scheduler, runner):
+    _submit(scheduler, "a", 8)
+    _submit(scheduler, "b", 8)
+    _submit(scheduler, "c", 8)
+
+    assert scheduler.cancel("b")
+    assert not scheduler.cancel("a")
+    assert task_status["b"]["status"] == "CANCELLED"
+    assert task_status["c"]["queue_position"] == 1
+
+    runner.finish("a")
+    assert runner.started == ["a", "c"]
+
+
+def test_resumable_jobs_keep_a_task_spec(scheduler):
+    _submit(scheduler, "a", 1)
+
+    spec = load_task_spec("a")
+    assert spec["job"] == "_job"
+    assert spec["status"] == "QUEUED"
+
+
+def test_non_resumable_jobs_keep_no_task_spec(scheduler, runner):
+    scheduler.submit(
+        "export",
+        _job,
+        {"token": "secret"},
+        model_name="unsloth/Qwen2-VL-2B-Instruct-bnb-4bit",
+        estimated_memory_gb=1,
+        resumable=False,
+        status_fields={"stage": "queued"},
+    )
+
+    assert load_task_spec("export") is None
+    assert runner.started == ["export"]
+    assert task_status["export"]["stage"] == "queued"
+    assert task_status["export"]["status"] == "STARTING"
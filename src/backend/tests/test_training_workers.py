@@ -0,0 +1,62 @@
+import os
+import threading
+
+import pytest
+
+for module in ("torch", "transformers", "peft", "psutil"):
+    pytest.importorskip(module)
+
+from services.model_pool import base_model_pool  # noqa: E402
+from services.training_metrics import task_status  # noqa: E402
+from services.training_workers import TrainingWorkerPool  # noqa: E402
+
+
+class TinyBase:
+    def get_memory_footprint(self):
+        return 1024**2
+
+
+def _load_tiny_base(model_name):
+    return TinyBase(), object()
+
+
+def _pooled_job(task_id):
+    # Runs inside the worker, whose pool would otherwise load a real model.
+    base_model_pool.loader = _load_tiny_base
+    model, _ = base_model_pool.acquire("tiny-base", training=True)
+    base_model_pool.release("tiny-base", model)
+    task_status[task_id] = {
+        "status": "COMPLETED",
+        "progress": 100,
+        "error": None,
+        "pid": os.getpid(),
+        "pool": base_model_pool.describe()["stats"],
+    }
+
+
+@pytest.fixture
+def worker_pool():
+    pool = TrainingWorkerPool(num_workers=1, preload=())
+    yield pool
+    pool.shutdown()
+
+
+def _run(worker_pool, task_id):
+    finished = threading.Event()
+    worker_pool.run(
+        {"task_id": task_id, "fn": _pooled_job, "kwargs": {"task_id": task_id}},
+        lambda _: finished.set(),
+    )
+    assert finished.wait(timeout=120)
+    return task_status[task_id]
+
+
+def test_back_to_back_jobs_reuse_the_workers_pooled_base(worker_pool):
+    first = _run(worker_pool, "first")
+    second = _run(worker_pool, "second")
+
+    assert second["pid"] == first["pid"]
+    assert first["pool"]["loads"] == 1
+    assert second["pool"]["loads"] == 1
+    assert second["pool"]["hits"] == 1
+    assert worker_pool.describe()["workers"][0]["jobs_run"] == 2
@@ -0,0 +1,164 @@
+import pytest
+
+for module in ("torch", "PIL"):
+    pytest.importorskip(module)
+
+import torch  # noqa: E402
+from PIL import Image  # noqa: E402
+from services.vision_cache import VisionFeatureCache  # noqa: E402
+
+MB = 1024**2
+
+
+def _features(mb):
+    return torch.zeros(mb * MB, dtype=torch.uint8)
+
+
+def test_least_recently_used_features_are_evicted_beyond_the_budget():
+    cache = VisionFeatureCache(enabled=True, budget_mb=2)
+    cache.put(("pixels", "a"), _features(1))
+    cache.put(("pixels", "b"), _features(1))
+    cache.get(("pixels", "a"))
+
+    cache.put(("pixels", "c"), _features(1))
+
+    assert cache.get(("pixels", "b")) is None
+    assert cache.get(("pixels", "a")) is not None
+    assert cache.describe()["used_mb"] == 2
+    assert cache.describe()["evictions"] == 1
+
+
+def test_features_larger_than_the_budget_are_not_stored():
+    cache = VisionFeatureCache(enabled=True, budget_mb=1)
+    cache.put(("pixels", "a"), _features(1))
+
+    cache.put(("pixels", "b"), _features(2))
+
+    assert cache.get(("pixels", "a")) is not None
+    assert cache.describe()["entries"] == 1
+
+
+def test_replacing_an_entry_keeps_the_accounting():
+    cache = VisionFeatureCache(enabled=True, budget_mb=2)
+    cache.put(("pixels", "a"), _features(1))
+
+    cache.put(("pixels", "a"), _features(2))
+
+    assert cache.describe()["used_mb"] == 2
+    assert cache.describe()["evictions"] == 0
+
+
+def test_a_different_call_signature_misses():
+    cache = VisionFeatureCache(enabled=True)
+    cache.put(("encoder", "a"), _features(1), signature=((1, 3),))
+
+    assert cache.get(("encoder", "a"), signature=((2, 3),)) is None
+    assert cache.describe()["stats"]["encoder"]["misses"] == 1
+
+
+def test_keys_include_the_model_version_and_image():
+    cache = VisionFeatureCache(enabled=True)
+    red = Image.new("RGB", (4, 4), "red")
+    blue = Image.new("RGB", (4, 4), "blue")
+
+    def key(model_id, version, image):
+        cache._local.model = (model_id, version)
+        with cache.images([image]):
+            return cache.current_key("pixels")
+
+    assert key("app", 1, red) == key("app", 1, red.copy())
+    assert key("app", 1, red) != key("app", 2, red)
+    assert key("app", 1, red) != key("other", 1, red)
+    assert key("app", 1, red) != key("app", 1, blue)
+    # No images in scope, no key.
+    assert cache.current_key("pixels") is None
+
+
+class FakeImageProcessor:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, images, **kwargs):
+        self.calls += 1
+        return {"pixel_values": torch.ones(1, 3, 2, 2)}
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.image_processor = FakeImageProcessor()
+
+
+class FakeVisionTower(torch.nn.Linear):
+    def __init__(self):
+        super().__init__(2, 2)
+        self.calls = 0
+
+    def forward(self, pixel_values):
+        self.calls += 1
+        return super().forward(pixel_values)
+
+
+class FakeVisionModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.vision_model = FakeVisionTower()
+
+
+def _ask(cache, model, processor, image, model_id="app", version=1):
+    with cache.scope(model, processor, model_id, version):
+        with cache.images([image]):
+            features = processor.image_processor([image])
+            model.vision_model(features["pixel_values"][..., 0, :])
+
+
+def test_follow_up_questions_reuse_pixels_and_encoder_outputs():
+    cache = VisionFeatureCache(enabled=True)
+    model, processor = FakeVisionModel(), FakeProcessor()
+    inner = processor.image_processor
+    image = Image.new("RGB", (4, 4), "red")
+
+    _ask(cache, model, processor, image)
+    _ask(cache, model, processor, image)
+
+    assert inner.calls == 1
+    assert model.vision_model.calls == 1
+    assert cache.describe()["stats"]["encoder"]["hits"] == 1
+
+    _ask(cache, model, processor, image, version=2)
+
+    assert inner.calls == 2
+    assert model.vision_model.calls == 2
+
+
+def test_outside_a_scope_the_wrapped_modules_are_untouched():
+    cache = VisionFeatureCache(enabled=True)
+    model, processor = FakeVisionModel(), FakeProcessor()
+    inner = processor.image_processor
+    image = Image.new("RGB", (4, 4), "red")
+    _ask(cache, model, processor, image)
+
+    processor.image_processor([image])
+    model.vision_model(torch.ones(1, 3, 2))
+
+    assert inner.calls == 2
+    assert model.vision_model.calls == 2
+
+
+def test_a_disabled_cache_never_wraps_the_model():
+    cache = VisionFeatureCache(enabled=False)
+    model, processor = FakeVisionModel(), FakeProcessor()
+
+    _ask(cache, model, processor, Image.new("RGB", (4, 4), "red"))
+
+    assert isinstance(processor.image_processor, FakeImageProcessor)
+    assert cache.describe()["entries"] == 0
+
+
+def test_clear_frees_the_budget():
+    cache = VisionFeatureCache(enabled=True, budget_mb=2)
+    cache.put(("pixels", "a"), _features(1))
+
+    cache.clear()
+
+    assert cache.describe()["used_mb"] == 0
+    assert cache.get(("pixels", "a")) is None
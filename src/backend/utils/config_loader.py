@@ -2,6 +2,7 @@ import difflib
 import os
 
 import pandas as pd
+from utils.run_predictor import run_predictor
 
 CONFIG_DIR = "configs"
 default_configs = {
@@ -50,17 +51,52 @@ adaptive_configs = {
 }
 
 
-def get_adaptive_config(model_name: str) -> dict:
-    return adaptive_configs.get(model_name, {})
+CONFIG_FILES = {
+    "unsloth/Llama-3.2-11B-Vision-bnb-4bit": "LLaMA_Configs.csv",
+    "unsloth/Pixtral-12B-2409": "Pixtral_Configs.csv",
+    "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit": "Qwen_Configs.csv",
+}
+# Columns added after the first config files shipped; older rows leave them
+# empty and fall back to the trainer's default.
+ADDED_CONFIG_COLUMNS = ["lora_rank"]
+
+
+def migrate_model_configs(config_dir=CONFIG_DIR):
+    """Adds any missing columns to the existing config CSVs in place."""
+    migrated = []
+    for csv_file in CONFIG_FILES.values():
+        path = os.path.join(config_dir, csv_file)
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path)
+        missing = [column for column in ADDED_CONFIG_COLUMNS if column not in df]
+        if not missing:
+            continue
+        for column in missing:
+            df[column] = pd.Series(dtype="Int64")
+        df.to_csv(path, index=False)
+        migrated.append(csv_file)
+    if migrated:
+        print(f"[CONFIG] Added {ADDED_CONFIG_COLUMNS} to {migrated}")
+    return migrated
+
+
+def get_adaptive_config(
+    model_name: str, dataset_size: int = None, sequence_length: int = 2048
+) -> dict:
+    config = dict(adaptive_configs.get(model_name, {}))
+    if not config:
+        return config
+    recommendation = run_predictor.recommend(
+        model_name, config, dataset_size=dataset_size, sequence_length=sequence_length
+    )
+    if recommendation:
+        config.update(recommendation)
+    return config
 
 
 def load_model_config(model_name: str, goal_type: str, target: str) -> dict:
-    filename_map = {
-        "unsloth/Llama-3.2-11B-Vision-bnb-4bit": "LLaMA_Configs.csv",
-        "unsloth/Pixtral-12B-2409": "Pixtral_Configs.csv",
-        "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit": "Qwen_Configs.csv",
-    }
-    csv_file = filename_map.get(model_name)
+    csv_file = CONFIG_FILES.get(model_name)
     if not csv_file:
         raise ValueError(f"No config for {model_name}")
     path = os.path.join(CONFIG_DIR, csv_file)
@@ -80,8 +116,9 @@ def load_model_config(model_name: str, goal_type: str, target: str) -> dict:
             ]
         else:
             return default_configs.get(model_name)
-    row = match.iloc[0]
-    return {
+    # Searched configs are appended, so the newest row for a target wins.
+    row = match.iloc[-1]
+    config = {
         "batch_size": int(row["batch_size"]),
         "learning_rate": float(row["learning_rate"]),
         "epochs": int(row["epochs"]),
@@ -89,3 +126,33 @@ def load_model_config(model_name: str, goal_type: str, target: str) -> dict:
         "mixed_precision": row["mixed_precision"] == "Yes",
         "sequence_length": int(row["sequence_length"]),
     }
+    if "lora_rank" in row and not pd.isna(row["lora_rank"]):
+        config["lora_rank"] = int(row["lora_rank"])
+    return config
+
+
+def append_model_config(model_name: str, goal_type: str, target: str, config: dict):
+    csv_file = CONFIG_FILES.get(model_name)
+    if not csv_file:
+        raise ValueError(f"No config for {model_name}")
+    path = os.path.join(CONFIG_DIR, csv_file)
+    migrate_model_configs()
+    df = pd.read_csv(path) if os.path.exists(path) else pd.DataFrame()
+    row = {
+        # Keep the naming already used in the file for this model.
+        "model_name": df["model_name"].iloc[0] if not df.empty else model_name,
+        "goal_type": goal_type,
+        "target": target,
+        "batch_size": config["batch_size"],
+        "learning_rate": config["learning_rate"],
+        "epochs": config["epochs"],
+        "optimizer": config["optimizer"],
+        "mixed_precision": "Yes" if config["mixed_precision"] else "No",
+        "sequence_length": config["sequence_length"],
+        "lora_rank": config.get("lora_rank"),
+    }
+    df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+    # Keep ranks integral next to the empty cells of older rows.
+    df["lora_rank"] = df["lora_rank"].astype("Int64")
+    df.to_csv(path, index=False)
+    return row
@@ -1,5 +1,7 @@
 import json
+import math
 import os
+import random
 
 from PIL import Image
 
@@ -44,3 +46,25 @@ def get_custom_dataset(json_file_path, root_folder):
         else:
             print(f"[WARNING] Image not found: {full_path}")
     return custom_dataset
+
+
+def stratified_eval_subset(eval_dataset, size, num_buckets=4, seed=42):
+    """Fixed eval subset that keeps the caption-length mix of the full split."""
+    if len(eval_dataset) <= size:
+        return list(eval_dataset)
+
+    def caption_length(sample):
+        return len(sample["messages"][1]["content"][0]["text"])
+
+    ordered = sorted(eval_dataset, key=caption_length)
+    bucket_size = math.ceil(len(ordered) / num_buckets)
+    buckets = [
+        ordered[i : i + bucket_size] for i in range(0, len(ordered), bucket_size)
+    ]
+
+    rng = random.Random(seed)
+    subset = []
+    for bucket in buckets:
+        share = round(size * len(bucket) / len(ordered))
+        subset.extend(rng.sample(bucket, min(share, len(bucket))))
+    return subset[:size]
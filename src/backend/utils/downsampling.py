@@ -0,0 +1,73 @@
+import numpy as np
+
+DEFAULT_POINTS = 500
+
+
+def lttb_indices(x, y, threshold):
+    """Indices kept by Largest-Triangle-Three-Buckets downsampling.
+
+    Always keeps the first and last point; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the average of the next bucket, which preserves the
+    visual shape of a curve far better than striding.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold <= 0 or threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:threshold])
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample_series(steps, values, points=DEFAULT_POINTS):
+    """(steps, values) reduced to at most `points` with LTTB."""
+    indices = lttb_indices(steps, values, points)
+    return [steps[i] for i in indices], [values[i] for i in indices]
+
+
+def downsample_log_history(log_history, points=DEFAULT_POINTS):
+    """Downsamples a Trainer log_history separately per kind of entry.
+
+    Training log entries (keyed on `loss`) and evaluation entries (keyed on
+    `eval_loss`) are reduced independently on their main metric; any other
+    entries, such as the final train summary, are always kept.
+    """
+    if not points or len(log_history) <= points:
+        return log_history
+
+    groups = {"loss": [], "eval_loss": [], None: []}
+    for position, entry in enumerate(log_history):
+        key = (
+            "loss" if "loss" in entry else "eval_loss" if "eval_loss" in entry else None
+        )
+        groups[key].append(position)
+
+    kept = list(groups[None])
+    for key in ("loss", "eval_loss"):
+        positions = groups[key]
+        if not positions:
+            continue
+        steps = [log_history[p].get("step", p) for p in positions]
+        values = [log_history[p][key] for p in positions]
+        kept.extend(positions[i] for i in lttb_indices(steps, values, points))
+    return [log_history[p] for p in sorted(kept)]
@@ -0,0 +1,64 @@
+# Rough architecture figures used to estimate peak training memory.
+MODEL_SPECS = {
+    "unsloth/Llama-3.2-11B-Vision-bnb-4bit": {
+        "params_b": 10.7,
+        "hidden_size": 4096,
+        "num_layers": 40,
+        "vocab_size": 128256,
+    },
+    "unsloth/Qwen2-VL-2B-Instruct-bnb-4bit": {
+        "params_b": 2.2,
+        "hidden_size": 1536,
+        "num_layers": 28,
+        "vocab_size": 151936,
+    },
+    "unsloth/Pixtral-12B-2409": {
+        "params_b": 12.4,
+        "hidden_size": 5120,
+        "num_layers": 40,
+        "vocab_size": 131072,
+    },
+}
+
+
+def estimate_peak_memory_gb(model_name, batch_size, sequence_length):
+    spec = MODEL_SPECS.get(model_name, MODEL_SPECS["unsloth/Pixtral-12B-2409"])
+    tokens = batch_size * sequence_length
+
+    # 4-bit weights plus quantization constants, LoRA weights and 8-bit Adam.
+    weights_gb = spec["params_b"] * 0.56
+    adapter_gb = spec["params_b"] * 0.02
+    # Gradient checkpointing keeps one bf16 hidden state per layer boundary and
+    # the activations of a single layer; logits are materialised in fp32.
+    per_token_bytes = (
+        spec["hidden_size"] * (2 * spec["num_layers"] + 34) + spec["vocab_size"] * 4
+    )
+    activations_gb = tokens * per_token_bytes / 1024**3
+    return round((weights_gb + adapter_gb + activations_gb) * 1.1, 2)
+
+
+def estimate_export_memory_gb(model_name):
+    spec = MODEL_SPECS.get(model_name, MODEL_SPECS["unsloth/Pixtral-12B-2409"])
+    # The 4-bit base with its adapter, plus the layer being merged back to
+    # 16-bit; an export holds no activations or optimizer state.
+    weights_gb = spec["params_b"] * (0.56 + 0.02)
+    merge_gb = spec["params_b"] * 2 / spec["num_layers"]
+    return round((weights_gb + merge_gb) * 1.1, 2)
+
+
+def estimate_inference_memory_gb(model_name, batch_size, sequence_length):
+    spec = MODEL_SPECS.get(model_name, MODEL_SPECS["unsloth/Pixtral-12B-2409"])
+    weights_gb = spec["params_b"] * (0.56 + 0.02)
+    # Generation keeps a bf16 key and value per layer for every token.
+    kv_cache_gb = (
+        batch_size * sequence_length * spec["num_layers"] * spec["hidden_size"] * 4
+    ) / 1024**3
+    return round((weights_gb + kv_cache_gb) * 1.1, 2)
+
+
+def gpu_memory_gb():
+    import torch
+
+    if not torch.cuda.is_available():
+        return 0.0
+    return torch.cuda.get_device_properties(0).total_memory / 1024**3
@@ -0,0 +1,184 @@
+import threading
+
+import numpy as np
+from utils.memory_estimates import (
+    MODEL_SPECS,
+    estimate_peak_memory_gb,
+    gpu_memory_gb,
+)
+from utils.run_registry import load_runs_dataframe
+
+MIN_RUNS_TO_FIT = 5
+CANDIDATE_BATCH_SIZES = [1, 2, 4, 8, 16]
+DEFAULT_SEQUENCE_LENGTH = 2048
+MEMORY_HEADROOM = 0.9
+RIDGE_LAMBDA = 1e-3
+
+
+def _ridge_fit(features, targets):
+    gram = features.T @ features + RIDGE_LAMBDA * np.eye(features.shape[1])
+    return np.linalg.solve(gram, features.T @ targets)
+
+
+def _params_b(model_names):
+    default = MODEL_SPECS["unsloth/Pixtral-12B-2409"]["params_b"]
+    return np.array(
+        [MODEL_SPECS.get(name, {}).get("params_b", default) for name in model_names]
+    )
+
+
+def _memory_features(model_names, batch_sizes, sequence_lengths):
+    # The analytic estimate carries the architecture knowledge; the fit only
+    # calibrates it against what runs actually reserved on our cards.
+    analytic = np.array(
+        [
+            estimate_peak_memory_gb(name, batch, seq)
+            for name, batch, seq in zip(model_names, batch_sizes, sequence_lengths)
+        ]
+    )
+    return np.column_stack([np.ones_like(analytic), analytic])
+
+
+def training_steps(dataset_sizes, batch_sizes, epochs):
+    """Optimizer steps of `epochs` passes over the dataset at `batch_sizes`."""
+    return np.ceil(np.asarray(dataset_sizes) / np.asarray(batch_sizes)) * epochs
+
+
+def _runtime_features(model_names, batch_sizes, sequence_lengths, steps):
+    # log(runtime) is close to linear in the log of the work per run.
+    return np.column_stack(
+        [
+            np.ones(len(batch_sizes)),
+            np.log(_params_b(model_names)),
+            np.log(batch_sizes),
+            np.log(sequence_lengths),
+            np.log(steps),
+        ]
+    )
+
+
+class RunPredictor:
+    """Predicts peak memory and wall-clock for a proposed training config.
+
+    Both models are ridge regressions fitted with NumPy on the run registry:
+    peak memory as a calibration of the analytic estimate, runtime as a
+    log-linear model of model size, batch size, sequence length and the
+    optimizer steps implied by the dataset size, batch size and epochs. The
+    fit is redone whenever new runs have been recorded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fitted_on = None
+        self.memory_coef = None
+        self.runtime_coef = None
+        self.default_dataset_size = 100
+
+    def fit(self):
+        df = load_runs_dataframe()
+        with self._lock:
+            if self._fitted_on == len(df):
+                return self
+            self._fitted_on = len(df)
+            df = df[(df["peak_memory_gb"] > 0) & (df["training_time"] > 0)]
+            if len(df) < MIN_RUNS_TO_FIT:
+                self.memory_coef = None
+                self.runtime_coef = None
+                return self
+
+            sequence_lengths = df["sequence_length"].fillna(DEFAULT_SEQUENCE_LENGTH)
+            dataset_sizes = df["num_samples"].dropna()
+            if not dataset_sizes.empty:
+                self.default_dataset_size = float(dataset_sizes.median())
+            dataset_sizes = df["num_samples"].fillna(self.default_dataset_size)
+            batch_sizes = df["batch_size"].values.astype(float)
+
+            self.memory_coef = _ridge_fit(
+                _memory_features(
+                    df["model"].values, df["batch_size"].values, sequence_lengths.values
+                ),
+                df["peak_memory_gb"].values,
+            )
+            self.runtime_coef = _ridge_fit(
+                _runtime_features(
+                    df["model"].values,
+                    batch_sizes,
+                    sequence_lengths.values.astype(float),
+                    training_steps(
+                        dataset_sizes.values.astype(float),
+                        batch_sizes,
+                        df["epochs"].values.astype(float),
+                    ),
+                ),
+                np.log(df["training_time"].values),
+            )
+            return self
+
+    @property
+    def fitted(self):
+        return self.memory_coef is not None
+
+    def predict(self, model_name, batch_sizes, sequence_length, epochs, dataset_size):
+        batch_sizes = np.asarray(batch_sizes, dtype=float)
+        count = len(batch_sizes)
+        names = np.array([model_name] * count)
+        sequence_lengths = np.full(count, float(sequence_length))
+        memory_x = _memory_features(
+            names, batch_sizes.astype(int), sequence_lengths.astype(int)
+        )
+        if not self.fitted:
+            return memory_x[:, 1], np.full(count, np.nan)
+        runtime_x = _runtime_features(
+            names,
+            batch_sizes,
+            sequence_lengths,
+            training_steps(
+                dataset_size or self.default_dataset_size, batch_sizes, epochs
+            ),
+        )
+        return memory_x @ self.memory_coef, np.exp(runtime_x @ self.runtime_coef)
+
+    def recommend(
+        self,
+        model_name,
+        base_config,
+        dataset_size=None,
+        sequence_length=DEFAULT_SEQUENCE_LENGTH,
+        hardware_gb=None,
+    ):
+        """Fastest candidate batch size whose predicted peak memory fits.
+
+        Candidates keep the base config's epochs, so every one of them sees
+        the dataset equally often and only the step count changes with the
+        batch size. Returns None until enough runs have been recorded to fit
+        on.
+        """
+        self.fit()
+        hardware_gb = gpu_memory_gb() if hardware_gb is None else hardware_gb
+        if not self.fitted or not hardware_gb:
+            return None
+
+        batch_sizes = np.array(CANDIDATE_BATCH_SIZES, dtype=float)
+        epochs = base_config["epochs"]
+        dataset_size = dataset_size or self.default_dataset_size
+        steps = training_steps(dataset_size, batch_sizes, epochs)
+        memory, runtime = self.predict(
+            model_name, batch_sizes, sequence_length, epochs, dataset_size
+        )
+        fits = memory <= hardware_gb * MEMORY_HEADROOM
+        if not fits.any():
+            return None
+
+        choice = int(np.argmin(np.where(fits, runtime, np.inf)))
+        return {
+            "batch_size": CANDIDATE_BATCH_SIZES[choice],
+            "epochs": epochs,
+            "predicted_steps": int(steps[choice]),
+            "predicted_peak_memory_gb": round(float(memory[choice]), 2),
+            "predicted_runtime_minutes": round(float(runtime[choice]), 2),
+            "hardware_gb": round(hardware_gb, 2),
+            "fitted_on_runs": self._fitted_on,
+        }
+
+
+run_predictor = RunPredictor()
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+RUN_REGISTRY_DB = os.path.join("configs", "training_runs.db")
+LEGACY_LOG_FILE = os.path.join("configs", "adapt_training_logs.xlsx")
+
+# Columns of the old adapt_training_logs.xlsx, kept for export.
+LEGACY_LOG_COLUMNS = [
+    "model",
+    "batch_size",
+    "learning_rate",
+    "epochs",
+    "peak_memory_gb",
+    "training_time",
+    "timestamp",
+]
+
+
+def _connect():
+    conn = sqlite3.connect(RUN_REGISTRY_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_run_registry():
+    os.makedirs(os.path.dirname(RUN_REGISTRY_DB), exist_ok=True)
+    conn = _connect()
+    c = conn.cursor()
+    # WAL lets concurrent training workers append while the API reads.
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS training_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT,
+            job_type TEXT,
+            model TEXT,
+            app_name TEXT,
+            dataset_path TEXT,
+            dataset_version TEXT,
+            num_samples INTEGER,
+            batch_size INTEGER,
+            learning_rate REAL,
+            epochs INTEGER,
+            sequence_length INTEGER,
+            config TEXT,
+            samples_per_second REAL,
+            peak_memory_gb REAL,
+            training_time REAL,
+            final_metrics TEXT,
+            timestamp TEXT
+        )
+    """
+    )
+    conn.commit()
+    empty = c.execute("SELECT COUNT(*) FROM training_runs").fetchone()[0] == 0
+    conn.close()
+    if empty and os.path.exists(LEGACY_LOG_FILE):
+        import_legacy_log(LEGACY_LOG_FILE)
+
+
+def import_legacy_log(path):
+    """One-off import of rows from the old Excel training log."""
+    try:
+        df = pd.read_excel(path)
+    except Exception as e:
+        print(f"Failed to import legacy training log: {str(e)}")
+        return 0
+    conn = _connect()
+    c = conn.cursor()
+    for _, row in df.iterrows():
+        config = {
+            "batch_size": int(row["batch_size"]),
+            "learning_rate": float(row["learning_rate"]),
+            "epochs": int(row["epochs"]),
+        }
+        c.execute(
+            """
+            INSERT INTO training_runs (
+                job_type, model, batch_size, learning_rate, epochs, config,
+                peak_memory_gb, training_time, final_metrics, timestamp
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                "legacy",
+                row["model"],
+                config["batch_size"],
+                config["learning_rate"],
+                config["epochs"],
+                json.dumps(config),
+                float(row["peak_memory_gb"]),
+                float(row["training_time"]),
+                json.dumps({}),
+                str(row["timestamp"]),
+            ),
+        )
+    conn.commit()
+    conn.close()
+    print(f"[RUN REGISTRY] Imported {len(df)} runs from {path}")
+    return len(df)
+
+
+def dataset_version(json_file_path):
+    with open(json_file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def _final_metrics(log_history):
+    final = {}
+    for entry in log_history:
+        for key, value in entry.items():
+            if key in ("train_loss", "eval_loss", "eval_accuracy", "loss"):
+                final[key] = value
+    return final
+
+
+def record_run(
+    task_id,
+    job_type,
+    model_name,
+    app_name,
+    dataset_path,
+    num_samples,
+    config,
+    metrics,
+    log_history,
+):
+    json_file_path = os.path.join("jsons", f"{dataset_path}.json")
+    row = (
+        task_id,
+        job_type,
+        model_name,
+        app_name,
+        dataset_path,
+        dataset_version(json_file_path) if os.path.exists(json_file_path) else None,
+        num_samples,
+        config.get("batch_size"),
+        config.get("learning_rate"),
+        config.get("epochs"),
+        config.get("sequence_length"),
+        json.dumps(config, default=str),
+        metrics.get("train_samples_per_second"),
+        metrics.get("peak_memory_gb", 0),
+        metrics.get("train_runtime_minutes", 0),
+        json.dumps(_final_metrics(log_history), default=str),
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    try:
+        conn = _connect()
+        c = conn.cursor()
+        c.execute(
+            """
+            INSERT INTO training_runs (
+                task_id, job_type, model, app_name, dataset_path, dataset_version,
+                num_samples, batch_size, learning_rate, epochs, sequence_length,
+                config, samples_per_second, peak_memory_gb, training_time,
+                final_metrics, timestamp
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            row,
+        )
+        conn.commit()
+        run_id = c.lastrowid
+        conn.close()
+        print(f"[RUN REGISTRY] Recorded run {run_id} for task {task_id}")
+        return run_id
+    except Exception as e:
+        print(f"Failed to record training run: {str(e)}")
+        return None
+
+
+def _row_to_dict(row):
+    run = dict(row)
+    run["config"] = json.loads(run["config"]) if run["config"] else {}
+    run["final_metrics"] = (
+        json.loads(run["final_metrics"]) if run["final_metrics"] else {}
+    )
+    return run
+
+
+def list_runs(model=None, limit=50, offset=0):
+    conn = _connect()
+    c = conn.cursor()
+    if model:
+        c.execute(
+            "SELECT * FROM training_runs WHERE model = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (model, limit, offset),
+        )
+    else:
+        c.execute(
+            "SELECT * FROM training_runs ORDER BY id DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+    runs = [_row_to_dict(row) for row in c.fetchall()]
+    conn.close()
+    return {"runs": runs}
+
+
+def compare_runs(run_ids):
+    conn = _connect()
+    c = conn.cursor()
+    placeholders = ",".join("?" for _ in run_ids)
+    c.execute(
+        f"SELECT * FROM training_runs WHERE id IN ({placeholders}) ORDER BY id",
+        list(run_ids),
+    )
+    runs = [_row_to_dict(row) for row in c.fetchall()]
+    conn.close()
+
+    # Config keys and metrics whose values differ between the runs.
+    config_keys = sorted({key for run in runs for key in run["config"]})
+    metric_keys = sorted({key for run in runs for key in run["final_metrics"]})
+    differing_config = {
+        key: [run["config"].get(key) for run in runs]
+        for key in config_keys
+        if len({json.dumps(run["config"].get(key)) for run in runs}) > 1
+    }
+    metrics = {
+        key: [run["final_metrics"].get(key) for run in runs] for key in metric_keys
+    }
+    for key in ("samples_per_second", "peak_memory_gb", "training_time"):
+        metrics[key] = [run[key] for run in runs]
+    return {
+        "run_ids": [run["id"] for run in runs],
+        "runs": runs,
+        "differing_config": differing_config,
+        "metrics": metrics,
+    }
+
+
+def load_runs_dataframe():
+    conn = _connect()
+    df = pd.read_sql_query("SELECT * FROM training_runs ORDER BY id", conn)
+    conn.close()
+    return df
+
+
+def export_legacy_log(path):
+    """Writes the registry in the old adapt_training_logs.xlsx layout."""
+    df = load_runs_dataframe()
+    if df.empty:
+        df = pd.DataFrame(columns=LEGACY_LOG_COLUMNS)
+    df = df[LEGACY_LOG_COLUMNS]
+    df.to_excel(path, index=False)
+    return path
+
+
+init_run_registry()
@@ -115,10 +115,15 @@ const FineTune: React.FC<FineTuneProps> = ({ selectedModel, setSelectedModel, to
 
     const eventSource = new EventSource(`${API_URL}/api/finetune/stream-status/${taskId}`);
 
+    // The server sends a full snapshot first and only changed keys after that.
+    let currentStatus: Record<string, any> = {};
+
     eventSource.onmessage = (event) => {
       const taskData = JSON.parse(event.data);
       if (taskData.type === "status_update") {
-        const taskStatus = taskData;
+        currentStatus = taskData.full ? taskData.data : { ...currentStatus, ...taskData.data };
+        (taskData.removed || []).forEach((key: string) => delete currentStatus[key]);
+        const taskStatus = { ...taskData, data: currentStatus };
 
         if (taskStatus) {
           setViewProgress(taskStatus.data.progress);
@@ -165,6 +170,8 @@ const FineTune: React.FC<FineTuneProps> = ({ selectedModel, setSelectedModel, to
     };
 
     eventSource.onerror = (error) => {
+      // The browser reconnects on its own and resumes from Last-Event-ID.
+      if (eventSource.readyState !== EventSource.CLOSED) return;
       console.error("SSE error:", error);
       eventSource.close();
       setLogs([